@@ -8,21 +8,36 @@ largest total movement.
 
 Usage example:
     python find_most_active_tracks.py --coords-root ../frames/pose_coords_yolo
+    python find_most_active_tracks.py --workers 8   # clips in parallel
 
 If ``--output`` is supplied, a combined CSV summarising the movement metrics for
 all clips is produced.
+
+New extractions can apply the same filter in-process
+(``PoseExtractor.process_clip(..., most_active_only=True)``), so this script is
+mainly a batch tool for re-filtering outputs that already exist on disk.
 """
 from __future__ import annotations
 
 import argparse
 import math
-from dataclasses import dataclass, field
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
 
+_PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+from pose_analysis.keypoint_store import binary_path_for, write_keypoint_store  # noqa: E402
+
 
 @dataclass
 class TrackStats:
@@ -31,55 +46,15 @@ class TrackStats:
     frames_seen: int = 0
     first_frame: Optional[str] = None
     last_frame: Optional[str] = None
-    last_keypoints: Optional[np.ndarray] = field(default=None, repr=False)
-
-    def update(self, frame_name: str, keypoints: np.ndarray) -> None:
-        """Update the cumulative stats with the keypoints from a new frame."""
-        if self.last_keypoints is not None and self.last_keypoints.shape == keypoints.shape:
-            displacement = _keypoint_displacement(self.last_keypoints, keypoints)
-            self.total_movement += displacement
-
-        self.last_keypoints = keypoints
-        self.frames_seen += 1
-        if self.first_frame is None:
-            self.first_frame = frame_name
-        self.last_frame = frame_name
-
-
-def _keypoint_displacement(prev: np.ndarray, curr: np.ndarray) -> float:
-    """Compute summed Euclidean displacement between two keypoint sets."""
-    if prev.size == 0 or curr.size == 0:
-        return 0.0
-
-    mask = np.isfinite(prev).all(axis=1) & np.isfinite(curr).all(axis=1)
-    if not np.any(mask):
-        return 0.0
-
-    deltas = curr[mask] - prev[mask]
-    distances = np.linalg.norm(deltas, axis=1)
-    return float(distances.sum())
-
-
-def _load_frame_tracks(frame_df: pd.DataFrame) -> Iterable[Tuple[int, str, np.ndarray]]:
-    """Yield (track_id, frame_name, keypoints) tuples for a single frame."""
-    if frame_df.empty:
-        return []
-
-    keypoint_columns = [col for col in frame_df.columns if col.startswith("kpt_")]
-    if not keypoint_columns:
-        return []
 
-    keypoint_columns.sort()
-    expected_pairs = len(keypoint_columns) // 2
-    frame_name = str(frame_df["frame_name"].iloc[0]) if "frame_name" in frame_df.columns else ""
 
-    records = []
-    for _, row in frame_df.iterrows():
-        track_id = int(row["track_id"]) if "track_id" in row else 0
-        coords = row[keypoint_columns].to_numpy(dtype=float)
-        keypoints = coords.reshape(expected_pairs, 2)
-        records.append((track_id, frame_name, keypoints))
-    return records
+def _keypoint_columns(columns: Iterable[str]) -> List[str]:
+    """Return ``kpt_*`` columns ordered as (x, y) pairs per joint."""
+    keypoint_columns = sorted(col for col in columns if col.startswith("kpt_"))
+    # x と y が揃っている関節だけを使う
+    joints = sorted({col[: -len("_x")] for col in keypoint_columns if col.endswith("_x")})
+    pairs = [joint for joint in joints if f"{joint}_y" in keypoint_columns]
+    return [f"{joint}_{axis}" for joint in pairs for axis in ("x", "y")]
 
 
 def _infer_frame_info(csv_path: Path, frame_df: pd.DataFrame) -> Tuple[int, str]:
@@ -93,30 +68,97 @@ def _infer_frame_info(csv_path: Path, frame_df: pd.DataFrame) -> Tuple[int, str]
     return frame_index, frame_name
 
 
-def process_clip(clip_dir: Path) -> List[TrackStats]:
-    """Aggregate movement metrics for every track in a clip directory."""
-    track_stats: Dict[int, TrackStats] = {}
-
-    frame_files = sorted(clip_dir.glob("*_coords.csv"))
-    frame_entries: List[Tuple[int, Path, pd.DataFrame, str]] = []
+def load_clip_frames(clip_dir: Path) -> pd.DataFrame:
+    """Read every ``*_coords.csv`` of a clip into one long-form table in frame order.
 
-    for csv_path in frame_files:
+    The returned frame has one row per (frame, track) with ``track_id``,
+    ``frame_name``, a ``frame_order`` column and the ``kpt_*`` columns.
+    """
+    frame_entries: List[Tuple[float, str, pd.DataFrame]] = []
+    for csv_path in sorted(clip_dir.glob("*_coords.csv")):
         try:
             frame_df = pd.read_csv(csv_path)
         except Exception as exc:  # pragma: no cover - defensive
             print(f"⚠️ Failed to read {csv_path}: {exc}")
             continue
-        frame_index, frame_name = _infer_frame_info(csv_path, frame_df)
-        frame_entries.append((frame_index, csv_path, frame_df, frame_name))
+        if frame_df.empty:
+            continue
+        frame_index, _ = _infer_frame_info(csv_path, frame_df)
+        frame_entries.append((frame_index, csv_path.name, frame_df))
+
+    if not frame_entries:
+        return pd.DataFrame(columns=["frame_order", "frame_name", "track_id"])
+
+    frame_entries.sort(key=lambda entry: (entry[0], entry[1]))
+    frames = []
+    for order, (_, file_name, frame_df) in enumerate(frame_entries):
+        frame_df = frame_df.assign(frame_order=order)
+        if "frame_name" not in frame_df.columns:
+            frame_df["frame_name"] = f"{Path(file_name).stem.replace('_coords', '')}.jpg"
+        if "track_id" not in frame_df.columns:
+            frame_df["track_id"] = 0
+        frames.append(frame_df)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def compute_track_stats(frames: pd.DataFrame) -> List[TrackStats]:
+    """Vectorised per-track movement totals for a long-form keypoint table.
+
+    Rows are ordered by ``frame_order`` (or their current order) within each
+    track; displacement between consecutive rows of the same track is summed
+    over joints whose coordinates are finite in both rows.
+    """
+    if frames.empty:
+        return []
 
-    frame_entries.sort(key=lambda entry: (entry[0], entry[1].name))
+    keypoint_columns = _keypoint_columns(frames.columns)
+    order_column = "frame_order" if "frame_order" in frames.columns else None
+    frames = frames.reset_index(drop=True)
+    if order_column is not None:
+        frames = frames.sort_values(order_column, kind="stable").reset_index(drop=True)
+
+    track_ids = frames["track_id"].to_numpy(dtype=int)
+    sort_idx = np.argsort(track_ids, kind="stable")
+    sorted_tracks = track_ids[sort_idx]
+
+    movement = np.zeros(len(frames))
+    if keypoint_columns and len(frames) > 1:
+        coords = frames[keypoint_columns].to_numpy(dtype=float)[sort_idx].reshape(len(frames), -1, 2)
+        deltas = np.linalg.norm(coords[1:] - coords[:-1], axis=2)
+        valid = np.isfinite(coords[1:]).all(axis=2) & np.isfinite(coords[:-1]).all(axis=2)
+        steps = np.where(valid, deltas, 0.0).sum(axis=1)
+        same_track = sorted_tracks[1:] == sorted_tracks[:-1]
+        movement[1:] = np.where(same_track, steps, 0.0)
+
+    frame_names = frames["frame_name"].astype(str).to_numpy()[sort_idx]
+    grouped = pd.DataFrame({"track_id": sorted_tracks, "movement": movement, "frame_name": frame_names}).groupby(
+        "track_id", sort=False
+    )
+    totals = grouped.agg(
+        total_movement=("movement", "sum"),
+        frames_seen=("movement", "size"),
+        first_frame=("frame_name", "first"),
+        last_frame=("frame_name", "last"),
+    )
 
-    for _, csv_path, frame_df, _ in frame_entries:
-        for track_id, frame_name, keypoints in _load_frame_tracks(frame_df):
-            stats = track_stats.setdefault(track_id, TrackStats(track_id=track_id))
-            stats.update(frame_name=frame_name, keypoints=keypoints)
+    # 元の実装と同じく、最初に登場した順にトラックを並べる
+    appearance = pd.unique(track_ids)
+    totals = totals.reindex(appearance)
+    return [
+        TrackStats(
+            track_id=int(track_id),
+            total_movement=float(row.total_movement),
+            frames_seen=int(row.frames_seen),
+            first_frame=row.first_frame,
+            last_frame=row.last_frame,
+        )
+        for track_id, row in zip(totals.index, totals.itertuples(index=False))
+    ]
 
-    return list(track_stats.values())
+
+def process_clip(clip_dir: Path) -> List[TrackStats]:
+    """Aggregate movement metrics for every track in a clip directory."""
+    return compute_track_stats(load_clip_frames(clip_dir))
 
 
 def _discover_clip_dirs(coords_root: Path) -> List[Path]:
@@ -167,16 +209,80 @@ def _clip_label(coords_root: Path, clip_dir: Path) -> str:
     return relative.as_posix()
 
 
+def summarise_clip(
+    coords_root: Path,
+    clip_dir: Path,
+    *,
+    filter_to_most_active: bool = True,
+    drop_keypoints: Optional[Sequence[int]] = None,
+) -> Tuple[List[str], List[Dict[str, object]]]:
+    """Process one clip directory and return ``(log_messages, summary_rows)``.
+
+    Messages are returned instead of printed so that parallel runs can report
+    them in clip order.
+    """
+    clip_name = _clip_label(coords_root, clip_dir)
+    clip_stats = process_clip(clip_dir)
+    if not clip_stats:
+        return [f"⚠️ {clip_name}: no tracks detected"], []
+
+    most_active = max(clip_stats, key=lambda s: s.total_movement)
+    messages = [
+        f"🏃 {clip_name}: track {most_active.track_id} moved the most "
+        f"({most_active.total_movement:.2f} px across {most_active.frames_seen} frames)"
+    ]
+
+    if filter_to_most_active or drop_keypoints:
+        total_files, modified_files = rewrite_clip_frames(
+            clip_dir,
+            target_track_id=most_active.track_id if filter_to_most_active else None,
+            drop_keypoints=drop_keypoints,
+        )
+
+        _rewrite_pose_tracks(
+            coords_root,
+            clip_dir,
+            target_track_id=most_active.track_id if filter_to_most_active else None,
+            drop_keypoints=drop_keypoints,
+        )
+
+        if modified_files:
+            actions = []
+            if filter_to_most_active:
+                actions.append(f"kept only track {most_active.track_id}")
+            if drop_keypoints:
+                dropped = ", ".join(str(idx) for idx in drop_keypoints)
+                actions.append(f"dropped keypoints [{dropped}]")
+            action_text = " and ".join(actions) if actions else "updated"
+            messages.append(f"✂️ {clip_name}: {action_text} in {modified_files}/{total_files} frame CSVs")
+
+    rows = [
+        {
+            "clip": clip_name,
+            "track_id": stats.track_id,
+            "total_movement": stats.total_movement,
+            "frames_seen": stats.frames_seen,
+            "first_frame": stats.first_frame,
+            "last_frame": stats.last_frame,
+        }
+        for stats in clip_stats
+    ]
+    return messages, rows
+
+
 def summarise_clips(
     coords_root: Path,
     *,
     filter_to_most_active: bool = True,
     drop_keypoints: Optional[Sequence[int]] = None,
+    workers: int = 1,
 ) -> List[Dict[str, object]]:
     """Process clips under the given root and return summary rows.
 
     If ``filter_to_most_active`` is True, each per-frame CSV is rewritten so that
-    it only retains rows for the most active track.
+    it only retains rows for the most active track. With ``workers > 1`` clips
+    are processed in a process pool; rows and log lines are still emitted in
+    clip order, so the output is identical to a sequential run.
     """
     summaries: List[Dict[str, object]] = []
 
@@ -185,54 +291,28 @@ def summarise_clips(
         print(f"⚠️ No clip directories found under {coords_root}")
         return summaries
 
-    for clip_dir in clip_dirs:
-        clip_stats = process_clip(clip_dir)
-        if not clip_stats:
-            print(f"⚠️ {_clip_label(coords_root, clip_dir)}: no tracks detected")
-            continue
-
-        most_active = max(clip_stats, key=lambda s: s.total_movement)
-        print(
-            f"🏃 {_clip_label(coords_root, clip_dir)}: track {most_active.track_id} moved the most "
-            f"({most_active.total_movement:.2f} px across {most_active.frames_seen} frames)"
-        )
+    task = partial(
+        summarise_clip,
+        coords_root,
+        filter_to_most_active=filter_to_most_active,
+        drop_keypoints=list(drop_keypoints) if drop_keypoints else None,
+    )
 
-        if filter_to_most_active or drop_keypoints:
-            total_files, modified_files = rewrite_clip_frames(
-                clip_dir,
-                target_track_id=most_active.track_id if filter_to_most_active else None,
-                drop_keypoints=drop_keypoints,
-            )
-
-            _rewrite_pose_tracks(
-                coords_root,
-                clip_dir,
-                target_track_id=most_active.track_id if filter_to_most_active else None,
-                drop_keypoints=drop_keypoints,
-            )
-
-            if modified_files:
-                actions = []
-                if filter_to_most_active:
-                    actions.append(f"kept only track {most_active.track_id}")
-                if drop_keypoints:
-                    dropped = ", ".join(str(idx) for idx in drop_keypoints)
-                    actions.append(f"dropped keypoints [{dropped}]")
-                action_text = " and ".join(actions) if actions else "updated"
-                clip_name = _clip_label(coords_root, clip_dir)
-                print(f"✂️ {clip_name}: {action_text} in {modified_files}/{total_files} frame CSVs")
-
-        for stats in clip_stats:
-            summaries.append(
-                {
-                    "clip": _clip_label(coords_root, clip_dir),
-                    "track_id": stats.track_id,
-                    "total_movement": stats.total_movement,
-                    "frames_seen": stats.frames_seen,
-                    "first_frame": stats.first_frame,
-                    "last_frame": stats.last_frame,
-                }
-            )
+    if workers > 1 and len(clip_dirs) > 1:
+        # クリップ同士は独立しているのでプロセスプールで並列化（map は入力順に結果を返す）
+        chunksize = max(1, len(clip_dirs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(clip_dirs))) as executor:
+            results = executor.map(task, clip_dirs, chunksize=chunksize)
+            for messages, rows in results:
+                for message in messages:
+                    print(message)
+                summaries.extend(rows)
+    else:
+        for clip_dir in clip_dirs:
+            messages, rows = task(clip_dir)
+            for message in messages:
+                print(message)
+            summaries.extend(rows)
 
     return summaries
 
@@ -344,6 +424,9 @@ def _rewrite_pose_tracks(
 
         if modified:
             df.to_csv(keypoints_path, index=False)
+            # バイナリストアがあれば同じ内容に更新する（古いままだと load_keypoints は CSV を使う）
+            if binary_path_for(keypoints_path).exists():
+                write_keypoint_store(df, keypoints_path)
 
     summary_path = track_dir / "movement_summary.csv"
     if summary_path.exists() and target_track_id is not None:
@@ -353,6 +436,7 @@ def _rewrite_pose_tracks(
             if not filtered.equals(summary_df):
                 filtered.to_csv(summary_path, index=False)
 
+
 def _resolve_coords_root(path_arg: Optional[Path]) -> Path:
     """Resolve the coords root relative to the script location if needed."""
     script_dir = Path(__file__).resolve().parent
@@ -387,6 +471,12 @@ def parse_args() -> argparse.Namespace:
         nargs="*",
         help="Keypoint indices to remove (e.g. 0 1 2 3 4)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (0 = one per CPU core)",
+    )
     parser.add_argument(
         "--output",
         type=Path,
@@ -406,6 +496,7 @@ def main() -> None:
         coords_root,
         filter_to_most_active=not args.keep_all_tracks,
         drop_keypoints=args.drop_keypoints,
+        workers=args.workers if args.workers > 0 else (os.cpu_count() or 1),
     )
 
     if args.output and summaries:
@@ -0,0 +1,472 @@
+"""Importable YOLO pose extraction with multi-person track assignment.
+
+Importing this module has no side effects: the YOLO model is only loaded when a
+:class:`PoseExtractor` is created, and directories are only created when output
+locations are passed explicitly. Keep one extractor alive to reuse the warm
+model across clips.
+
+Usage example:
+    extractor = PoseExtractor("/tmp/yolo11n-pose.pt")
+    result = extractor.process_clip("frames/Cleaned_Data/players/User/clip_1")
+    write_clip_outputs(result, "pose_tracks/players/User/clip_1")
+
+    # 動画を直接デコードしてフレームごとに結果を受け取る（JPEG/CSV の往復なし）
+    for frame in extractor.stream("uploads/serve.mp4"):
+        print(frame.frame_name, len(frame.rows))
+"""
+from __future__ import annotations
+
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from tracker import PoseTracker
+
+# pose_analysis（バイナリのキーポイントストア）をインポートできるようにプロジェクトルートを追加
+_PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+from pose_analysis.keypoint_store import write_keypoint_store  # noqa: E402
+
+# トラッキング設定
+TRACK_DISTANCE_THRESHOLD = 150.0  # キーポイント中心同士がこの距離以内なら同一人物とみなす
+MAX_MISSED_FRAMES = 30            # 連続で見失ったフレーム数の上限
+
+# バッチ推論設定（1回の推論にまとめるフレーム数。1 で従来どおり1枚ずつ推論）
+DEFAULT_BATCH_SIZE = 16
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".m4v", ".webm")
+BASE_COLUMNS = ["frame_index", "frame_name", "track_id"]
+
+# 動画を直接入力したときのリサンプリング設定（ffmpeg 抽出と同じ 30fps × 48 フレーム）
+DEFAULT_VIDEO_FPS = 30.0
+DEFAULT_VIDEO_FRAMES = 48
+
+FrameSource = Union[str, Path, Sequence[Union[str, Path]]]
+
+
+def default_model_path() -> str:
+    """Model location from ``YOLO_MODEL_PATH``, falling back to ``/tmp``."""
+    return os.environ.get("YOLO_MODEL_PATH", "/tmp/yolo11n-pose.pt")
+
+
+def default_batch_size() -> int:
+    """Batch size from ``YOLO_BATCH_SIZE``, falling back to :data:`DEFAULT_BATCH_SIZE`."""
+    return max(1, int(os.environ.get("YOLO_BATCH_SIZE", str(DEFAULT_BATCH_SIZE))))
+
+
+def configure_runtime_env() -> None:
+    """Point Ultralytics caches and temp files at ``/tmp`` unless already set."""
+    # 書き込み不可環境対策: キャッシュや一時ファイルの保存先を /tmp に固定（未設定時）
+    os.environ.setdefault("ULTRALYTICS_CACHE_DIR", "/tmp")
+    os.environ.setdefault("TMPDIR", "/tmp")
+    os.environ.setdefault("HOME", "/tmp")
+
+
+def list_frame_images(clip_dir: Union[str, Path]) -> List[str]:
+    """Return the sorted image paths directly inside ``clip_dir``."""
+    clip_dir = str(clip_dir)
+    return [
+        os.path.join(clip_dir, f)
+        for f in sorted(os.listdir(clip_dir))
+        if f.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(clip_dir, f))
+    ]
+
+
+def gather_frame_groups(base_dir: Union[str, Path], excluded_dirs: Iterable[str] = ()) -> List[Tuple[str, List[str]]]:
+    """フレーム画像のサブフォルダをまとめて取得する"""
+    excluded = {os.path.abspath(path) for path in excluded_dirs}
+    groups = []
+    for root, dirs, files in os.walk(base_dir):
+        # 生成した出力ディレクトリを探索対象から除外
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in excluded]
+
+        image_files = sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not image_files:
+            continue
+        groups.append((root, [os.path.join(root, f) for f in image_files]))
+
+    groups.sort(key=lambda item: item[0])
+    return groups
+
+
+def flatten_keypoints_row(frame_index: int, frame_name: str, track_id: int, keypoints: np.ndarray) -> Dict[str, object]:
+    row = {"frame_index": frame_index, "frame_name": frame_name, "track_id": track_id}
+    # kpt_0 ～ kpt_4 は出力しない
+    for idx, (x, y) in enumerate(keypoints):
+        if idx < 5:
+            continue
+        row[f"kpt_{idx}_x"] = float(x)
+        row[f"kpt_{idx}_y"] = float(y)
+    return row
+
+
+def order_keypoint_columns(clip_df: pd.DataFrame) -> pd.DataFrame:
+    """Reorder columns to ``frame_index, frame_name, track_id, kpt_5_x ... kpt_16_y``."""
+    # kpt列は kpt_5 → kpt_16（各 _x, _y）の順にソートして出力
+    ordered_kpt_cols = []
+    for idx in range(5, 17):
+        x_col = f"kpt_{idx}_x"
+        y_col = f"kpt_{idx}_y"
+        if x_col in clip_df.columns:
+            ordered_kpt_cols.append(x_col)
+        if y_col in clip_df.columns:
+            ordered_kpt_cols.append(y_col)
+    return clip_df.reindex(columns=BASE_COLUMNS + ordered_kpt_cols)
+
+
+def iter_image_frames(image_paths: Sequence[Union[str, Path]]) -> Iterator[Tuple[int, str, np.ndarray]]:
+    """画像ファイルを順に読み込み、(frame_index, frame_name, image) を返す"""
+    import cv2
+
+    for frame_index, image_path in enumerate(image_paths):
+        frame_name = os.path.basename(str(image_path))
+        image = cv2.imread(str(image_path))
+        if image is None:
+            print(f"❌ 画像を読み込めませんでした: {frame_name}")
+            continue
+        yield frame_index, frame_name, image
+
+
+def iter_video_frames(
+    video_path: Union[str, Path],
+    fps: Optional[float] = DEFAULT_VIDEO_FPS,
+    max_frames: Optional[int] = DEFAULT_VIDEO_FRAMES,
+) -> Iterator[Tuple[int, str, np.ndarray]]:
+    """Decode a video in-process and yield ``(frame_index, frame_name, image)``.
+
+    Frames are resampled to ``fps`` by picking the nearest source frame (like
+    ffmpeg's ``fps`` filter) and named ``0001.jpg``, ``0002.jpg``, ... to match
+    the frames written by ``run_yolo_single.extract_frames_ffmpeg``.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Could not open video: {video_path}")
+
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    step = source_fps / fps if fps and source_fps > 0 else 1.0
+    out_index = 0
+    source_index = 0
+    try:
+        while max_frames is None or out_index < max_frames:
+            ok, image = capture.read()
+            if not ok:
+                break
+            # 出力フレーム k は時刻 k/fps に最も近い元フレームを使う（fps が元より高ければ複製）
+            while (max_frames is None or out_index < max_frames) and int(round(out_index * step)) <= source_index:
+                yield out_index, f"{out_index + 1:04d}.jpg", image
+                out_index += 1
+            source_index += 1
+    finally:
+        capture.release()
+
+
+def iter_frames(
+    frames: FrameSource,
+    fps: Optional[float] = DEFAULT_VIDEO_FPS,
+    max_frames: Optional[int] = DEFAULT_VIDEO_FRAMES,
+) -> Iterator[Tuple[int, str, np.ndarray]]:
+    """Yield decoded frames from a video file, a frame directory or a list of image paths."""
+    if isinstance(frames, (str, Path)):
+        path = Path(frames)
+        if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS:
+            return iter_video_frames(path, fps=fps, max_frames=max_frames)
+        return iter_image_frames(list_frame_images(path))
+    return iter_image_frames(list(frames))
+
+
+def batched(frames: Iterable[Tuple[int, str, np.ndarray]], batch_size: int) -> Iterator[List[Tuple[int, str, np.ndarray]]]:
+    """フレームを batch_size 枚ずつのリストにまとめて順に返す"""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass
+class FrameKeypoints:
+    """Tracked keypoint rows produced for a single frame."""
+
+    frame_index: int
+    frame_name: str
+    rows: List[Dict[str, object]]
+
+
+@dataclass
+class TrackingState:
+    """Per-clip tracker and counters shared across the frames of one stream."""
+
+    tracker: Optional[PoseTracker] = None
+    keypoint_count: Optional[int] = None
+    frame_count: int = 0
+
+    def summary(self) -> pd.DataFrame:
+        if self.tracker is None:
+            return pd.DataFrame()
+        return self.tracker.summary()
+
+
+@dataclass
+class ClipResult:
+    """Keypoints and per-track movement summary produced for one clip."""
+
+    keypoints: pd.DataFrame
+    summary: pd.DataFrame
+    frame_count: int
+    frame_names: List[str] = field(default_factory=list)
+
+    @property
+    def most_active_track_id(self) -> Optional[int]:
+        if self.summary.empty:
+            return None
+        row = self.summary.loc[self.summary["total_movement"].idxmax()]
+        return int(row["track_id"])
+
+    def only_track(self, track_id: Optional[int]) -> "ClipResult":
+        """Return a copy restricted to ``track_id`` (unchanged when ``None``)."""
+        if track_id is None:
+            return self
+        keypoints = self.keypoints[self.keypoints["track_id"] == track_id].reset_index(drop=True)
+        summary = self.summary[self.summary["track_id"] == track_id].reset_index(drop=True)
+        return ClipResult(keypoints=keypoints, summary=summary, frame_count=self.frame_count, frame_names=self.frame_names)
+
+
+class PoseExtractor:
+    """Run YOLO pose estimation and track assignment over the frames of a clip.
+
+    The model is loaded once in the constructor and reused by every
+    :meth:`process_clip` / :meth:`stream` call.
+    """
+
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        *,
+        batch_size: Optional[int] = None,
+        track_distance_threshold: float = TRACK_DISTANCE_THRESHOLD,
+        max_missed_frames: int = MAX_MISSED_FRAMES,
+        track_metric: str = "center",
+    ) -> None:
+        configure_runtime_env()
+        from ultralytics import YOLO
+
+        self.model_path = model_path or default_model_path()
+        self.batch_size = max(1, int(batch_size)) if batch_size else default_batch_size()
+        self.track_distance_threshold = track_distance_threshold
+        self.max_missed_frames = max_missed_frames
+        self.track_metric = track_metric
+        self.model = YOLO(self.model_path)
+
+    def new_tracker(self) -> PoseTracker:
+        return PoseTracker(
+            self.track_distance_threshold,
+            self.max_missed_frames,
+            metric=self.track_metric,
+        )
+
+    def stream(
+        self,
+        frames: FrameSource,
+        *,
+        state: Optional[TrackingState] = None,
+        coords_dir: Optional[Union[str, Path]] = None,
+        viz_dir: Optional[Union[str, Path]] = None,
+        frames_dir: Optional[Union[str, Path]] = None,
+        clip_display: str = "clip",
+        fps: Optional[float] = DEFAULT_VIDEO_FPS,
+        max_frames: Optional[int] = DEFAULT_VIDEO_FRAMES,
+    ) -> Iterator[FrameKeypoints]:
+        """Push frames through pose inference and tracking, yielding one result per frame.
+
+        ``frames`` may be a video file (decoded in-process), a frame directory or
+        a list of image paths. Pass a :class:`TrackingState` to read the track
+        summary once the generator is exhausted. ``coords_dir``, ``viz_dir`` and
+        ``frames_dir`` enable the optional per-frame CSV, annotated image and raw
+        JPEG side outputs.
+        """
+        import cv2
+
+        state = state if state is not None else TrackingState()
+        if state.tracker is None:
+            state.tracker = self.new_tracker()
+        for path in (coords_dir, viz_dir, frames_dir):
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+
+        # batch_size 枚ずつまとめて推論し、結果はフレーム順にトラッキングへ渡す
+        for batch in batched(iter_frames(frames, fps=fps, max_frames=max_frames), self.batch_size):
+            results = self.model([image for _, _, image in batch])
+            for (frame_index, frame_name, image), result in zip(batch, results):
+                state.frame_count += 1
+                annotated_image = result.plot() if viz_dir is not None else None
+
+                keypoints_tensor = result.keypoints
+                if keypoints_tensor is None:
+                    keypoints_array = np.empty((0, 0, 2))
+                else:
+                    keypoints_array = keypoints_tensor.xy.cpu().numpy()
+
+                boxes_tensor = result.boxes
+                boxes_array = boxes_tensor.xyxy.cpu().numpy() if boxes_tensor is not None else np.empty((0, 4))
+
+                num_people = keypoints_array.shape[0]
+                frame_rows = []
+
+                if num_people > 0 and state.keypoint_count is None:
+                    state.keypoint_count = keypoints_array.shape[1]
+                track_ids = state.tracker.update(keypoints_array, frame_name)
+
+                for det_idx, track_id in enumerate(track_ids):
+                    frame_rows.append(flatten_keypoints_row(frame_index, frame_name, int(track_id), keypoints_array[det_idx]))
+
+                    if annotated_image is not None and det_idx < boxes_array.shape[0]:
+                        x1, y1, x2, y2 = boxes_array[det_idx]
+                        label_position = (int(x1), int(max(0, y1 - 10)))
+                        cv2.putText(
+                            annotated_image,
+                            f"ID {track_id}",
+                            label_position,
+                            cv2.FONT_HERSHEY_SIMPLEX,
+                            0.6,
+                            (0, 255, 0),
+                            2,
+                            cv2.LINE_AA,
+                        )
+
+                frame_base = os.path.splitext(frame_name)[0]
+                if coords_dir is not None:
+                    if frame_rows:
+                        frame_df = pd.DataFrame(frame_rows)
+                    else:
+                        base_columns = list(BASE_COLUMNS)
+                        if state.keypoint_count is not None:
+                            for idx in range(state.keypoint_count):
+                                base_columns.extend([f"kpt_{idx}_x", f"kpt_{idx}_y"])
+                        frame_df = pd.DataFrame(columns=base_columns)
+                    frame_df.to_csv(os.path.join(coords_dir, f"{frame_base}_coords.csv"), index=False)
+                if annotated_image is not None:
+                    cv2.imwrite(os.path.join(viz_dir, f"{frame_base}_pose_visualized.jpg"), annotated_image)
+                if frames_dir is not None:
+                    cv2.imwrite(os.path.join(frames_dir, frame_name), image)
+                print(f"✅ {clip_display}/{frame_name}: 座標抽出完了")
+
+                yield FrameKeypoints(frame_index=frame_index, frame_name=frame_name, rows=frame_rows)
+
+    def process_clip(
+        self,
+        frames: FrameSource,
+        *,
+        coords_dir: Optional[Union[str, Path]] = None,
+        viz_dir: Optional[Union[str, Path]] = None,
+        frames_dir: Optional[Union[str, Path]] = None,
+        clip_display: Optional[str] = None,
+        fps: Optional[float] = DEFAULT_VIDEO_FPS,
+        max_frames: Optional[int] = DEFAULT_VIDEO_FRAMES,
+        most_active_only: bool = False,
+    ) -> ClipResult:
+        """Extract tracked keypoints for a whole clip and collect them into DataFrames.
+
+        ``frames`` is a video file, a directory of frame images or an ordered
+        list of image paths. See :meth:`stream` for the optional side outputs.
+        With ``most_active_only`` the result is restricted to the track with the
+        largest total movement (what ``find_most_active_tracks.py`` does after
+        the fact), and per-frame CSVs are written once, already filtered.
+        """
+        if clip_display is None:
+            clip_display = Path(frames).stem if isinstance(frames, (str, Path)) else "clip"
+
+        state = TrackingState()
+        clip_records: List[Dict[str, object]] = []
+        frame_names: List[str] = []
+        for frame in self.stream(
+            frames,
+            state=state,
+            # 絞り込み後にまとめて書き出すため、ストリーム中は1フレームCSVを書かない
+            coords_dir=None if most_active_only else coords_dir,
+            viz_dir=viz_dir,
+            frames_dir=frames_dir,
+            clip_display=clip_display,
+            fps=fps,
+            max_frames=max_frames,
+        ):
+            clip_records.extend(frame.rows)
+            frame_names.append(frame.frame_name)
+
+        if clip_records:
+            clip_df = order_keypoint_columns(pd.DataFrame(clip_records))
+        else:
+            clip_df = pd.DataFrame(columns=BASE_COLUMNS)
+
+        result = ClipResult(
+            keypoints=clip_df,
+            summary=state.summary(),
+            frame_count=state.frame_count,
+            frame_names=frame_names,
+        )
+        if most_active_only:
+            result = result.only_track(result.most_active_track_id)
+            if coords_dir is not None:
+                write_frame_csvs(result, coords_dir)
+        return result
+
+
+def write_frame_csvs(result: ClipResult, coords_dir: Union[str, Path]) -> int:
+    """Write one ``<frame>_coords.csv`` per frame of ``result`` and return the file count.
+
+    Frames without rows get a header-only CSV, matching what :meth:`PoseExtractor.stream` writes.
+    """
+    os.makedirs(coords_dir, exist_ok=True)
+    keypoints = result.keypoints
+    frame_groups = {name: group for name, group in keypoints.groupby("frame_name", sort=False)} if not keypoints.empty else {}
+    frame_names = result.frame_names or list(frame_groups)
+    for frame_name in frame_names:
+        frame_df = frame_groups.get(frame_name, keypoints.iloc[0:0])
+        frame_base = os.path.splitext(str(frame_name))[0]
+        frame_df.to_csv(os.path.join(coords_dir, f"{frame_base}_coords.csv"), index=False)
+    return len(frame_names)
+
+
+def write_clip_outputs(
+    result: ClipResult,
+    tracks_output_dir: Union[str, Path],
+    clip_display: str = "",
+    *,
+    write_binary: bool = True,
+) -> None:
+    """Write ``keypoints_with_tracks.csv`` and ``movement_summary.csv`` for a clip.
+
+    With ``write_binary`` the keypoints are also saved as ``keypoints_with_tracks.npz``
+    (see :mod:`pose_analysis.keypoint_store`), which the Python consumers load first.
+    """
+    clip_display = clip_display or os.path.basename(os.path.normpath(str(tracks_output_dir)))
+    os.makedirs(tracks_output_dir, exist_ok=True)
+
+    if not result.keypoints.empty:
+        csv_path = os.path.join(tracks_output_dir, "keypoints_with_tracks.csv")
+        result.keypoints.to_csv(csv_path, index=False)
+        # CSV より後に書くことで mtime が新しくなり、load_keypoints がバイナリを選ぶ
+        if write_binary:
+            write_keypoint_store(result.keypoints, csv_path)
+
+    if result.summary.empty:
+        print(f"⚠️ {clip_display}: キーポイントを取得できませんでした。")
+        return
+
+    result.summary.to_csv(os.path.join(tracks_output_dir, "movement_summary.csv"), index=False)
+    most_active = result.summary.loc[result.summary["total_movement"].idxmax()]
+    print(
+        f"🏃 {clip_display}: ID {int(most_active['track_id'])} が最も動いています (総移動量 {most_active['total_movement']:.2f})"
+    )
@@ -0,0 +1,131 @@
+"""Render pose visualisations on demand from stored keypoints.
+
+Extraction no longer has to annotate and JPEG-encode every frame: this script
+draws the skeleton and track IDs afterwards, only for the clip and frame range
+that is actually requested.
+
+Usage example:
+    python render_visualization.py \
+        --frames-dir ../frames/Cleaned_Data/players/User/clip_1 \
+        --keypoints ../pose_tracks/players/User/clip_1/keypoints_with_tracks.csv \
+        --output-dir ../frames/pose_visualization/players/User/clip_1 \
+        --start 15 --end 30
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# COCO キーポイントの骨格（kpt_5 以降のみ出力しているため顔の点は含めない）
+SKELETON_EDGES: Tuple[Tuple[int, int], ...] = (
+    (5, 6), (5, 7), (7, 9), (6, 8), (8, 10),
+    (5, 11), (6, 12), (11, 12),
+    (11, 13), (13, 15), (12, 14), (14, 16),
+)
+_KPT_COLUMN = re.compile(r"kpt_(\d+)_([xy])$")
+
+
+def _keypoint_columns(df: pd.DataFrame) -> List[int]:
+    ids = set()
+    for col in df.columns:
+        match = _KPT_COLUMN.match(col)
+        if match:
+            ids.add(int(match.group(1)))
+    return sorted(ids)
+
+
+def draw_pose(image: np.ndarray, frame_df: pd.DataFrame) -> np.ndarray:
+    """Draw skeleton, joints and track IDs for every row of ``frame_df`` onto a copy of ``image``."""
+    import cv2
+
+    annotated = image.copy()
+    joint_ids = _keypoint_columns(frame_df)
+    for _, row in frame_df.iterrows():
+        points = {}
+        for joint_id in joint_ids:
+            x, y = row[f"kpt_{joint_id}_x"], row[f"kpt_{joint_id}_y"]
+            # YOLO は未検出の点を (0, 0) で返す
+            if np.isfinite(x) and np.isfinite(y) and (x > 0 or y > 0):
+                points[joint_id] = (int(round(x)), int(round(y)))
+
+        for a, b in SKELETON_EDGES:
+            if a in points and b in points:
+                cv2.line(annotated, points[a], points[b], (255, 128, 0), 2, cv2.LINE_AA)
+        for point in points.values():
+            cv2.circle(annotated, point, 4, (0, 0, 255), -1, cv2.LINE_AA)
+
+        if points and "track_id" in row:
+            xs = [p[0] for p in points.values()]
+            ys = [p[1] for p in points.values()]
+            cv2.putText(
+                annotated,
+                f"ID {int(row['track_id'])}",
+                (min(xs), max(0, min(ys) - 10)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                (0, 255, 0),
+                2,
+                cv2.LINE_AA,
+            )
+    return annotated
+
+
+def render_clip_visualization(
+    frames_dir: Union[str, Path],
+    keypoints: Union[str, Path, pd.DataFrame],
+    output_dir: Union[str, Path],
+    frame_range: Optional[Tuple[int, int]] = None,
+) -> List[Path]:
+    """Write ``*_pose_visualized.jpg`` for the frames in ``frame_range`` (inclusive).
+
+    Returns the written image paths. Frames without a source image are skipped.
+    """
+    import cv2
+
+    df = keypoints if isinstance(keypoints, pd.DataFrame) else pd.read_csv(keypoints)
+    if frame_range is not None and "frame_index" in df.columns:
+        start, end = frame_range
+        df = df[(df["frame_index"] >= start) & (df["frame_index"] <= end)]
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written: List[Path] = []
+    for frame_name, frame_df in df.groupby("frame_name", sort=True):
+        image_path = Path(frames_dir) / str(frame_name)
+        image = cv2.imread(str(image_path))
+        if image is None:
+            print(f"⚠️ Frame image not found: {image_path}")
+            continue
+        out_path = output_dir / f"{os.path.splitext(str(frame_name))[0]}_pose_visualized.jpg"
+        cv2.imwrite(str(out_path), draw_pose(image, frame_df))
+        written.append(out_path)
+    return written
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render pose visualisations from keypoints_with_tracks.csv")
+    parser.add_argument("--frames-dir", type=Path, required=True, help="Directory containing the clip's frame images")
+    parser.add_argument("--keypoints", type=Path, required=True, help="keypoints_with_tracks.csv (or per-frame CSV)")
+    parser.add_argument("--output-dir", type=Path, required=True, help="Where to write *_pose_visualized.jpg")
+    parser.add_argument("--start", type=int, default=None, help="First frame_index to render")
+    parser.add_argument("--end", type=int, default=None, help="Last frame_index to render (inclusive)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    frame_range = None
+    if args.start is not None or args.end is not None:
+        frame_range = (args.start if args.start is not None else 0, args.end if args.end is not None else 10**9)
+    written = render_clip_visualization(args.frames_dir, args.keypoints, args.output_dir, frame_range)
+    print(f"🖼️ {len(written)} frames rendered to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 import argparse
 import os
-import shutil
 import subprocess
-import sys
 from pathlib import Path
 
+from pose_extractor import PoseExtractor, default_model_path, write_clip_outputs
+
 
 def run(cmd: list[str], env: dict | None = None, cwd: str | None = None):
     print("$", " ".join(cmd))
@@ -34,111 +34,78 @@ def extract_frames_ffmpeg(video: Path, out_dir: Path, fps: int = 30, frames: int
     run(cmd)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Run YOLO keypoint extraction for a single clip")
-    parser.add_argument("--clip-name", required=True, help="Clip name directory under frames/Cleaned_Data/players/<player>/")
-    parser.add_argument("--player", default="User", help="Player folder name (default: User)")
-    parser.add_argument("--video", help="Optional: input mp4 to first extract 48 frames at 30fps")
-    parser.add_argument("--run-active-track", action="store_true", help="Run find_most_active_tracks.py after YOLO")
-    args = parser.parse_args()
-
+def process_single_clip(
+    clip_name: str,
+    player: str = "User",
+    video: str | None = None,
+    run_active_track: bool = False,
+    extractor: PoseExtractor | None = None,
+    stream: bool = False,
+    save_frames: bool = False,
+    save_frame_csvs: bool = False,
+    visualize: bool = False,
+) -> int:
+    """Extract keypoints for one clip in-process.
+
+    Pass a long-lived ``extractor`` to reuse an already loaded YOLO model.
+    With ``stream`` the video is decoded in-process and only
+    ``keypoints_with_tracks.csv``/``movement_summary.csv`` are written unless
+    the ``save_frames``/``save_frame_csvs`` side outputs are requested.
+    Annotated images are only written with ``visualize``; the serving path
+    never reads them (see render_visualization.py for on-demand rendering).
+    """
     script_dir = Path(__file__).resolve().parent
     project_root = script_dir.parent
     frames_root = project_root / "frames"
-    target_frames_dir = frames_root / "Cleaned_Data" / "players" / args.player / args.clip_name
-
-    if args.video:
-        video = Path(args.video).resolve()
-        print(f"[info] Extracting frames from video: {video}")
-        extract_frames_ffmpeg(video, target_frames_dir, fps=30, frames=48)
-
-    if not target_frames_dir.exists() or not any(target_frames_dir.glob("*.jpg")):
-        print(f"[error] No frames found in {target_frames_dir}")
+    target_frames_dir = frames_root / "Cleaned_Data" / "players" / player / clip_name
+    # 出力先は YOLO.py と同じく Cleaned_Data を除いた players/<player>/<clip>
+    clip_relative = Path("players") / player / clip_name
+
+    if stream:
+        if not video:
+            print("[error] --stream requires --video")
+            return 2
+        frames_source = Path(video).resolve()
+        if not frames_source.exists():
+            print(f"[error] Video not found: {frames_source}")
+            return 2
+        coords_dir = frames_root / "pose_coords_yolo" / clip_relative if save_frame_csvs else None
+        frames_dir = target_frames_dir if save_frames else None
+    else:
+        if video:
+            video_path = Path(video).resolve()
+            print(f"[info] Extracting frames from video: {video_path}")
+            extract_frames_ffmpeg(video_path, target_frames_dir, fps=30, frames=48)
+
+        if not target_frames_dir.exists() or not any(target_frames_dir.glob("*.jpg")):
+            print(f"[error] No frames found in {target_frames_dir}")
+            return 2
+        frames_source = target_frames_dir
+        coords_dir = frames_root / "pose_coords_yolo" / clip_relative
+        frames_dir = None
+    viz_dir = frames_root / "pose_visualization" / clip_relative if visualize else None
+
+    if extractor is None:
+        os.environ.setdefault("YOLO_MODEL_PATH", str(project_root / "yolo11n-pose.pt"))
+        extractor = PoseExtractor(default_model_path())
+
+    print(f"[info] Run pose extraction for target clip only ({'stream' if stream else 'frames'})")
+    result = extractor.process_clip(
+        frames_source,
+        coords_dir=coords_dir,
+        viz_dir=viz_dir,
+        frames_dir=frames_dir,
+        clip_display=clip_relative.as_posix(),
+        fps=30,
+        max_frames=48,
+        # 最も動いたトラックへの絞り込みは抽出と同じプロセス内で行い、出力は一度だけ書く
+        most_active_only=run_active_track,
+    )
+    if result.frame_count == 0:
+        print(f"[error] No frames decoded from {frames_source}")
         return 2
 
-    # Prepare source dir for copy BEFORE backup
-    source_dir_for_copy = target_frames_dir
-
-    # Backup existing frames and scope to target only
-    frames_backup = project_root / "frames_all"
-    if not frames_backup.exists() and frames_root.exists():
-        print(f"[info] Backup frames -> {frames_backup}")
-        frames_root.rename(frames_backup)
-    # If we just backed up, target_frames_dir moved under frames_all. Adjust source accordingly.
-    if not source_dir_for_copy.exists():
-        maybe = frames_backup / "Cleaned_Data" / "players" / args.player / args.clip_name
-        if maybe.exists():
-            source_dir_for_copy = maybe
-    ensure_dir(frames_root)
-
-    # Recreate the minimal structure and copy target dir under new frames
-    minimal_parent = frames_root / "Cleaned_Data" / "players" / args.player
-    ensure_dir(minimal_parent)
-    temp_target = minimal_parent / args.clip_name
-    if not temp_target.exists():
-        print(f"[info] Copy target frames -> {temp_target}")
-        shutil.copytree(source_dir_for_copy, temp_target)
-
-    # Run YOLO.py with envs
-    env = os.environ.copy()
-    env.setdefault("ULTRALYTICS_CACHE_DIR", "/tmp")
-    env.setdefault("TMPDIR", "/tmp")
-    env.setdefault("HOME", "/tmp")
-    env.setdefault("YOLO_MODEL_PATH", str(project_root / "yolo11n-pose.pt"))
-    print("[info] Run YOLO.py for target clip only")
-    run([sys.executable, str(project_root / "22_Joint_Detection_YOLO/YOLO.py")], env=env, cwd=str(project_root / "22_Joint_Detection_YOLO"))
-
-    # Move produced coords/vis back into main frames directory
-    produced_coords = frames_root / "pose_coords_yolo"
-    produced_vis = frames_root / "pose_visualization"
-    dest_coords = project_root / "frames" / "pose_coords_yolo"
-    dest_vis = project_root / "frames" / "pose_visualization"
-    if produced_coords.exists():
-        ensure_dir(dest_coords.parent)
-        try:
-            # If source and destination are the same path, skip moving
-            if produced_coords.resolve() == dest_coords.resolve():
-                print("[info] pose_coords_yolo already in destination. Skip moving.")
-            else:
-                if dest_coords.exists():
-                    shutil.rmtree(dest_coords)
-                produced_coords.rename(dest_coords)
-        except FileNotFoundError:
-            # In case the directory was removed between checks; ignore
-            pass
-    if produced_vis.exists():
-        ensure_dir(dest_vis.parent)
-        try:
-            if produced_vis.resolve() == dest_vis.resolve():
-                print("[info] pose_visualization already in destination. Skip moving.")
-            else:
-                if dest_vis.exists():
-                    shutil.rmtree(dest_vis)
-                produced_vis.rename(dest_vis)
-        except FileNotFoundError:
-            pass
-
-    # Restore frames
-    print("[info] Restore original frames directory")
-    shutil.rmtree(frames_root, ignore_errors=True)
-    if frames_backup.exists():
-        frames_backup.rename(frames_root)
-
-    if args.run_active_track:
-        print("[info] Run find_most_active_tracks.py (quiet)")
-        try:
-            devnull = open(os.devnull, 'w')
-            subprocess.Popen(
-                [sys.executable, str(project_root / "22_Joint_Detection_YOLO/find_most_active_tracks.py")],
-                cwd=str(project_root / "22_Joint_Detection_YOLO"),
-                stdout=devnull,
-                stderr=devnull,
-            ).wait()
-        finally:
-            try:
-                devnull.close()
-            except Exception:
-                pass
+    write_clip_outputs(result, project_root / "pose_tracks" / clip_relative, clip_relative.as_posix())
 
     # APIは新標準パス pose_tracks/players/... を参照する方針に統一
 
@@ -146,7 +113,29 @@ def main():
     return 0
 
 
-if __name__ == "__main__":
-    raise SystemExit(main())
+def main():
+    parser = argparse.ArgumentParser(description="Run YOLO keypoint extraction for a single clip")
+    parser.add_argument("--clip-name", required=True, help="Clip name directory under frames/Cleaned_Data/players/<player>/")
+    parser.add_argument("--player", default="User", help="Player folder name (default: User)")
+    parser.add_argument("--video", help="Optional: input mp4 to first extract 48 frames at 30fps")
+    parser.add_argument("--run-active-track", action="store_true", help="Keep only the most active track (in-process equivalent of find_most_active_tracks.py)")
+    parser.add_argument("--stream", action="store_true", help="Decode --video in-process and skip the JPEG/per-frame CSV round-trips")
+    parser.add_argument("--save-frames", action="store_true", help="With --stream: also write the decoded frames as JPEGs")
+    parser.add_argument("--save-frame-csvs", action="store_true", help="With --stream: also write per-frame *_coords.csv files")
+    parser.add_argument("--visualize", action="store_true", help="Also write annotated *_pose_visualized.jpg images")
+    args = parser.parse_args()
+
+    return process_single_clip(
+        args.clip_name,
+        player=args.player,
+        video=args.video,
+        run_active_track=args.run_active_track,
+        stream=args.stream,
+        save_frames=args.save_frames,
+        save_frame_csvs=args.save_frame_csvs,
+        visualize=args.visualize,
+    )
 
 
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""参照クリップの LSTM 埋め込みを1つの行列にまとめて保存する
+
+infer_similarity.AugmentedLSTM.embed（最終層直前の32次元）を全参照クリップについて
+計算し、pose_tracks/Cleaned_Data/players/.embedding_index.npz に書き出す。
+CSV が変わっていないクリップは前回の行をそのまま使い、重みファイルか長さモード（--length-mode）が変わった場合は全件を再計算する。
+
+使い方:
+    python 30_Classification_LSTM/build_embedding_index.py
+    python 30_Classification_LSTM/build_embedding_index.py --root pose_tracks/Cleaned_Data/players --force
+"""
+import os
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# pose_analysis をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pose_analysis.embedding_index import EMBEDDING_INDEX_NAME, EmbeddingIndex, file_signature
+from pose_analysis.keypoint_store import KEYPOINTS_CSV_NAME
+from pose_analysis.sequence_features import LENGTH_MODES
+
+from infer_similarity import (
+    DEFAULT_LENGTH_MODE,
+    REFERENCE_ROOT,
+    embed_sequences,
+    embedding_index_signature,
+    load_model,
+    load_sequence_from_csv,
+    normalize_sequence_center_scale,
+)
+
+
+def build_embedding_index(root: str, model_path: str, output: str, device: str | None = None,
+                          batch_size: int = 64, force: bool = False,
+                          length_mode: str = DEFAULT_LENGTH_MODE) -> EmbeddingIndex:
+    root_path = Path(root)
+    # 索引内のパスは .npz の置き場所からの相対パス（読み込み側はそこを基準に解決する）
+    index_dir = Path(output).resolve().parent
+    # 浅い階層を先に並べる（Cleaned_Data/<選手>/ 配下の重複コピーより直下のクリップを優先）
+    csv_paths = sorted(
+        root_path.glob(f"**/{KEYPOINTS_CSV_NAME}"),
+        key=lambda p: (len(p.relative_to(root_path).parts), p.relative_to(root_path).as_posix()),
+    )
+    # 推論時と同じ長さモードで作った索引だけが使われるよう、モードも署名に含める
+    signature = embedding_index_signature(model_path, length_mode)
+
+    previous = {}
+    if not force and os.path.exists(output):
+        try:
+            old = EmbeddingIndex.load(output)
+            if old.model_signature == signature:
+                previous = {key: (tuple(sig), emb) for key, sig, emb in zip(old.keys, old.signatures, old.embeddings)}
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ 既存の埋め込み索引を読めないため作り直します: {e}")
+
+    keys, players, signatures, rows = [], [], [], []
+    stale_positions, stale_sequences = [], []
+    for csv_path in csv_paths:
+        key = Path(os.path.relpath(csv_path.resolve(), index_dir)).as_posix()
+        sig = file_signature(csv_path)
+        cached = previous.get(key)
+        if cached is not None and cached[0] == sig:
+            rows.append(cached[1])
+        else:
+            try:
+                sequence = normalize_sequence_center_scale(load_sequence_from_csv(str(csv_path), length_mode))
+            except (OSError, KeyError, ValueError) as e:
+                print(f"⚠️ スキップ: {csv_path} ({e})")
+                continue
+            stale_positions.append(len(rows))
+            stale_sequences.append(sequence)
+            rows.append(None)
+        keys.append(key)
+        players.append(csv_path.relative_to(root_path).parts[0])
+        signatures.append(sig)
+
+    if stale_sequences:
+        model = load_model(model_path, device)
+        embeddings = embed_sequences(model, stale_sequences, batch_size=batch_size)
+        for position, embedding in zip(stale_positions, embeddings):
+            rows[position] = embedding
+
+    dim = rows[0].shape[0] if rows else 0
+    index = EmbeddingIndex(
+        index_dir,
+        keys,
+        players,
+        np.stack(rows) if rows else np.empty((0, dim), dtype=np.float32),
+        signatures=np.array(signatures, dtype=np.int64).reshape(-1, 2),
+        model_signature=signature,
+    )
+    index.save(output)
+    print(f"📇 {len(keys)} クリップの埋め込みを保存（再計算 {len(stale_sequences)} 件）: {output}")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute LSTM embeddings of every reference clip')
+    parser.add_argument('--root', default=REFERENCE_ROOT, help='Directory containing one folder per player')
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(__file__), 'best_augmented_model.pth'))
+    parser.add_argument('--output', default=None, help='Output .npz (default: <root>/.embedding_index.npz)')
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--length-mode', choices=LENGTH_MODES, default=DEFAULT_LENGTH_MODE,
+                        help='Must match the length mode used by infer_similarity.py')
+    parser.add_argument('--force', action='store_true', help='Recompute every embedding')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.root, EMBEDDING_INDEX_NAME)
+    build_embedding_index(args.root, args.model, output, args.device, args.batch_size, args.force, args.length_mode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""動的 int8 量子化した分類器の精度を fp32 モデルと比較する
+
+参照クリップ（pose_tracks/Cleaned_Data/players/<選手>/...）を fp32 と量子化（--runtime quantized と同じ
+classifier_runtime.QuantizedRuntime）の両方で推論し、以下を表示する。
+
+    top-1 一致率      fp32 と量子化モデルの予測選手が一致した割合
+    確率のずれ        クラス確率の絶対差（平均 / 最大）
+    正解率            ディレクトリ名の選手を正解とした場合の fp32 / 量子化それぞれの正解率
+    重みサイズ・速度  state_dict のシリアライズ後サイズと1クリップあたりの推論時間
+
+一致率が --min-agreement 未満、または確率の最大ずれが --max-drift を超えた場合は終了コード 1 を返す。
+
+使い方:
+    python 30_Classification_LSTM/check_quantization.py
+    python 30_Classification_LSTM/check_quantization.py --root pose_tracks/Cleaned_Data/players --min-agreement 0.99
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# pose_analysis をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pose_analysis.keypoint_store import KEYPOINTS_CSV_NAME
+
+from classifier_runtime import EagerRuntime, QuantizedRuntime
+from infer_similarity import DEFAULT_BATCH_SIZE, DEFAULT_MODEL_PATH, PLAYERS, REFERENCE_ROOT, _softmax, prepare_sequence, run_bucketed
+from lstm_model import load_model
+
+
+def load_reference_clips(root: str):
+    """Normalised sequences (one (frames, N_FEATURES) array per clip) and the player directory of each clip."""
+    root_path = Path(root)
+    sequences, labels = [], []
+    for csv_path in sorted(root_path.glob(f'**/{KEYPOINTS_CSV_NAME}')):
+        try:
+            sequences.append(prepare_sequence(str(csv_path)))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ スキップ: {csv_path} ({e})")
+            continue
+        labels.append(csv_path.relative_to(root_path).parts[0])
+    return sequences, labels
+
+
+def predict(runtime, sequences, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Class probabilities (N, players) and the mean inference time per clip in milliseconds."""
+    started = time.perf_counter()
+    logits, _ = run_bucketed(runtime, sequences, batch_size)
+    elapsed = time.perf_counter() - started
+    return _softmax(logits), 1000.0 * elapsed / max(len(sequences), 1)
+
+
+def state_dict_bytes(model) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def compare_quantized(model_path: str, root: str, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    sequences, labels = load_reference_clips(root)
+    if not len(sequences):
+        raise ValueError(f'No reference clips under {root}')
+    # 量子化モデルは CPU 専用なので、比較条件を揃えるため fp32 も CPU で実行する
+    model = load_model(model_path, 'cpu')
+    fp32 = EagerRuntime(model)
+    quantized = QuantizedRuntime(model)
+
+    fp32_probs, fp32_ms = predict(fp32, sequences, batch_size)
+    int8_probs, int8_ms = predict(quantized, sequences, batch_size)
+    drift = np.abs(fp32_probs - int8_probs)
+    truth = np.array([PLAYERS.index(label) if label in PLAYERS else -1 for label in labels])
+    known = truth >= 0
+    return {
+        'clips': int(len(sequences)),
+        'top1_agreement': float(np.mean(fp32_probs.argmax(axis=1) == int8_probs.argmax(axis=1))),
+        'mean_probability_drift': float(drift.mean()),
+        'max_probability_drift': float(drift.max()),
+        'fp32_accuracy': float(np.mean(fp32_probs.argmax(axis=1)[known] == truth[known])) if known.any() else None,
+        'quantized_accuracy': float(np.mean(int8_probs.argmax(axis=1)[known] == truth[known])) if known.any() else None,
+        'fp32_state_bytes': state_dict_bytes(fp32.model),
+        'quantized_state_bytes': state_dict_bytes(quantized.model),
+        'fp32_ms_per_clip': fp32_ms,
+        'quantized_ms_per_clip': int8_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the dynamic int8 quantized classifier against fp32 on the reference clips')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--root', default=REFERENCE_ROOT, help='Directory containing one folder per player')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--min-agreement', type=float, default=0.98, help='Minimum top-1 agreement with fp32')
+    parser.add_argument('--max-drift', type=float, default=0.05, help='Maximum absolute probability difference')
+    args = parser.parse_args()
+
+    report = compare_quantized(args.model, args.root, args.batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    passed = report['top1_agreement'] >= args.min_agreement and report['max_probability_drift'] <= args.max_drift
+    print('✅ 量子化モデルは許容範囲内です' if passed else '❌ 量子化モデルの精度が許容範囲を外れています')
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""サーブ分類 LSTM の推論ランタイム選択
+
+export_classifier.py が best_augmented_model.pth から書き出した ONNX / TorchScript を、
+利用可能なら eager PyTorch の代わりに使う。どのランタイムも
+``run(x: (N, frames, 24) float32) -> (logits (N, 4), embedding (N, 32))`` を NumPy で返す。
+
+    auto         ONNX Runtime（onnxruntime が入っていて .onnx が現在の重みから書き出されている場合）
+                 → TorchScript → eager の順に選ぶ
+    onnx         ONNX Runtime（torch を import しない）
+    torchscript  torch.jit.load したグラフ
+    eager        AugmentedLSTM をそのまま実行
+    quantized    LSTM / Linear を動的 int8 量子化した eager モデル（CPU のみ。auto では選ばれない。
+                 精度は check_quantization.py で確認する）
+
+書き出したファイルの横には元の重みのシグネチャを記録した .json を置き、重みが更新されたら
+古い書き出しファイルは自動的に使われなくなる。torch の import は実際に必要になるまで遅らせる。
+"""
+import json
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+from pose_analysis.embedding_index import model_signature
+
+RUNTIMES = ('auto', 'onnx', 'torchscript', 'eager', 'quantized')
+DEFAULT_RUNTIME = os.environ.get('SERVE_CLASSIFIER_RUNTIME', 'auto')
+
+
+def exported_model_paths(model_path: str) -> Dict[str, str]:
+    """Where export_classifier.py writes the exported graphs of ``model_path``."""
+    stem = os.path.splitext(model_path)[0]
+    return {'onnx': stem + '.onnx', 'torchscript': stem + '.torchscript.pt'}
+
+
+def manifest_path(exported_path: str) -> str:
+    return exported_path + '.json'
+
+
+def is_current_export(exported_path: str, model_path: str) -> bool:
+    """True when ``exported_path`` exists and was exported from the current ``model_path`` weights."""
+    try:
+        with open(manifest_path(exported_path), 'r', encoding='utf-8') as fh:
+            manifest = json.load(fh)
+        return os.path.exists(exported_path) and manifest.get('source_model') == model_signature(model_path)
+    except (OSError, ValueError):
+        return False
+
+
+class EagerRuntime:
+    name = 'eager'
+
+    def __init__(self, model, device: str | None = None):
+        import torch
+
+        self._torch = torch
+        self.model = model.eval()
+        self.device = torch.device(device) if device else next(model.parameters()).device
+
+    def run(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        torch = self._torch
+        with torch.no_grad():
+            embedding = self.model.embed(torch.from_numpy(x).to(self.device))
+            logits = self.model.fc[-1](embedding)
+        return logits.cpu().numpy(), embedding.cpu().numpy()
+
+
+class QuantizedRuntime(EagerRuntime):
+    name = 'quantized'
+
+    def __init__(self, model):
+        from lstm_model import quantize_model
+
+        # 量子化済みモジュールは重みを Parameter として持たないため、デバイスは CPU を明示する
+        super().__init__(quantize_model(model), device='cpu')
+
+
+class TorchScriptRuntime:
+    name = 'torchscript'
+
+    def __init__(self, path: str, device: str | None = None):
+        import torch
+
+        self._torch = torch
+        self.device = torch.device(device) if device else torch.device('cpu')
+        self.module = torch.jit.optimize_for_inference(torch.jit.load(path, map_location=self.device).eval())
+
+    def run(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        torch = self._torch
+        with torch.no_grad():
+            logits, embedding = self.module(torch.from_numpy(x).to(self.device))
+        return logits.cpu().numpy(), embedding.cpu().numpy()
+
+
+class OnnxRuntime:
+    name = 'onnx'
+
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        logits, embedding = self.session.run(None, {self.input_name: np.ascontiguousarray(x, dtype=np.float32)})
+        return logits, embedding
+
+
+def _onnxruntime_available() -> bool:
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def select_runtime(model_path: str, runtime: str = DEFAULT_RUNTIME, device: str | None = None):
+    """Build the requested runtime for ``model_path`` (``auto`` falls back to eager when nothing else fits)."""
+    if runtime not in RUNTIMES:
+        raise ValueError(f'runtime must be one of {RUNTIMES}, got {runtime!r}')
+    exported = exported_model_paths(model_path)
+    cpu_only = device in (None, 'cpu')
+
+    if runtime == 'onnx' or (runtime == 'auto' and cpu_only and _onnxruntime_available()
+                             and is_current_export(exported['onnx'], model_path)):
+        if not is_current_export(exported['onnx'], model_path):
+            raise FileNotFoundError(f"{exported['onnx']} is missing or stale; run export_classifier.py --format onnx")
+        return OnnxRuntime(exported['onnx'])
+    if runtime == 'torchscript' or (runtime == 'auto' and is_current_export(exported['torchscript'], model_path)):
+        if not is_current_export(exported['torchscript'], model_path):
+            raise FileNotFoundError(f"{exported['torchscript']} is missing or stale; run export_classifier.py --format torchscript")
+        return TorchScriptRuntime(exported['torchscript'], device)
+
+    from lstm_model import load_model
+
+    if runtime == 'quantized':
+        if not cpu_only:
+            raise ValueError('The quantized runtime only supports CPU inference')
+        return QuantizedRuntime(load_model(model_path, 'cpu'))
+    return EagerRuntime(load_model(model_path, device))
@@ -0,0 +1,166 @@
+"""サーブ分類 LSTM を TorchScript / ONNX に書き出し、eager PyTorch との出力一致を確認する
+
+best_augmented_model.pth を (logits, embedding) を返すグラフとして書き出す。
+バッチ数とフレーム数は可変。書き出し後は参照クリップ（または乱数入力）を複数のフレーム数
+（PARITY_FRAME_COUNTS）に揃えたバッチで eager の出力と比較し、
+最大誤差が許容値を超えた場合は終了コード 1 を返してファイルを有効化しない。
+合格したファイルの横に元の重みのシグネチャと誤差を記録した .json を置き、
+infer_similarity（classifier_runtime.select_runtime）はそれを見て自動的に切り替える。
+
+使い方:
+    python 30_Classification_LSTM/export_classifier.py
+    python 30_Classification_LSTM/export_classifier.py --format onnx --check-clips 200
+"""
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# pose_analysis をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pose_analysis.embedding_index import model_signature
+from pose_analysis.keypoint_store import KEYPOINTS_CSV_NAME
+from pose_analysis.sequence_features import (
+    N_FEATURES,
+    SEQUENCE_LENGTH,
+    load_normalized_sequence,
+    normalize_sequence_center_scale,
+    resample_sequence,
+)
+
+from classifier_runtime import EagerRuntime, OnnxRuntime, TorchScriptRuntime, exported_model_paths, manifest_path
+from infer_similarity import DEFAULT_MODEL_PATH, REFERENCE_ROOT
+from lstm_model import LogitsAndEmbedding, load_model
+
+FORMATS = ('torchscript', 'onnx')
+DEFAULT_ATOL = 1e-4
+ONNX_OPSET = 17
+# トレースは 1x48 の例で行うため、推論で渡りうる他のフレーム数（run_bucketed は長さごとにバッチを組む）でも確認する
+PARITY_FRAME_COUNTS = (SEQUENCE_LENGTH, 30, 47, 49, 96)
+
+
+def export_torchscript(model, path: str) -> str:
+    wrapper = LogitsAndEmbedding(model).eval()
+    example = torch.zeros(1, SEQUENCE_LENGTH, N_FEATURES, device=next(model.parameters()).device)
+    with torch.no_grad():
+        scripted = torch.jit.trace(wrapper, example)
+    scripted.save(path)
+    return path
+
+
+def export_onnx(model, path: str) -> str:
+    wrapper = LogitsAndEmbedding(model.cpu()).eval()
+    example = torch.zeros(1, SEQUENCE_LENGTH, N_FEATURES)
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            example,
+            path,
+            input_names=['sequences'],
+            output_names=['logits', 'embedding'],
+            dynamic_axes={'sequences': {0: 'batch', 1: 'frames'}, 'logits': {0: 'batch'}, 'embedding': {0: 'batch'}},
+            opset_version=ONNX_OPSET,
+        )
+    return path
+
+
+def parity_inputs(root: str, n_clips: int, seed: int = 0, frame_counts=PARITY_FRAME_COUNTS) -> list:
+    """One (clips, frames, N_FEATURES) array per entry of ``frame_counts`` to compare runtimes on.
+
+    Reference clips are resampled to each frame count and normalised again;
+    random sequences are used when no clips are found.
+    """
+    sequences = []
+    for csv_path in sorted(Path(root).glob(f'**/{KEYPOINTS_CSV_NAME}'))[:n_clips]:
+        try:
+            sequences.append(load_normalized_sequence(csv_path))
+        except (OSError, KeyError, ValueError):
+            continue
+    if sequences:
+        return [
+            np.stack([
+                normalize_sequence_center_scale(resample_sequence(seq, np.linspace(0, len(seq) - 1, frames)))
+                for seq in sequences
+            ]).astype(np.float32)
+            for frames in frame_counts
+        ]
+    rng = np.random.default_rng(seed)
+    # バッチ数 1 と 2 以上の両方を通すため、最低2クリップにする
+    return [rng.standard_normal((max(n_clips, 2), frames, N_FEATURES)).astype(np.float32) for frames in frame_counts]
+
+
+def check_parity(reference_runtime, runtime, inputs, batch_size: int = 64) -> dict:
+    """Max absolute logit / embedding differences and top-1 agreement between two runtimes.
+
+    ``inputs`` is a list of (clips, frames, N_FEATURES) arrays (see :func:`parity_inputs`).
+    """
+    logit_diff = embedding_diff = 0.0
+    agree = clips = 0
+    for sequences in inputs:
+        for start in range(0, len(sequences), batch_size):
+            x = np.ascontiguousarray(sequences[start:start + batch_size], dtype=np.float32)
+            ref_logits, ref_embedding = reference_runtime.run(x)
+            logits, embedding = runtime.run(x)
+            logit_diff = max(logit_diff, float(np.max(np.abs(ref_logits - logits))))
+            embedding_diff = max(embedding_diff, float(np.max(np.abs(ref_embedding - embedding))))
+            agree += int(np.sum(ref_logits.argmax(axis=1) == logits.argmax(axis=1)))
+            clips += len(x)
+    return {
+        'clips': clips,
+        'frame_counts': sorted({int(sequences.shape[1]) for sequences in inputs}),
+        'max_logit_diff': logit_diff,
+        'max_embedding_diff': embedding_diff,
+        'top1_agreement': agree / max(clips, 1),
+    }
+
+
+def export_classifier(model_path: str, formats=FORMATS, root: str = REFERENCE_ROOT, n_clips: int = 100,
+                      atol: float = DEFAULT_ATOL) -> bool:
+    model = load_model(model_path, 'cpu')
+    eager = EagerRuntime(model)
+    inputs = parity_inputs(root, n_clips)
+    paths = exported_model_paths(model_path)
+    ok = True
+    for fmt in formats:
+        path = paths[fmt]
+        # 検証前のファイルが使われないよう、古い記録を先に消してから書き出す
+        if os.path.exists(manifest_path(path)):
+            os.remove(manifest_path(path))
+        if fmt == 'torchscript':
+            export_torchscript(model, path)
+            runtime = TorchScriptRuntime(path, 'cpu')
+        else:
+            export_onnx(model, path)
+            runtime = OnnxRuntime(path)
+        parity = check_parity(eager, runtime, inputs)
+        passed = parity['max_logit_diff'] <= atol and parity['max_embedding_diff'] <= atol
+        print(f"{'✅' if passed else '❌'} {fmt}: {path} {json.dumps(parity)}")
+        if not passed:
+            ok = False
+            continue
+        tmp_path = manifest_path(path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump({'format': fmt, 'source_model': model_signature(model_path), 'atol': atol, 'parity': parity}, fh, indent=2)
+        os.replace(tmp_path, manifest_path(path))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the serve classifier to TorchScript / ONNX and check parity with eager PyTorch')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--format', choices=FORMATS + ('all',), default='all')
+    parser.add_argument('--root', default=REFERENCE_ROOT, help='Reference clips used for the parity check')
+    parser.add_argument('--check-clips', type=int, default=100, help='Number of clips compared against eager outputs at each frame count')
+    parser.add_argument('--atol', type=float, default=DEFAULT_ATOL, help='Max allowed absolute difference of logits / embeddings')
+    args = parser.parse_args()
+
+    formats = FORMATS if args.format == 'all' else (args.format,)
+    return 0 if export_classifier(args.model, formats, args.root, args.check_clips, args.atol) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,107 +2,318 @@ import os
 import sys
 import json
 import argparse
+import threading
+from pathlib import Path
 import numpy as np
-import pandas as pd
-import torch
-import torch.nn as nn
+
+# pose_analysis（共通のキーポイントローダー）をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# 系列の読み込みと正規化は torch 不要の共通モジュール（類似検索と共用）
+from pose_analysis.sequence_features import (
+    LENGTH_MODES,
+    N_FEATURES,
+    fit_length_mode,
+    length_buckets,
+    load_sequence,
+    normalize_sequence_center_scale,
+)
+from pose_analysis.embedding_index import EMBEDDING_INDEX_NAME, EmbeddingIndex, model_signature
+from pose_analysis.keypoint_store import KEYPOINTS_CSV_NAME
+
+# torch は eager / TorchScript ランタイムを使うときだけ読み込む（ONNX Runtime なら不要）
+from classifier_runtime import DEFAULT_RUNTIME, RUNTIMES, EagerRuntime, select_runtime
 
 
 PLAYERS = ['Djo', 'Fed', 'Kei', 'Alc']
-SEQUENCE_LENGTH = 48
-N_FEATURES = 24
-
-
-def normalize_sequence_center_scale(sequence: np.ndarray, eps: float = 1e-6) -> np.ndarray:
-    seq = sequence.copy()
-    xs = seq[:, ::2]
-    ys = seq[:, 1::2]
-    cx = np.mean(xs)
-    cy = np.mean(ys)
-    xs -= cx
-    ys -= cy
-    seq[:, ::2] = xs
-    seq[:, 1::2] = ys
-    scale = np.std(seq)
-    if scale < eps:
-        scale = 1.0
-    return seq / scale
-
-
-class AugmentedLSTM(nn.Module):
-    def __init__(self, input_size: int, hidden_size: int = 128, num_layers: int = 3, num_classes: int = 4, dropout: float = 0.5):
-        super().__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True, dropout=dropout if num_layers > 1 else 0)
-        self.fc = nn.Sequential(
-            nn.Linear(hidden_size, 32),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(32, num_classes),
-        )
-
-    def forward(self, x):
-        lstm_out, _ = self.lstm(x)
-        last_out = lstm_out[:, -1, :]
-        return self.fc(last_out)
-
-
-def load_sequence_from_csv(csv_path: str) -> np.ndarray:
-    df = pd.read_csv(csv_path)
-    # (1)を含むフレームを除外
-    if 'frame_name' in df.columns:
-        df = df[~df['frame_name'].str.contains(r"\(1\)", na=False)]
-    keypoint_cols = [c for c in df.columns if c.startswith('kpt_')]
-    seq = df[keypoint_cols].values
-    if len(seq) < SEQUENCE_LENGTH:
-        # 足りない分は最後のフレームを繰り返してパディング
-        if len(seq) == 0:
-            raise ValueError("Sequence empty")
-        last = seq[-1:]
-        pad_count = SEQUENCE_LENGTH - len(seq)
-        seq = np.vstack([seq] + [last] * pad_count)
-    if len(seq) > SEQUENCE_LENGTH:
-        # 中央48フレームを使用
-        start = (len(seq) - SEQUENCE_LENGTH) // 2
-        seq = seq[start:start+SEQUENCE_LENGTH]
-    return seq.astype(np.float32)
-
-
-def infer(csv_path: str, model_path: str, device: str | None = None):
-    device_torch = torch.device(device) if device else (torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu'))
-    sequence = load_sequence_from_csv(csv_path)
-    sequence = normalize_sequence_center_scale(sequence)
-
-    model = AugmentedLSTM(input_size=N_FEATURES, hidden_size=128, num_layers=3, num_classes=len(PLAYERS), dropout=0.5).to(device_torch)
-    state = torch.load(model_path, map_location=device_torch)
-    model.load_state_dict(state)
-    model.eval()
-
-    x = torch.from_numpy(sequence).reshape(1, SEQUENCE_LENGTH, N_FEATURES).to(device_torch)
-    with torch.no_grad():
-        logits = model(x)
-        probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
-
-    result = {
-        'csv': csv_path,
-        'model': model_path,
-        'players': PLAYERS,
-        'probabilities': {PLAYERS[i]: float(probs[i]) for i in range(len(PLAYERS))},
-        'top1': {
-            'player': PLAYERS[int(np.argmax(probs))],
-            'score': float(np.max(probs))
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+REFERENCE_ROOT = os.path.join(PROJECT_ROOT, 'pose_tracks', 'Cleaned_Data', 'players')
+DEFAULT_EMBEDDING_INDEX = os.path.join(REFERENCE_ROOT, EMBEDDING_INDEX_NAME)
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_augmented_model.pth')
+DEFAULT_BATCH_SIZE = 64
+# full: クリップの全フレームを使う / phases: 検出したフェーズ位置に合わせて48フレームへ再サンプル / crop: 48フレーム切り出し
+# 配備中の best_augmented_model.pth は48フレームの crop 入力で学習しているため既定は crop。
+# full / phases は、そのモードで学習し直した重み（tennis_pose_augmented.py の length_mode）を使うときに指定する
+DEFAULT_LENGTH_MODE = os.environ.get('SERVE_CLASSIFIER_LENGTH_MODE', 'crop')
+
+# 常駐ワーカーや一括採点で重みを読み直さないよう、(モデルパス, デバイス, ランタイム, 長さモード) ごとに推論器を保持する
+_INFERENCER_CACHE = {}
+_INFERENCER_CACHE_LOCK = threading.Lock()
+
+
+def __getattr__(name):
+    # 既存の `from infer_similarity import AugmentedLSTM` のために、参照されたときだけ torch を読み込む
+    if name == 'AugmentedLSTM':
+        from lstm_model import AugmentedLSTM
+        return AugmentedLSTM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_sequence_from_csv(csv_path: str, length_mode: str = DEFAULT_LENGTH_MODE) -> np.ndarray:
+    # 同じ場所に新しい .npz があればそちらを読む（なければ CSV）。(1)を含むフレームを除外し、長さは length_mode に従う
+    return load_sequence(csv_path, length_mode)
+
+
+def resolve_device(device: str | None = None):
+    from lstm_model import resolve_device as _resolve_device
+    return _resolve_device(device)
+
+
+def load_model(model_path: str, device: str | None = None):
+    from lstm_model import load_model as _load_model
+    return _load_model(model_path, device)
+
+
+def run_bucketed(runtime, sequences, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Logits and embeddings of normalised ``(frames, N_FEATURES)`` sequences of any lengths, in input order.
+
+    Clips of equal length share a forward pass (at most ``batch_size`` per pass),
+    so no padding is needed and every runtime, including the exported graphs, can run them.
+    """
+    sequences = list(sequences)
+    logits = embeddings = None
+    for batch in length_buckets([len(seq) for seq in sequences], batch_size):
+        batch_logits, batch_embeddings = runtime.run(np.ascontiguousarray(np.stack([sequences[i] for i in batch]), dtype=np.float32))
+        if logits is None:
+            logits = np.empty((len(sequences), batch_logits.shape[1]), dtype=np.float32)
+            embeddings = np.empty((len(sequences), batch_embeddings.shape[1]), dtype=np.float32)
+        logits[batch] = batch_logits
+        embeddings[batch] = batch_embeddings
+    if logits is None:
+        return np.empty((0, len(PLAYERS)), dtype=np.float32), np.empty((0, 32), dtype=np.float32)
+    return logits, embeddings
+
+
+def embed_sequences(model, sequences, batch_size: int = 64) -> np.ndarray:
+    """Embeddings (N, 32) of normalised sequences (an (N, frames, N_FEATURES) array or a list of clips)."""
+    runtime = model if hasattr(model, 'run') else EagerRuntime(model)
+    return run_bucketed(runtime, sequences, batch_size)[1]
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def embedding_index_signature(model_path: str, length_mode: str = DEFAULT_LENGTH_MODE) -> str:
+    """Signature stored in the embedding index: the weights and how clip lengths were fitted."""
+    return f'{model_signature(model_path)}:{length_mode}'
+
+
+def load_embedding_index(model_path: str, index_path: str = DEFAULT_EMBEDDING_INDEX,
+                         length_mode: str = DEFAULT_LENGTH_MODE) -> EmbeddingIndex | None:
+    """Reference embedding matrix built from ``model_path`` and ``length_mode``; ``None`` when missing or stale."""
+    if not os.path.exists(index_path):
+        return None
+    index = EmbeddingIndex.for_file(index_path)
+    if index.model_signature != embedding_index_signature(model_path, length_mode):
+        print(f"⚠️ {index_path} was built from different weights or length mode; rebuild it with build_embedding_index.py",
+              file=sys.stderr)
+        return None
+    return index
+
+
+def nearest_references(embedding: np.ndarray, index: EmbeddingIndex, top_k: int, player: str | None = None):
+    """Top-k reference clips by cosine similarity as JSON-friendly dicts."""
+    return [
+        {
+            'player': match.player,
+            'csv_path': os.path.relpath(match.path, PROJECT_ROOT).replace(os.sep, '/'),
+            'score': match.score,
         }
-    }
-    return result
+        for match in index.search(embedding, top_k, player=player)
+    ]
+
+
+def prepare_sequence(source, length_mode: str = DEFAULT_LENGTH_MODE) -> np.ndarray:
+    """Normalised (frames, N_FEATURES) model input from a keypoint file or a raw (T, N_FEATURES) array."""
+    if isinstance(source, (str, os.PathLike)):
+        sequence = load_sequence_from_csv(str(source), length_mode)
+    else:
+        sequence = np.asarray(source, dtype=np.float32)
+        if sequence.ndim != 2 or sequence.shape[1] != N_FEATURES:
+            raise ValueError(f'Expected a (frames, {N_FEATURES}) keypoint array, got shape {sequence.shape}')
+        sequence = fit_length_mode(sequence, length_mode).astype(np.float32)
+    return normalize_sequence_center_scale(sequence)
+
+
+class SimilarityInferencer:
+    """Serve classifier loaded once and applied to many clips per forward pass.
+
+    The network runs on a runtime from :func:`classifier_runtime.select_runtime`
+    (ONNX Runtime, TorchScript or eager PyTorch). Clip lengths follow
+    ``length_mode`` and clips of equal length share a forward pass. Use
+    :meth:`for_model` to share one instance per (weights file, device, runtime,
+    length mode) in the process; it is reloaded when the weights file changes.
+    """
+
+    def __init__(self, runtime, model_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 length_mode: str = DEFAULT_LENGTH_MODE):
+        if length_mode not in LENGTH_MODES:
+            raise ValueError(f'length_mode must be one of {LENGTH_MODES}, got {length_mode!r}')
+        # 読み込み済みの AugmentedLSTM を渡された場合は eager で実行する
+        self.runtime = runtime if hasattr(runtime, 'run') else EagerRuntime(runtime)
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.length_mode = length_mode
+        # LSTM の推論はスレッド間で直列化する
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_path: str = DEFAULT_MODEL_PATH, device: str | None = None,
+             batch_size: int = DEFAULT_BATCH_SIZE, runtime: str = DEFAULT_RUNTIME,
+             length_mode: str = DEFAULT_LENGTH_MODE) -> 'SimilarityInferencer':
+        return cls(select_runtime(model_path, runtime, device), model_path, batch_size, length_mode)
+
+    @classmethod
+    def for_model(cls, model_path: str = DEFAULT_MODEL_PATH, device: str | None = None,
+                  runtime: str = DEFAULT_RUNTIME, length_mode: str = DEFAULT_LENGTH_MODE) -> 'SimilarityInferencer':
+        """Process-wide cached :meth:`load` keyed by model path, device, runtime and length mode, refreshed when the file's mtime changes."""
+        key = (os.path.abspath(model_path), device, runtime, length_mode)
+        mtime_ns = os.stat(model_path).st_mtime_ns
+        with _INFERENCER_CACHE_LOCK:
+            cached = _INFERENCER_CACHE.get(key)
+            if cached is None or cached[0] != mtime_ns:
+                cached = (mtime_ns, cls.load(model_path, device, runtime=runtime, length_mode=length_mode))
+                _INFERENCER_CACHE[key] = cached
+            return cached[1]
+
+    def forward(self, sequences):
+        """Probabilities (N, players) and embeddings (N, 32) of normalised sequences of any lengths (see :func:`run_bucketed`)."""
+        with self._lock:
+            logits, embeddings = run_bucketed(self.runtime, sequences, self.batch_size)
+        return _softmax(logits), embeddings
+
+    def window_scores(self, windows: np.ndarray) -> np.ndarray:
+        """Top class probability of ``(W, frames, 17, 2)`` keypoint windows, each normalised on its own frames."""
+        # kpt_5..kpt_16 の x/y を学習時と同じ (frames, 24) の並びにする。欠損関節は 0 で埋める
+        features = np.nan_to_num(windows[:, :, 5:17, :]).reshape(len(windows), windows.shape[1], N_FEATURES)
+        sequences = np.stack([normalize_sequence_center_scale(window) for window in features])
+        probs, _ = self.forward(sequences)
+        return probs.max(axis=1)
+
+    def predict_batch(self, sources, top_k: int = 0, embedding_index: str = DEFAULT_EMBEDDING_INDEX):
+        """Classify many clips (keypoint file paths or raw arrays) at once; one result dict per source, in order.
+
+        Clips that cannot be loaded get ``{'csv': ..., 'error': ...}`` instead of failing the whole batch.
+        """
+        sources = list(sources)
+        results = [None] * len(sources)
+        positions, sequences = [], []
+        for i, source in enumerate(sources):
+            try:
+                sequences.append(prepare_sequence(source, self.length_mode))
+                positions.append(i)
+            except (OSError, KeyError, ValueError) as e:
+                results[i] = {'csv': _source_label(source, i), 'error': str(e)}
+
+        labels = [_source_label(sources[i], i) for i in positions]
+        for i, result in zip(positions, self._results(labels, sequences, top_k, embedding_index)):
+            results[i] = result
+        return results
+
+    def predict(self, source, top_k: int = 0, embedding_index: str = DEFAULT_EMBEDDING_INDEX):
+        """Classify a single clip; loading errors are raised rather than returned."""
+        return self._results([_source_label(source, 0)], [prepare_sequence(source, self.length_mode)], top_k, embedding_index)[0]
+
+    def _results(self, labels, sequences, top_k, embedding_index):
+        if not sequences:
+            return []
+        probs, embeddings = self.forward(sequences)
+        index = load_embedding_index(self.model_path, embedding_index, self.length_mode) if top_k > 0 else None
+        results = []
+        for label, p, embedding in zip(labels, probs, embeddings):
+            result = {
+                'csv': label,
+                'model': self.model_path,
+                'runtime': self.runtime.name,
+                'length_mode': self.length_mode,
+                'players': PLAYERS,
+                'probabilities': {PLAYERS[j]: float(p[j]) for j in range(len(PLAYERS))},
+                'top1': {
+                    'player': PLAYERS[int(np.argmax(p))],
+                    'score': float(np.max(p))
+                }
+            }
+            if top_k > 0:
+                result['nearest'] = nearest_references(embedding, index, top_k) if index is not None else None
+            results.append(result)
+        return results
+
+
+def _source_label(source, position: int) -> str:
+    return str(source) if isinstance(source, (str, os.PathLike)) else f'<array {position}>'
+
+
+def infer(
+    csv_path: str,
+    model_path: str,
+    device: str | None = None,
+    model=None,
+    top_k: int = 0,
+    embedding_index: str = DEFAULT_EMBEDDING_INDEX,
+    runtime: str = DEFAULT_RUNTIME,
+    length_mode: str = DEFAULT_LENGTH_MODE,
+):
+    """Classify one clip with the cached :class:`SimilarityInferencer` (or an already loaded ``model``).
+
+    With ``top_k > 0`` the same forward pass also yields the clip embedding, and the
+    ``top_k`` closest reference clips from the embedding index are returned as ``nearest``.
+    """
+    inferencer = (
+        SimilarityInferencer(model, model_path, length_mode=length_mode) if model is not None
+        else SimilarityInferencer.for_model(model_path, device, runtime, length_mode)
+    )
+    return inferencer.predict(csv_path, top_k, embedding_index)
+
+
+def classifier_window_scorer(model_path: str = DEFAULT_MODEL_PATH, device: str | None = None,
+                             runtime: str = DEFAULT_RUNTIME):
+    """``scorer`` for ``pose_analysis.serve_detector.StreamingServeDetector`` backed by the cached classifier.
+
+    The classifier only knows the four reference players, so its top probability
+    is used as a "looks like a trained serve" factor on top of the pose score.
+    """
+    return SimilarityInferencer.for_model(model_path, device, runtime).window_scores
+
+
+def collect_csv_paths(csv_list: str | None = None, directory: str | None = None) -> list:
+    """Keypoint CSV paths from a list file (one path per line, ``#`` comments) and/or a directory tree."""
+    paths = []
+    if csv_list:
+        with open(csv_list, 'r', encoding='utf-8') as fh:
+            paths.extend(line.strip() for line in fh if line.strip() and not line.lstrip().startswith('#'))
+    if directory:
+        paths.extend(str(p) for p in sorted(Path(directory).glob(f'**/{KEYPOINTS_CSV_NAME}')))
+    return paths
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--csv', required=True, help='Path to keypoints_with_tracks.csv')
-    parser.add_argument('--model', default=os.path.join(os.path.dirname(__file__), 'best_augmented_model.pth'))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='Path to keypoints_with_tracks.csv')
+    source.add_argument('--csv-list', help='Text file with one keypoints CSV path per line (prints a JSON array)')
+    source.add_argument('--dir', help='Classify every keypoints_with_tracks.csv under this directory (prints a JSON array)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
     parser.add_argument('--device', default=None)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--runtime', choices=RUNTIMES, default=DEFAULT_RUNTIME,
+                        help='auto: ONNX Runtime / TorchScript export when present and current, else eager PyTorch')
+    parser.add_argument('--length-mode', choices=LENGTH_MODES, default=DEFAULT_LENGTH_MODE,
+                        help='crop: 48-frame pad or centre crop (what the shipped weights were trained on) / full: every frame / '
+                             'phases: resample to 48 frames aligned on the detected serve phases; use full / phases only with weights trained that way')
+    parser.add_argument('--top-k', type=int, default=0, help='Also return the k closest reference clips (embedding cosine)')
+    parser.add_argument('--embedding-index', default=DEFAULT_EMBEDDING_INDEX, help='Reference embedding matrix (.npz)')
     args = parser.parse_args()
 
-    res = infer(args.csv, args.model, args.device)
+    if args.csv:
+        res = infer(args.csv, args.model, args.device, top_k=args.top_k, embedding_index=args.embedding_index,
+                    runtime=args.runtime, length_mode=args.length_mode)
+        print(json.dumps(res, ensure_ascii=False))
+        return
+
+    csv_paths = collect_csv_paths(args.csv_list, args.dir)
+    inferencer = SimilarityInferencer.load(args.model, args.device, args.batch_size, args.runtime, args.length_mode)
+    res = inferencer.predict_batch(csv_paths, top_k=args.top_k, embedding_index=args.embedding_index)
     print(json.dumps(res, ensure_ascii=False))
 
 
@@ -0,0 +1,75 @@
+"""配備中のサーブ分類 LSTM（best_augmented_model.pth）のモデル定義と読み込み
+
+torch を import するのはこのモジュールだけにしておき、ONNX Runtime で推論する場合は
+infer_similarity から読み込まれないようにする（classifier_runtime.select_runtime を参照）。
+"""
+import copy
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence
+
+from pose_analysis.sequence_features import N_FEATURES
+
+PLAYERS = ['Djo', 'Fed', 'Kei', 'Alc']
+
+
+class AugmentedLSTM(nn.Module):
+    def __init__(self, input_size: int, hidden_size: int = 128, num_layers: int = 3, num_classes: int = 4, dropout: float = 0.5):
+        super().__init__()
+        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True, dropout=dropout if num_layers > 1 else 0)
+        self.fc = nn.Sequential(
+            nn.Linear(hidden_size, 32),
+            nn.ReLU(),
+            nn.Dropout(dropout),
+            nn.Linear(32, num_classes),
+        )
+
+    def embed(self, x, lengths=None):
+        """Penultimate hidden state (output of the 32-unit ReLU layer) used as the clip embedding.
+
+        ``lengths`` gives the true frame count of each zero-padded row of ``x``;
+        the rows are then packed so the LSTM stops at each clip's last frame.
+        """
+        if lengths is None:
+            lstm_out, _ = self.lstm(x)
+            last_out = lstm_out[:, -1, :]
+        else:
+            packed = pack_padded_sequence(x, torch.as_tensor(lengths).cpu(), batch_first=True, enforce_sorted=False)
+            _, (hidden, _) = self.lstm(packed)
+            last_out = hidden[-1]
+        return self.fc[:-1](last_out)
+
+    def forward(self, x, lengths=None):
+        return self.fc[-1](self.embed(x, lengths))
+
+
+class LogitsAndEmbedding(nn.Module):
+    """Export wrapper returning ``(logits, embedding)`` from one pass, as every runtime does."""
+
+    def __init__(self, model: AugmentedLSTM):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        embedding = self.model.embed(x)
+        return self.model.fc[-1](embedding), embedding
+
+
+def resolve_device(device: str | None = None) -> torch.device:
+    return torch.device(device) if device else (torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu'))
+
+
+def load_model(model_path: str, device: str | None = None) -> AugmentedLSTM:
+    device_torch = resolve_device(device)
+    model = AugmentedLSTM(input_size=N_FEATURES, hidden_size=128, num_layers=3, num_classes=len(PLAYERS), dropout=0.5).to(device_torch)
+    state = torch.load(model_path, map_location=device_torch)
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+
+def quantize_model(model: AugmentedLSTM) -> nn.Module:
+    """Dynamic int8 copy of ``model`` (LSTM and Linear weights, activations quantised on the fly) for CPU inference."""
+    fp32 = copy.deepcopy(model).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(fp32, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
@@ -1,10 +1,11 @@
-import pandas as pd
 import numpy as np
 import os
+import sys
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.nn.utils.rnn import pack_padded_sequence, pad_sequence
+from torch.utils.data import Dataset, DataLoader, Sampler
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
@@ -13,13 +14,22 @@ import seaborn as sns
 import warnings
 warnings.filterwarnings('ignore')
 
+# pose_analysis（共通のキーポイントローダー）をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pose_analysis.keypoint_store import keypoints_exist, load_keypoint_arrays
+from pose_analysis.sequence_features import SEQUENCE_LENGTH, fit_length_mode, length_buckets
+
+# 長さバケットで1バッチにまとめるクリップの長さの差の上限（フレーム）
+LENGTH_BUCKET_SPREAD = 4
+
 # 日本語フォント設定
 plt.rcParams['font.family'] = 'DejaVu Sans'
 
 class TennisPoseDataset(Dataset):
-    """テニスポーズデータセット用のPyTorch Dataset"""
+    """テニスポーズデータセット用のPyTorch Dataset（クリップごとにフレーム数が異なってよい）"""
     def __init__(self, sequences, labels=None):
-        self.sequences = torch.FloatTensor(sequences)
+        self.sequences = [torch.FloatTensor(np.asarray(seq, dtype=np.float32)) for seq in sequences]
+        self.lengths = [len(seq) for seq in self.sequences]
         self.labels = torch.LongTensor(labels) if labels is not None else None
         
     def __len__(self):
@@ -30,6 +40,27 @@ class TennisPoseDataset(Dataset):
             return self.sequences[idx], self.labels[idx]
         return self.sequences[idx]
 
+def collate_padded(batch):
+    """(シーケンス, ラベル) のリストを 0 埋めしたバッチ・各クリップの長さ・ラベルにまとめる"""
+    sequences, labels = zip(*batch)
+    lengths = torch.LongTensor([len(seq) for seq in sequences])
+    return pad_sequence(list(sequences), batch_first=True), lengths, torch.stack(labels)
+
+class LengthBucketSampler(Sampler):
+    """長さの近いクリップを同じバッチにまとめ、パディングを最小限にするバッチサンプラー"""
+    def __init__(self, lengths, batch_size, max_spread=LENGTH_BUCKET_SPREAD, shuffle=True, seed=None):
+        self.lengths = list(lengths)
+        self.batch_size = batch_size
+        self.max_spread = max_spread
+        self.rng = np.random.default_rng(seed) if shuffle else None
+
+    def __iter__(self):
+        for batch in length_buckets(self.lengths, self.batch_size, max_spread=self.max_spread, rng=self.rng):
+            yield batch.tolist()
+
+    def __len__(self):
+        return len(length_buckets(self.lengths, self.batch_size, max_spread=self.max_spread))
+
 class DataAugmentation:
     """テニスポーズデータの拡張クラス"""
     
@@ -321,12 +352,18 @@ class AugmentedLSTM(nn.Module):
             nn.Linear(32, num_classes)
         )
         
-    def forward(self, x):
-        # LSTMの出力
-        lstm_out, (hidden, cell) = self.lstm(x)
-        
-        # 最後のタイムステップの出力を使用
-        last_output = lstm_out[:, -1, :]
+    def forward(self, x, lengths=None):
+        if lengths is None:
+            # LSTMの出力
+            lstm_out, (hidden, cell) = self.lstm(x)
+            
+            # 最後のタイムステップの出力を使用
+            last_output = lstm_out[:, -1, :]
+        else:
+            # 0 埋めしたバッチは pack して、各クリップの最終フレームの隠れ状態を使う
+            packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            _, (hidden, cell) = self.lstm(packed)
+            last_output = hidden[-1]
         
         # 全結合層
         output = self.fc(last_output)
@@ -335,18 +372,22 @@ class AugmentedLSTM(nn.Module):
 
 class AugmentedTennisPoseTrainer:
     """データ拡張対応テニスポーズLSTMモデルの訓練クラス"""
-    def __init__(self, data_path, target_samples_per_player=18, device=None):
+    def __init__(self, data_path, target_samples_per_player=18, device=None, length_mode='crop'):
         self.data_path = data_path
         self.device = device if device else torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.scaler = StandardScaler()
         # Cleaned_data/players 配下の構成に合わせてプレイヤーを拡張
         self.players = ['Djo', 'Fed', 'Kei', 'Alc']
-        self.sequence_length = 48
+        self.sequence_length = SEQUENCE_LENGTH
         self.n_features = 24
         self.target_samples = target_samples_per_player
+        # full: 全フレームをそのまま使う / phases: フェーズ位置を揃えて48フレームへ再サンプル / crop: 48フレームに切り出し
+        # 推論側（infer_similarity.DEFAULT_LENGTH_MODE）と同じ crop が既定。変える場合は推論時も --length-mode を揃える
+        self.length_mode = length_mode
         
         print(f"使用デバイス: {self.device}")
         print(f"目標サンプル数/選手: {self.target_samples}")
+        print(f"シーケンス長モード: {self.length_mode}")
         
     def load_and_augment_data(self):
         """データを読み込んで拡張"""
@@ -369,15 +410,15 @@ class AugmentedTennisPoseTrainer:
                 seq_path = os.path.join(player_path, seq_dir)
                 if os.path.isdir(seq_path):
                     csv_file = os.path.join(seq_path, 'keypoints_with_tracks.csv')
-                    if os.path.exists(csv_file):
-                        df = pd.read_csv(csv_file)
-                        df_clean = df[~df["frame_name"].str.contains(r"\(1\)", na=False)]
-                        keypoint_cols = [col for col in df_clean.columns if col.startswith('kpt_')]
-                        sequence = df_clean[keypoint_cols].values
+                    if keypoints_exist(csv_file):
+                        # (1)を含むフレームを除外（.npz があれば DataFrame を作らずに配列で読む）
+                        sequence = load_keypoint_arrays(csv_file).exclude_frames("(1)").keypoints
+                        if len(sequence) == 0:
+                            continue
                         
-                        if len(sequence) == self.sequence_length:
-                            sequences.append(sequence)
-                            seq_meta.append({"player": player, "clip": seq_dir, "origin": "orig"})
+                        # 48フレーム以外のクリップも捨てずに使う（長さの扱いは length_mode に従う）
+                        sequences.append(fit_length_mode(sequence, self.length_mode, self.sequence_length))
+                        seq_meta.append({"player": player, "clip": seq_dir, "origin": "orig", "frames": len(sequence)})
             
             print(f"  元データ: {len(sequences)} シーケンス")
             
@@ -483,7 +524,8 @@ class AugmentedTennisPoseTrainer:
             all_meta.extend(meta_list)
             player_stats[player] = { 'final': len(sequences) }
         
-        X = np.array(all_data)
+        # クリップごとに長さが異なるため、X は (フレーム数, 特徴量) 配列のリスト
+        X = all_data
         y = np.array(all_labels)
         
         # クリップ正規化済みなので、ここでの標準化は不実施（必要ならコメント解除）
@@ -492,7 +534,8 @@ class AugmentedTennisPoseTrainer:
         # X_normalized = self.scaler.fit_transform(X_flat)
         # X = X_normalized.reshape(n_sequences, n_frames, n_features)
         
-        print(f"\n全データ: {X.shape}")
+        lengths = [len(seq) for seq in X]
+        print(f"\n全データ: {len(X)} シーケンス（{min(lengths, default=0)}〜{max(lengths, default=0)} フレーム）")
         for i, player in enumerate(self.players):
             count = np.sum(y == i)
             print(f"  {player}: {count} シーケンス")
@@ -509,8 +552,10 @@ class AugmentedTennisPoseTrainer:
         
         train_dataset = TennisPoseDataset(X_train, y_train)
         test_dataset = TennisPoseDataset(X_test, y_test)
-        train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True)
-        test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False)
+        # 学習は長さの近いクリップ同士でバッチを組む。評価は meta_test と順序を合わせるため元の順序のまま
+        train_loader = DataLoader(train_dataset, batch_sampler=LengthBucketSampler(train_dataset.lengths, 16, seed=42),
+                                  collate_fn=collate_padded)
+        test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False, collate_fn=collate_padded)
         
         # LSTMハイパーパラメータ調整
         model = AugmentedLSTM(
@@ -549,10 +594,10 @@ class AugmentedTennisPoseTrainer:
             train_loss = 0
             train_correct = 0
             train_total = 0
-            for batch_x, batch_y in train_loader:
+            for batch_x, batch_lengths, batch_y in train_loader:
                 batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
                 optimizer.zero_grad()
-                outputs = model(batch_x)
+                outputs = model(batch_x, batch_lengths)
                 loss = criterion(outputs, batch_y)
                 loss.backward()
                 optimizer.step()
@@ -566,9 +611,9 @@ class AugmentedTennisPoseTrainer:
             val_correct = 0
             val_total = 0
             with torch.no_grad():
-                for batch_x, batch_y in test_loader:
+                for batch_x, batch_lengths, batch_y in test_loader:
                     batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
-                    outputs = model(batch_x)
+                    outputs = model(batch_x, batch_lengths)
                     loss = criterion(outputs, batch_y)
                     val_loss += loss.item()
                     _, predicted = torch.max(outputs.data, 1)
@@ -612,9 +657,9 @@ class AugmentedTennisPoseTrainer:
         per_sample = []
         with torch.no_grad():
             test_seen = 0
-            for batch_x, batch_y in test_loader:
+            for batch_x, batch_lengths, batch_y in test_loader:
                 batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
-                outputs = model(batch_x)
+                outputs = model(batch_x, batch_lengths)
                 loss_vec = nn.functional.cross_entropy(outputs, batch_y, reduction='none')
                 _, predicted = torch.max(outputs.data, 1)
                 for i_in_batch in range(batch_y.size(0)):
@@ -692,7 +737,7 @@ class AugmentedTennisPoseTrainer:
         
         # 学習時と同じ前処理（クリップ内で完結: 重心平行移動＋スケール正規化）
         seq_norm = DataAugmentation.normalize_sequence_center_scale(sequence)
-        sequence_tensor = torch.FloatTensor(seq_norm).reshape(1, self.sequence_length, self.n_features).to(self.device)
+        sequence_tensor = torch.FloatTensor(seq_norm).reshape(1, len(seq_norm), self.n_features).to(self.device)
         
         # 予測
         with torch.no_grad():
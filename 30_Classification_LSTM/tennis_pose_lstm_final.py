@@ -1,6 +1,6 @@
-import pandas as pd
 import numpy as np
 import os
+import sys
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -13,6 +13,10 @@ import seaborn as sns
 import warnings
 warnings.filterwarnings('ignore')
 
+# pose_analysis（共通のキーポイントローダー）をインポートできるようにプロジェクトルートを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pose_analysis.keypoint_store import keypoints_exist, load_keypoint_arrays
+
 # 日本語フォント設定
 plt.rcParams['font.family'] = 'DejaVu Sans'
 
@@ -90,13 +94,9 @@ class TennisPoseLSTMTrainer:
                 seq_path = os.path.join(player_path, seq_dir)
                 if os.path.isdir(seq_path):
                     csv_file = os.path.join(seq_path, 'keypoints_with_tracks.csv')
-                    if os.path.exists(csv_file):
-                        df = pd.read_csv(csv_file)
-                        
-                        # (1)を含むフレームを除外
-                        df_clean = df[~df["frame_name"].str.contains(r"\(1\)", na=False)]
-                        keypoint_cols = [col for col in df_clean.columns if col.startswith('kpt_')]
-                        sequence = df_clean[keypoint_cols].values
+                    if keypoints_exist(csv_file):
+                        # (1)を含むフレームを除外（.npz があれば DataFrame を作らずに配列で読む）
+                        sequence = load_keypoint_arrays(csv_file).exclude_frames("(1)").keypoints
                         
                         # 48フレームのシーケンスのみを使用
                         if len(sequence) == self.sequence_length:
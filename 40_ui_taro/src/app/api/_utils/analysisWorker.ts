@@ -0,0 +1,65 @@
+/**
+ * Client for the persistent Python analysis worker (src/pages/analysis_worker.py).
+ *
+ * The worker keeps torch/pandas imported and the LSTM/YOLO weights loaded, so
+ * routes should try it first and only spawn a one-off Python process when it
+ * is not running.
+ */
+
+const DEFAULT_WORKER_URL = 'http://127.0.0.1:8765';
+
+export class AnalysisWorkerError extends Error {}
+
+export function getAnalysisWorkerUrl(): string {
+  return process.env.ANALYSIS_WORKER_URL || DEFAULT_WORKER_URL;
+}
+
+/**
+ * Call a worker method.
+ *
+ * Resolves to `null` when the worker is unreachable (so the caller can fall back
+ * to spawning Python) and throws `AnalysisWorkerError` when the worker ran the
+ * method but it failed.
+ */
+export async function callAnalysisWorker<T = any>(
+  method: string,
+  params: Record<string, unknown>,
+  timeoutMs = 120000,
+): Promise<T | null> {
+  if (process.env.ANALYSIS_WORKER_DISABLED === '1') {
+    return null;
+  }
+
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), timeoutMs);
+
+  let response: Response;
+  try {
+    response = await fetch(getAnalysisWorkerUrl(), {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ method, params }),
+      signal: controller.signal,
+    });
+  } catch (error) {
+    if (controller.signal.aborted) {
+      throw new AnalysisWorkerError(`analysis worker timed out after ${timeoutMs}ms (${method})`);
+    }
+    console.warn(`[worker] unavailable, falling back to spawn (${method})`);
+    return null;
+  } finally {
+    clearTimeout(timer);
+  }
+
+  let payload: any;
+  try {
+    payload = await response.json();
+  } catch {
+    throw new AnalysisWorkerError(`analysis worker returned invalid JSON (${method})`);
+  }
+
+  if (!response.ok || payload?.error) {
+    throw new AnalysisWorkerError(payload?.error || `analysis worker failed with status ${response.status}`);
+  }
+  return payload.result as T;
+}
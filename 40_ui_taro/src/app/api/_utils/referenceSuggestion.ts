@@ -10,8 +10,20 @@ export type ReferenceSuggestion = {
   previewImagePath?: string;
   frameDirRelative?: string;
   slug: string;
+  /** Cosine similarity of the clip embedding to the user's (embedding index suggestions only). */
+  score?: number;
 };
 
+/** One entry of `nearest` returned by infer_similarity.py (`--top-k` / worker `topK`). */
+export type NearestReference = {
+  player: string;
+  csv_path: string;
+  score: number;
+};
+
+/** Number of closest reference clips requested from the embedding index. */
+export const REFERENCE_SUGGESTION_TOP_K = 5;
+
 const IMAGE_EXTENSIONS = new Set(['.jpg', '.jpeg', '.png']);
 
 async function directoryExists(target: string): Promise<boolean> {
@@ -151,47 +163,77 @@ export async function buildReferenceSuggestions(
     if (!(await fileExists(csvPath))) {
       continue;
     }
+    suggestions.push(await buildSuggestionForClip(player, clipDir, projectRoot, publicDir));
+  }
 
-    const clipName = path.basename(clipDir);
-    const slug = makeSlug(player, clipName);
-
-    const frameDirCandidates = [
-      path.join(projectRoot, 'frames', 'Cleaned_Data', 'players', player, clipName),
-      path.join(projectRoot, 'frames', 'players', player, clipName),
-    ];
+  return suggestions;
+}
 
-    let previewImagePath: string | undefined;
-    let frameDirRelative: string | undefined;
+async function buildSuggestionForClip(
+  player: string,
+  clipDir: string,
+  projectRoot: string,
+  publicDir: string,
+): Promise<ReferenceSuggestion> {
+  const csvPath = path.join(clipDir, 'keypoints_with_tracks.csv');
+  const clipName = path.basename(clipDir);
+  const slug = makeSlug(player, clipName);
+
+  const frameDirCandidates = [
+    path.join(projectRoot, 'frames', 'Cleaned_Data', 'players', player, clipName),
+    path.join(projectRoot, 'frames', 'players', player, clipName),
+  ];
 
-    for (const frameDir of frameDirCandidates) {
-      if (!(await directoryExists(frameDir))) {
-        continue;
-      }
-      const firstImage = await findFirstImage(frameDir);
-      if (!firstImage) {
-        continue;
-      }
+  let previewImagePath: string | undefined;
+  let frameDirRelative: string | undefined;
 
-      const ext = path.extname(firstImage).toLowerCase();
-      const sanitizedName = `${slug}_preview${ext}`;
-      const copied = await ensurePreviewCopy(firstImage, publicDir, sanitizedName);
-      if (copied) {
-        previewImagePath = `/pose-reference/${sanitizedName}`;
-      }
-      frameDirRelative = toPosixRelative(projectRoot, frameDir);
-      break;
+  for (const frameDir of frameDirCandidates) {
+    if (!(await directoryExists(frameDir))) {
+      continue;
+    }
+    const firstImage = await findFirstImage(frameDir);
+    if (!firstImage) {
+      continue;
     }
 
-    suggestions.push({
-      player,
-      clipName,
-      csvPath,
-      csvPathRelative: toPosixRelative(projectRoot, csvPath),
-      previewImagePath,
-      frameDirRelative,
-      slug,
-    });
+    const ext = path.extname(firstImage).toLowerCase();
+    const sanitizedName = `${slug}_preview${ext}`;
+    const copied = await ensurePreviewCopy(firstImage, publicDir, sanitizedName);
+    if (copied) {
+      previewImagePath = `/pose-reference/${sanitizedName}`;
+    }
+    frameDirRelative = toPosixRelative(projectRoot, frameDir);
+    break;
   }
 
+  return {
+    player,
+    clipName,
+    csvPath,
+    csvPathRelative: toPosixRelative(projectRoot, csvPath),
+    previewImagePath,
+    frameDirRelative,
+    slug,
+  };
+}
+
+/**
+ * Suggestions for specific clips picked by the embedding index (`similarity.nearest`),
+ * best first. No directory walk: only the listed clips are looked up.
+ */
+export async function buildSuggestionsFromNearest(
+  nearest: NearestReference[],
+  projectRoot: string,
+  publicDir: string,
+): Promise<ReferenceSuggestion[]> {
+  const suggestions: ReferenceSuggestion[] = [];
+  for (const match of nearest) {
+    const csvPath = path.join(projectRoot, ...match.csv_path.split('/'));
+    if (!(await fileExists(csvPath))) {
+      continue;
+    }
+    const suggestion = await buildSuggestionForClip(match.player, path.dirname(csvPath), projectRoot, publicDir);
+    suggestions.push({ ...suggestion, score: match.score });
+  }
   return suggestions;
 }
@@ -4,7 +4,13 @@ import path from 'path';
 import fs from 'fs/promises';
 import fsSync from 'fs';
 
-import { buildReferenceSuggestions, makeSlug } from '../_utils/referenceSuggestion';
+import { callAnalysisWorker } from '../_utils/analysisWorker';
+import {
+  REFERENCE_SUGGESTION_TOP_K,
+  buildReferenceSuggestions,
+  buildSuggestionsFromNearest,
+  makeSlug,
+} from '../_utils/referenceSuggestion';
 import { getProjectRoot, resolvePythonCommand } from '../_utils/python';
 
 async function directoryExists(target: string): Promise<boolean> {
@@ -132,28 +138,47 @@ export async function POST(request: NextRequest): Promise<Response> {
                   console.log('API: 動画ファイル存在OK');
                   // 2) クリップ名を抽出し、単体YOLOを実行
                   clipName = path.basename(absVideo, path.extname(absVideo));
-                  const singleRunner = path.join(projectRoot, '22_Joint_Detection_YOLO', 'run_yolo_single.py');
-                  const singleArgs = [singleRunner, '--clip-name', clipName, '--player', 'User', '--video', absVideo, '--run-active-track'];
-                  console.log('API: run_yolo_single 実行:', pythonCmd, singleArgs.join(' '));
-                  const pySingle = spawn(pythonCmd, singleArgs);
-                  let srOut = '';
-                  let srErr = '';
-                  pySingle.stdout.on('data', (d) => {
-                    const s = d.toString();
-                    srOut += s;
-                    for (const line of s.split(/\r?\n/)) {
-                      if (line) console.log('[single][stdout]', line);
-                    }
-                  });
-                  pySingle.stderr.on('data', (d) => {
-                    const s = d.toString();
-                    srErr += s;
-                    for (const line of s.split(/\r?\n/)) {
-                      if (line) console.warn('[single][stderr]', line);
+                  // 常駐ワーカーがあればロード済みの YOLO で処理し、無ければ run_yolo_single.py を spawn
+                  // 動画は同一プロセスでデコード（フレームJPEGはUI表示用にのみ保存）
+                  let handledByWorker = false;
+                  try {
+                    const workerRun = await callAnalysisWorker<{ code: number }>(
+                      'run_yolo_single',
+                      { clipName, player: 'User', video: absVideo, runActiveTrack: true, stream: true, saveFrames: true },
+                      300000,
+                    );
+                    if (workerRun) {
+                      handledByWorker = true;
+                      console.log('API: run_yolo_single (worker) 終了コード:', workerRun.code);
                     }
-                  });
-                  await new Promise<void>((res) => pySingle.on('close', () => res()));
-                  console.log('API: run_yolo_single 終了。stdout bytes:', Buffer.byteLength(srOut, 'utf8'), 'stderr bytes:', Buffer.byteLength(srErr, 'utf8'));
+                  } catch (workerErr) {
+                    handledByWorker = true;
+                    console.warn('API: run_yolo_single (worker) 失敗:', workerErr);
+                  }
+                  if (!handledByWorker) {
+                    const singleRunner = path.join(projectRoot, '22_Joint_Detection_YOLO', 'run_yolo_single.py');
+                    const singleArgs = [singleRunner, '--clip-name', clipName, '--player', 'User', '--video', absVideo, '--run-active-track', '--stream', '--save-frames'];
+                    console.log('API: run_yolo_single 実行:', pythonCmd, singleArgs.join(' '));
+                    const pySingle = spawn(pythonCmd, singleArgs);
+                    let srOut = '';
+                    let srErr = '';
+                    pySingle.stdout.on('data', (d) => {
+                      const s = d.toString();
+                      srOut += s;
+                      for (const line of s.split(/\r?\n/)) {
+                        if (line) console.log('[single][stdout]', line);
+                      }
+                    });
+                    pySingle.stderr.on('data', (d) => {
+                      const s = d.toString();
+                      srErr += s;
+                      for (const line of s.split(/\r?\n/)) {
+                        if (line) console.warn('[single][stderr]', line);
+                      }
+                    });
+                    await new Promise<void>((res) => pySingle.on('close', () => res()));
+                    console.log('API: run_yolo_single 終了。stdout bytes:', Buffer.byteLength(srOut, 'utf8'), 'stderr bytes:', Buffer.byteLength(srErr, 'utf8'));
+                  }
                 } catch {}
               }
 
@@ -203,38 +228,45 @@ export async function POST(request: NextRequest): Promise<Response> {
                 const modelPath = path.join(projectRoot, '30_Classification_LSTM', 'best_augmented_model.pth');
                 let similarity: any = null;
                 if (csvCandidate) {
-                const inferPath = path.join(projectRoot, '30_Classification_LSTM', 'infer_similarity.py');
-                const inferArgs = [inferPath, '--csv', csvCandidate, '--model', modelPath];
-                console.log('API: infer_similarity 実行:', pythonCmd, inferArgs.join(' '));
-                const py2 = spawn(pythonCmd, inferArgs);
-                let out2 = '';
-                let err2 = '';
-                py2.stdout.on('data', (d) => {
-                  const s = d.toString();
-                  out2 += s;
-                  for (const line of s.split(/\r?\n/)) {
-                    if (line) console.log('[infer][stdout]', line);
-                  }
-                });
-                py2.stderr.on('data', (d) => {
-                  const s = d.toString();
-                  err2 += s;
-                  for (const line of s.split(/\r?\n/)) {
-                    if (line) console.warn('[infer][stderr]', line);
-                  }
-                });
-                await new Promise<void>((res2) => py2.on('close', () => res2()));
-                try { similarity = JSON.parse(out2); } catch {}
-                if (!similarity) similarity = { error: 'parse_failed', raw: out2 };
+                try {
+                  similarity = await callAnalysisWorker('infer_similarity', { csv: csvCandidate, model: modelPath, topK: REFERENCE_SUGGESTION_TOP_K });
+                } catch (workerErr) {
+                  similarity = { error: 'worker_failed', details: workerErr instanceof Error ? workerErr.message : String(workerErr) };
+                }
+                if (!similarity) {
+                  const inferPath = path.join(projectRoot, '30_Classification_LSTM', 'infer_similarity.py');
+                  const inferArgs = [inferPath, '--csv', csvCandidate, '--model', modelPath, '--top-k', String(REFERENCE_SUGGESTION_TOP_K)];
+                  console.log('API: infer_similarity 実行:', pythonCmd, inferArgs.join(' '));
+                  const py2 = spawn(pythonCmd, inferArgs);
+                  let out2 = '';
+                  let err2 = '';
+                  py2.stdout.on('data', (d) => {
+                    const s = d.toString();
+                    out2 += s;
+                    for (const line of s.split(/\r?\n/)) {
+                      if (line) console.log('[infer][stdout]', line);
+                    }
+                  });
+                  py2.stderr.on('data', (d) => {
+                    const s = d.toString();
+                    err2 += s;
+                    for (const line of s.split(/\r?\n/)) {
+                      if (line) console.warn('[infer][stderr]', line);
+                    }
+                  });
+                  await new Promise<void>((res2) => py2.on('close', () => res2()));
+                  try { similarity = JSON.parse(out2); } catch {}
+                  if (!similarity) similarity = { error: 'parse_failed', raw: out2 };
+                  if (err2) console.warn('infer stderr (bytes):', Buffer.byteLength(err2, 'utf8'));
+                }
 
                 let referenceSuggestions: any[] | null = null;
                 if (similarity && similarity.top1 && similarity.top1.player) {
                   try {
-                    const suggestions = await buildReferenceSuggestions(
-                      similarity.top1.player,
-                      projectRoot,
-                      previewOutputDir,
-                    );
+                    // 埋め込み索引があれば近い参照クリップを直接使い、無ければ top1 選手のクリップを列挙する
+                    const suggestions = Array.isArray(similarity.nearest) && similarity.nearest.length > 0
+                      ? await buildSuggestionsFromNearest(similarity.nearest, projectRoot, previewOutputDir)
+                      : await buildReferenceSuggestions(similarity.top1.player, projectRoot, previewOutputDir);
                     if (suggestions.length > 0) {
                       referenceSuggestions = suggestions.map((item) => ({
                         ...item,
@@ -259,7 +291,6 @@ export async function POST(request: NextRequest): Promise<Response> {
                   }
                 }
 
-                if (err2) console.warn('infer stderr (bytes):', Buffer.byteLength(err2, 'utf8'));
                 resolve(NextResponse.json({ ...parsed, similarity, referenceSuggestions, userCsv: userCsvRelative, userClip: userClipInfo }));
                 return;
               }
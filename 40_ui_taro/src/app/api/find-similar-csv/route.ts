@@ -2,9 +2,11 @@ import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
 
+import { callAnalysisWorker } from '../_utils/analysisWorker';
+
 export async function POST(request: NextRequest): Promise<Response> {
   try {
-    const { userCsv, playerName } = await request.json();
+    const { userCsv, playerName, topK, method } = await request.json();
 
     if (!userCsv || !playerName) {
       return NextResponse.json(
@@ -13,6 +15,20 @@ export async function POST(request: NextRequest): Promise<Response> {
       );
     }
 
+    // 常駐ワーカーが起動していればそちらで処理（モデル・データのロード済み）
+    try {
+      const workerResult = await callAnalysisWorker('find_similar_csv', { userCsv, playerName, topK, method });
+      if (workerResult) {
+        return NextResponse.json(workerResult);
+      }
+    } catch (workerError) {
+      console.error('Analysis worker error:', workerError);
+      return NextResponse.json(
+        { success: false, error: `Analysis worker failed: ${workerError instanceof Error ? workerError.message : workerError}` },
+        { status: 500 }
+      );
+    }
+
     // Pythonスクリプトのパス
     const scriptPath = path.join(process.cwd(), 'src', 'pages', 'csv_similarity_calculator.py');
     
@@ -56,7 +72,7 @@ export async function POST(request: NextRequest): Promise<Response> {
       });
 
       // 入力データを送信
-      python.stdin.write(JSON.stringify({ userCsv, playerName }));
+      python.stdin.write(JSON.stringify({ userCsv, playerName, topK, method }));
       python.stdin.end();
     });
 
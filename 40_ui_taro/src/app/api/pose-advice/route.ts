@@ -2,10 +2,26 @@ import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
 
+import { callAnalysisWorker } from '../_utils/analysisWorker';
+
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
 
+    // 常駐ワーカーが起動していればそちらで処理（モデル・データのロード済み）
+    try {
+      const workerResult = await callAnalysisWorker('pose_advice', body);
+      if (workerResult) {
+        return NextResponse.json(workerResult);
+      }
+    } catch (workerError) {
+      console.error('Analysis worker error:', workerError);
+      return NextResponse.json(
+        { success: false, error: `Analysis worker failed: ${workerError instanceof Error ? workerError.message : workerError}` },
+        { status: 500 }
+      );
+    }
+
     // Pythonスクリプトのパス
     const scriptPath = path.join(process.cwd(), 'src', 'pages', 'pose_advice_api.py');
     
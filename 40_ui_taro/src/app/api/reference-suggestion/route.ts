@@ -3,7 +3,13 @@ import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs/promises';
 
-import { buildReferenceSuggestions, makeSlug } from '../_utils/referenceSuggestion';
+import { callAnalysisWorker } from '../_utils/analysisWorker';
+import {
+  REFERENCE_SUGGESTION_TOP_K,
+  buildReferenceSuggestions,
+  buildSuggestionsFromNearest,
+  makeSlug,
+} from '../_utils/referenceSuggestion';
 import { getProjectRoot, resolvePythonCommand } from '../_utils/python';
 
 export async function POST(request: NextRequest) {
@@ -39,41 +45,54 @@ export async function POST(request: NextRequest) {
     const inferPath = path.join(projectRoot, '30_Classification_LSTM', 'infer_similarity.py');
     const modelPath = path.join(projectRoot, '30_Classification_LSTM', 'best_augmented_model.pth');
 
-    const inferArgs = [inferPath, '--csv', csvPath, '--model', modelPath];
-    const py = spawn(pythonCmd, inferArgs);
-
-    let stdout = '';
-    let stderr = '';
-
-    py.stdout.on('data', (d) => {
-      stdout += d.toString();
-    });
-    py.stderr.on('data', (d) => {
-      stderr += d.toString();
-    });
-
-    await new Promise<void>((resolve) => py.on('close', () => resolve()));
-
-    if (!stdout) {
-      return NextResponse.json({
-        success: false,
-        error: 'infer_similarity.py からの出力が空でした',
-        stderr,
-      }, { status: 500 });
-    }
-
+    // 常駐ワーカーが起動していればロード済みのモデルで推論し、無ければ従来どおり spawn する
     let similarity: any = null;
     try {
-      similarity = JSON.parse(stdout);
+      similarity = await callAnalysisWorker('infer_similarity', { csv: csvPath, model: modelPath, topK: REFERENCE_SUGGESTION_TOP_K });
     } catch (error) {
       return NextResponse.json({
         success: false,
-        error: '類似度推論結果のパースに失敗しました',
-        raw: stdout,
-        stderr,
+        error: '類似度推論に失敗しました',
+        details: error instanceof Error ? error.message : String(error),
       }, { status: 500 });
     }
 
+    if (!similarity) {
+      const inferArgs = [inferPath, '--csv', csvPath, '--model', modelPath, '--top-k', String(REFERENCE_SUGGESTION_TOP_K)];
+      const py = spawn(pythonCmd, inferArgs);
+
+      let stdout = '';
+      let stderr = '';
+
+      py.stdout.on('data', (d) => {
+        stdout += d.toString();
+      });
+      py.stderr.on('data', (d) => {
+        stderr += d.toString();
+      });
+
+      await new Promise<void>((resolve) => py.on('close', () => resolve()));
+
+      if (!stdout) {
+        return NextResponse.json({
+          success: false,
+          error: 'infer_similarity.py からの出力が空でした',
+          stderr,
+        }, { status: 500 });
+      }
+
+      try {
+        similarity = JSON.parse(stdout);
+      } catch (error) {
+        return NextResponse.json({
+          success: false,
+          error: '類似度推論結果のパースに失敗しました',
+          raw: stdout,
+          stderr,
+        }, { status: 500 });
+      }
+    }
+
     if (!similarity || !similarity.top1 || !similarity.top1.player) {
       return NextResponse.json({
         success: false,
@@ -84,11 +103,10 @@ export async function POST(request: NextRequest) {
 
     let referenceSuggestions: any[] | null = null;
     try {
-      const suggestions = await buildReferenceSuggestions(
-        similarity.top1.player,
-        projectRoot,
-        previewOutputDir,
-      );
+      // 埋め込み索引があれば近い参照クリップを直接使い、無ければ top1 選手のクリップを列挙する
+      const suggestions = Array.isArray(similarity.nearest) && similarity.nearest.length > 0
+        ? await buildSuggestionsFromNearest(similarity.nearest, projectRoot, previewOutputDir)
+        : await buildReferenceSuggestions(similarity.top1.player, projectRoot, previewOutputDir);
       if (suggestions.length > 0) {
         referenceSuggestions = suggestions.map((item) => ({
           ...item,
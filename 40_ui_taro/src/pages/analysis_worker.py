@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""常駐型の解析ワーカー（localhost JSON-RPC）
+
+Next.js の各APIルートはリクエストごとに Python を spawn していたため、毎回
+torch/pandas の import と LSTM・YOLO の重みロードが発生していた。このワーカーは
+それらを一度だけロードして保持し、HTTP POST で以下のメソッドを提供する。
+
+    infer_similarity   {csv, model?, device?, topK?, runtime?, lengthMode?}
+                                                             -> infer_similarity.infer の結果（topK で近い参照クリップも返す）
+    infer_similarity_batch {csvs, model?, device?, topK?, runtime?, lengthMode?}
+                                                             -> 各 CSV の infer 結果のリスト（1回のバッチ推論。読めない CSV は {csv, error}）
+    pose_advice        {userCsv, referenceCsv?, referencePlayer?, topK?, angleDtw?}
+                                                             -> pose_advice_api.process_pose_advice の結果（referencePlayer で角度系列 DTW の近い参照、angleDtw でフェーズ別の角度差も返す）
+    find_similar_csv   {userCsv, playerName, topK?, method?} -> csv_similarity_calculator.handle_request の結果
+    run_yolo_single    {clipName, player?, video?, runActiveTrack?, stream?, saveFrames?, saveFrameCsvs?, visualize?}
+                                                             -> {"code": 終了コード}
+    render_visualization {framesDir, keypoints, outputDir, start?, end?}
+                                                             -> {"images": [プロジェクトルート相対パス]}
+
+リクエスト:  POST /  {"method": "...", "params": {...}}
+レスポンス:  {"result": ...}  または  {"error": "..."}（HTTP 500）
+死活監視:    GET /health
+
+起動例:
+    python3 src/pages/analysis_worker.py --port 8765
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PAGES_DIR = Path(__file__).resolve().parent
+project_root = PAGES_DIR.parent.parent.parent
+for extra in (project_root, project_root / "22_Joint_Detection_YOLO", project_root / "30_Classification_LSTM", PAGES_DIR):
+    if str(extra) not in sys.path:
+        sys.path.insert(0, str(extra))
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MODEL_PATH = project_root / "30_Classification_LSTM" / "best_augmented_model.pth"
+
+
+def _project_path(value, key):
+    """プロジェクトルート相対のパスを解決する。絶対パスや .. でルートの外を指す場合は拒否する"""
+    path = (project_root / str(value)).resolve()
+    if not path.is_relative_to(project_root):
+        raise ValueError(f"{key} must stay inside the project directory: {value}")
+    return path
+
+
+class AnalysisWorker:
+    """モデルと参照データを保持し、各メソッドを同一プロセス内で実行する"""
+
+    def __init__(self):
+        self._extractor = None
+        # YOLO はスレッドセーフではないため直列化する（LSTM は SimilarityInferencer 側で直列化）
+        self._yolo_lock = threading.Lock()
+
+    def _get_inferencer(self, params):
+        import infer_similarity
+
+        # (モデルパス, デバイス, ランタイム, 長さモード) ごとにプロセス内で1度だけロードされ、重みファイルが更新されたら読み直す
+        model_path = params.get("model") or str(DEFAULT_MODEL_PATH)
+        runtime = params.get("runtime") or infer_similarity.DEFAULT_RUNTIME
+        length_mode = params.get("lengthMode") or infer_similarity.DEFAULT_LENGTH_MODE
+        return infer_similarity.SimilarityInferencer.for_model(model_path, params.get("device"), runtime, length_mode)
+
+    def preload(self):
+        self._get_inferencer({})
+
+    def infer_similarity(self, params):
+        csv_path = params.get("csv")
+        if not csv_path:
+            raise ValueError("csv is required")
+        return self._get_inferencer(params).predict(csv_path, top_k=int(params.get("topK") or 0))
+
+    def infer_similarity_batch(self, params):
+        csv_paths = params.get("csvs")
+        if not isinstance(csv_paths, list) or not csv_paths:
+            raise ValueError("csvs must be a non-empty list")
+        return self._get_inferencer(params).predict_batch(csv_paths, top_k=int(params.get("topK") or 0))
+
+    def pose_advice(self, params):
+        import pose_advice_api
+
+        return pose_advice_api.process_pose_advice(params)
+
+    def find_similar_csv(self, params):
+        import csv_similarity_calculator
+
+        return csv_similarity_calculator.handle_request(params)
+
+    def run_yolo_single(self, params):
+        import run_yolo_single
+        from pose_extractor import PoseExtractor, default_model_path
+
+        clip_name = params.get("clipName")
+        if not clip_name:
+            raise ValueError("clipName is required")
+        with self._yolo_lock:
+            if self._extractor is None:
+                os.environ.setdefault("YOLO_MODEL_PATH", str(project_root / "yolo11n-pose.pt"))
+                self._extractor = PoseExtractor(default_model_path())
+            code = run_yolo_single.process_single_clip(
+                clip_name,
+                player=params.get("player") or "User",
+                video=params.get("video"),
+                run_active_track=bool(params.get("runActiveTrack")),
+                extractor=self._extractor,
+                stream=bool(params.get("stream")),
+                save_frames=bool(params.get("saveFrames")),
+                save_frame_csvs=bool(params.get("saveFrameCsvs")),
+                visualize=bool(params.get("visualize")),
+            )
+        return {"code": code}
+
+    def render_visualization(self, params):
+        from render_visualization import render_clip_visualization
+
+        for key in ("framesDir", "keypoints", "outputDir"):
+            if not params.get(key):
+                raise ValueError(f"{key} is required")
+        frame_range = None
+        if params.get("start") is not None or params.get("end") is not None:
+            frame_range = (int(params.get("start") or 0), int(params.get("end") if params.get("end") is not None else 10**9))
+        written = render_clip_visualization(
+            _project_path(params["framesDir"], "framesDir"),
+            _project_path(params["keypoints"], "keypoints"),
+            _project_path(params["outputDir"], "outputDir"),
+            frame_range,
+        )
+        return {"images": [path.relative_to(project_root).as_posix() for path in written]}
+
+    def dispatch(self, method, params):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        return getattr(self, method)(params or {})
+
+
+METHODS = ("infer_similarity", "infer_similarity_batch", "pose_advice", "find_similar_csv", "run_yolo_single", "render_visualization")
+
+
+def make_handler(worker):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"ok": True, "methods": list(METHODS)})
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                result = worker.dispatch(request.get("method"), request.get("params"))
+                self._send_json(200, {"result": result})
+            except (Exception, SystemExit) as e:
+                # 依存モジュールの import 失敗時に sys.exit されてもワーカーは落とさない
+                traceback.print_exc()
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"[worker] {format % args}\n")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent analysis worker for the Next.js API routes")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--preload", action="store_true", help="Load the LSTM weights before accepting requests")
+    args = parser.parse_args()
+
+    worker = AnalysisWorker()
+    if args.preload and DEFAULT_MODEL_PATH.exists():
+        worker.preload()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(worker))
+    print(f"[worker] listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,14 +9,25 @@ project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 try:
-    from pose_analysis.comparison import compare_from_csv
-    from pose_analysis.pose_metrics import PoseMetrics
+    import numpy as np
+    from pose_analysis.metric_search import MetricSearch
+    from pose_analysis.pose_metrics import compute_pose_metrics
+    from pose_analysis.reference_index import ReferenceMetricsIndex
+    from pose_analysis.sequence_features import load_normalized_sequence
+    from pose_analysis.sequence_search import SequenceIndex
 except ImportError as e:
     print(json.dumps({"success": False, "error": f"Import error: {e}"}))
     sys.exit(1)
 
-def find_most_similar_csv(user_csv_path, player_name):
-    """指定されたプレイヤーのCSVファイルの中で最も類似度の高いものを検索"""
+SEARCH_METHODS = ("dtw", "metrics")
+
+
+def find_most_similar_csv(user_csv_path, player_name, top_k=1, weights=None, normalization="none", method="dtw"):
+    """指定されたプレイヤーのCSVファイルの中で最も類似度の高いものを検索（top_k 件の候補も返す）
+
+    method="dtw": 正規化済み 48x24 系列の DTW 距離（LB_Keogh で枝刈り）
+    method="metrics": トロフィー/インパクト時の4指標の重み付き L1 距離（weights/normalization を使用）
+    """
     try:
         # プレイヤーのCSVファイルディレクトリを検索
         players_dir = project_root / "pose_tracks" / "Cleaned_Data" / "players" / player_name
@@ -27,49 +38,46 @@ def find_most_similar_csv(user_csv_path, player_name):
                 "error": f"Player directory not found: {players_dir}"
             }
         
-        # プレイヤーディレクトリ内のCSVファイルを検索
-        csv_files = list(players_dir.glob("**/keypoints_with_tracks.csv"))
+        if method not in SEARCH_METHODS:
+            return {
+                "success": False,
+                "error": f"Unknown method: {method} (expected one of {', '.join(SEARCH_METHODS)})"
+            }
+        
+        if method == "dtw":
+            # 参照クリップの系列と包絡線は索引から取得（CSVが変わったものだけ再読み込みされる）
+            index = SequenceIndex.for_directory(players_dir)
+            found = index.search(load_normalized_sequence(user_csv_path), k=max(1, int(top_k)))
+            n_references = len(index)
+        else:
+            # 参照クリップのメトリクスは索引から取得（CSVが変わったものだけ再計算される）
+            index = ReferenceMetricsIndex.for_directory(players_dir)
+            references = index.entries()
+            # ユーザーのメトリクスは1回だけ計算し、全参照との距離（各メトリックの差分の絶対値の合計）を一括で求める
+            search = MetricSearch.from_metrics(references, weights=weights, normalization=normalization)
+            found = search.search(compute_pose_metrics(str(user_csv_path)), k=max(1, int(top_k))) if references else []
+            n_references = len(references)
+        for failed_path, error in index.errors().items():
+            print(f"Error comparing with {players_dir / failed_path}: {error}", file=sys.stderr)
         
-        if not csv_files:
+        if n_references == 0:
             return {
                 "success": False,
                 "error": f"No CSV files found for player: {player_name}"
             }
         
-        best_match = None
-        best_similarity = float('inf')  # 距離なので小さいほど良い
-        
-        # 各CSVファイルとの類似度を計算
-        for csv_file in csv_files:
-            try:
-                # 相対パスに変換
-                rel_path = csv_file.relative_to(project_root)
-                
-                # 類似度計算（絶対パスを使用）
-                result = compare_from_csv(str(user_csv_path), str(csv_file))
-                
-                if result:
-                    # PoseMetricDiffから類似度を計算（各メトリックの差分の絶対値の合計）
-                    similarity = (
-                        abs(result.trophy_knee_angle_diff) +
-                        abs(result.trophy_right_arm_extension_diff) +
-                        abs(result.trophy_left_arm_lift_diff) +
-                        (abs(result.impact_right_shoulder_angle_diff) if result.impact_right_shoulder_angle_diff is not None else 0)
-                    )
-                    
-                    if similarity < best_similarity:
-                        best_similarity = similarity
-                        best_match = {
-                            "csv_path": str(rel_path),
-                            "similarity": similarity,
-                            "player": player_name
-                        }
-                        
-            except Exception as e:
-                print(f"Error comparing with {csv_file}: {e}", file=sys.stderr)
-                continue
+        matches = [
+            {
+                "csv_path": str(match.path.relative_to(project_root)),
+                "similarity": match.distance,  # 距離なので小さいほど良い
+                "player": player_name,
+                "method": method
+            }
+            for match in found
+            if np.isfinite(match.distance)
+        ]
         
-        if best_match is None:
+        if not matches:
             return {
                 "success": False,
                 "error": "No valid comparisons could be made"
@@ -77,7 +85,8 @@ def find_most_similar_csv(user_csv_path, player_name):
         
         return {
             "success": True,
-            "best_match": best_match
+            "best_match": matches[0],
+            "matches": matches
         }
         
     except Exception as e:
@@ -86,26 +95,34 @@ def find_most_similar_csv(user_csv_path, player_name):
             "error": f"Error in similarity calculation: {e}"
         }
 
+def handle_request(input_data):
+    """stdin / ワーカー共通のリクエスト処理"""
+    user_csv = input_data.get('userCsv')
+    player_name = input_data.get('playerName')
+    
+    if not user_csv or not player_name:
+        return {"success": False, "error": "Missing userCsv or playerName"}
+    
+    # ユーザーCSVファイルの存在確認
+    user_csv_path = project_root / user_csv
+    if not user_csv_path.exists():
+        return {"success": False, "error": f"User CSV not found: {user_csv}"}
+    
+    # 類似度計算実行（topK: 代替候補の件数、method: dtw / metrics、weights/normalization: metrics 用の重みと正規化）
+    return find_most_similar_csv(
+        str(user_csv_path),
+        player_name,
+        top_k=input_data.get('topK') or 1,
+        weights=input_data.get('weights'),
+        normalization=input_data.get('normalization') or "none",
+        method=input_data.get('method') or "dtw",
+    )
+
 def main():
     try:
         # 標準入力からJSONデータを読み取り
         input_data = json.loads(sys.stdin.read())
-        user_csv = input_data.get('userCsv')
-        player_name = input_data.get('playerName')
-        
-        if not user_csv or not player_name:
-            print(json.dumps({"success": False, "error": "Missing userCsv or playerName"}))
-            return
-        
-        # ユーザーCSVファイルの存在確認
-        user_csv_path = project_root / user_csv
-        if not user_csv_path.exists():
-            print(json.dumps({"success": False, "error": f"User CSV not found: {user_csv}"}))
-            return
-        
-        # 類似度計算実行
-        result = find_most_similar_csv(str(user_csv_path), player_name)
-        print(json.dumps(result))
+        print(json.dumps(handle_request(input_data)))
         
     except Exception as e:
         print(json.dumps({"success": False, "error": f"Main error: {e}"}))
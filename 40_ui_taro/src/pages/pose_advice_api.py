@@ -9,28 +9,54 @@ project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 try:
-    from pose_analysis.comparison import compare_from_csv
+    from pose_analysis.angle_search import AngleSequenceIndex
+    from pose_analysis.comparison import compare_angle_sequences, compare_from_csv
     from pose_analysis.advice import generate_advice
     from pose_analysis.pose_metrics import compute_pose_metrics
 except ImportError as e:
     print(json.dumps({"success": False, "error": f"Import error: {e}"}))
     sys.exit(1)
 
+def find_angle_matches(user_csv_path, player_name, top_k=1):
+    """関節角度の時系列 DTW 距離で、指定プレイヤーの参照クリップから近いものを top_k 件返す"""
+    players_dir = project_root / "pose_tracks" / "Cleaned_Data" / "players" / player_name
+    if not players_dir.is_dir():
+        raise FileNotFoundError(f"Player directory not found: {players_dir}")
+    # 参照クリップの角度系列と包絡線は索引から取得（CSVが変わったものだけ再読み込みされる）
+    index = AngleSequenceIndex.for_directory(players_dir)
+    found = index.search(user_csv_path, k=max(1, int(top_k)))
+    for failed_path, error in index.errors().items():
+        print(f"Error loading angles of {players_dir / failed_path}: {error}", file=sys.stderr)
+    return [
+        {
+            "csv_path": str(match.path.relative_to(project_root)),
+            "distance": match.distance,  # 小さいほど良い
+            "player": player_name,
+        }
+        for match in found
+    ]
+
+
 def process_pose_advice(data):
-    """ポーズアドバイスを生成"""
+    """ポーズアドバイスを生成
+
+    referencePlayer を指定すると、そのプレイヤーの参照クリップを角度系列 DTW で検索して
+    angle_matches（topK 件）を返し、referenceCsv が無ければ最も近いクリップを参照に使う。
+    angleDtw を指定すると、参照との角度系列 DTW 比較（フェーズごとの平均差）も返す。
+    """
     try:
         user_csv = data.get('userCsv')
         reference_csv = data.get('referenceCsv')
+        reference_player = data.get('referencePlayer')
         
-        if not user_csv or not reference_csv:
+        if not user_csv or not (reference_csv or reference_player):
             return {
                 "success": False,
-                "error": "userCsv and referenceCsv are required"
+                "error": "userCsv and referenceCsv (or referencePlayer) are required"
             }
         
         # 絶対パスに変換
         user_csv_path = project_root / user_csv
-        reference_csv_path = project_root / reference_csv
         
         if not user_csv_path.exists():
             return {
@@ -38,6 +64,19 @@ def process_pose_advice(data):
                 "error": f"User CSV not found: {user_csv}"
             }
         
+        angle_matches = None
+        if reference_player:
+            angle_matches = find_angle_matches(str(user_csv_path), reference_player, data.get('topK') or 1)
+            if not reference_csv:
+                if not angle_matches:
+                    return {
+                        "success": False,
+                        "error": f"No comparable reference clips found for player: {reference_player}"
+                    }
+                reference_csv = angle_matches[0]["csv_path"]
+        
+        reference_csv_path = project_root / reference_csv
+        
         if not reference_csv_path.exists():
             return {
                 "success": False,
@@ -56,13 +95,26 @@ def process_pose_advice(data):
         # アドバイス生成
         advice = generate_advice(comparison_result)
         
-        return {
+        result = {
             "success": True,
+            "reference_csv": str(reference_csv),
             "user_metrics": comparison_result.user_metrics.__dict__ if hasattr(comparison_result, 'user_metrics') else {},
             "reference_metrics": comparison_result.reference_metrics.__dict__ if hasattr(comparison_result, 'reference_metrics') else {},
             "difference": comparison_result.difference.__dict__ if hasattr(comparison_result, 'difference') else {},
             "advice": [adv.__dict__ for adv in advice] if isinstance(advice, list) else [advice.__dict__]
         }
+        if angle_matches is not None:
+            result["angle_matches"] = angle_matches
+        if data.get('angleDtw'):
+            # 関節角度の時系列を DTW で対応付け、フェーズごとの平均差（ユーザー - 参照）を返す
+            sequence = compare_angle_sequences(str(user_csv_path), str(reference_csv_path))
+            result["sequence_comparison"] = {
+                "distance": sequence.distance,
+                "normalized_distance": sequence.normalized_distance,
+                "phase_bounds": {phase: list(bounds) for phase, bounds in sequence.phase_bounds.items()},
+                "phase_differences": sequence.phase_differences,
+            }
+        return result
         
     except Exception as e:
         return {
@@ -1,14 +1,60 @@
 
-from .pose_metrics import PoseMetrics, compute_pose_metrics
-from .comparison import PoseMetricDiff, compare_pose_metrics, compare_from_csv
-from .advice import AdviceFinding, generate_advice
+from .pose_metrics import PoseMetrics, PoseSequence, compute_pose_metrics, compute_pose_metrics_batch
+from .phases import ServePhases, detect_serve_phases, detect_serve_phases_many
+from .serve_detector import ServeSegment, StreamingServeDetector, detect_serve_segments
+from .comparison import (
+    PoseMetricDiff,
+    SequenceComparison,
+    compare_angle_sequences,
+    compare_from_csv,
+    compare_pose_metrics,
+    rank_references_by_angle_dtw,
+)
+from .advice import AdviceFinding, AdviceRule, AdviceRuleSet, default_rule_set, generate_advice, generate_advice_batch
+from .reference_index import ReferenceMetricsIndex
+from .metric_search import MetricMatch, MetricSearch
+from .sequence_features import load_normalized_sequence, normalize_sequence_center_scale
+from .sequence_search import SequenceIndex, SequenceMatch
+from .angle_search import AngleMatch, AngleSequenceIndex
+from .embedding_index import EmbeddingIndex, EmbeddingMatch
+from .keypoint_store import KeypointArrays, load_keypoint_arrays, load_keypoints, write_keypoint_store
 
 __all__ = [
     "PoseMetrics",
+    "PoseSequence",
     "compute_pose_metrics",
+    "compute_pose_metrics_batch",
+    "ServePhases",
+    "detect_serve_phases",
+    "detect_serve_phases_many",
+    "ServeSegment",
+    "StreamingServeDetector",
+    "detect_serve_segments",
     "PoseMetricDiff",
     "compare_pose_metrics",
     "compare_from_csv",
+    "SequenceComparison",
+    "compare_angle_sequences",
+    "rank_references_by_angle_dtw",
     "AdviceFinding",
     "generate_advice",
+    "AdviceRule",
+    "AdviceRuleSet",
+    "default_rule_set",
+    "generate_advice_batch",
+    "ReferenceMetricsIndex",
+    "MetricMatch",
+    "MetricSearch",
+    "load_normalized_sequence",
+    "normalize_sequence_center_scale",
+    "SequenceIndex",
+    "SequenceMatch",
+    "AngleSequenceIndex",
+    "AngleMatch",
+    "EmbeddingIndex",
+    "EmbeddingMatch",
+    "KeypointArrays",
+    "load_keypoint_arrays",
+    "load_keypoints",
+    "write_keypoint_store",
 ]
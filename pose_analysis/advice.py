@@ -1,11 +1,39 @@
-"""Generate simple textual advice from pose metric differences."""
+"""Generate textual advice from pose metric differences.
+
+Advice comes from declarative rules (``advice_rules.json`` next to this module,
+or the file named by ``ADVICE_RULES_PATH``). Each rule names a metric, a
+comparator, a threshold, a severity and a message template; the template may
+use ``{metric}``, ``{difference}``, ``{abs_difference}`` and ``{threshold}``.
+:meth:`AdviceRuleSet.evaluate` checks every rule against a whole batch of
+diffs with one comparison over a ``(n_diffs, n_rules)`` matrix, so a session
+of hundreds of serves is scored without per-serve branching. Findings are
+ranked by severity, then by rule order. New metrics only need new rules: a
+diff can be a :class:`PoseMetricDiff` (``<metric>_diff`` fields) or any
+mapping of metric name to difference.
+
+Usage example:
+    findings = generate_advice(compare_from_csv(user_csv, reference_csv))
+    table = default_rule_set().evaluate([diff_a, diff_b, {"trophy_knee_angle": -22.0}])
+"""
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List
+import json
+import os
+from dataclasses import dataclass, fields, is_dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
 
 from .comparison import PoseMetricDiff
 
+DEFAULT_RULES_PATH = Path(__file__).with_name("advice_rules.json")
+COMPARATORS = (">", ">=", "<", "<=", "abs>", "abs>=")
+
+DiffLike = Union[PoseMetricDiff, Mapping[str, Optional[float]]]
+
 
 @dataclass(frozen=True)
 class AdviceFinding:
@@ -14,92 +42,235 @@ class AdviceFinding:
     metric: str
     difference: float
     recommendation: str
+    severity: str = "info"
 
 
-_DEFAULT_THRESHOLDS: Dict[str, float] = {
-    "trophy_knee_angle": 15.0,
-    "trophy_right_arm_extension": 15.0,
-    "trophy_left_arm_lift": 15.0,
-    "impact_right_shoulder_angle": 15.0,
-}
+@dataclass(frozen=True)
+class AdviceRule:
+    """``<metric difference> <comparator> <threshold>`` triggers ``message`` at ``severity``."""
 
+    id: str
+    metric: str
+    comparator: str
+    threshold: float
+    severity: str
+    message: str
 
-def generate_advice(
-    diff: PoseMetricDiff,
-    thresholds: Dict[str, float] | None = None,
-) -> List[AdviceFinding]:
-    """Create coaching advice using simple difference heuristics."""
 
-    th = dict(_DEFAULT_THRESHOLDS)
-    if thresholds:
-        th.update(thresholds)
+def diff_values(diff: DiffLike) -> Dict[str, Optional[float]]:
+    """Metric name -> difference; ``PoseMetricDiff`` fields lose their ``_diff`` suffix."""
+    if is_dataclass(diff):
+        return {
+            f.name[: -len("_diff")]: getattr(diff, f.name) for f in fields(diff) if f.name.endswith("_diff")
+        }
+    return dict(diff)
 
-    findings: List[AdviceFinding] = []
 
-    knee_delta = diff.trophy_knee_angle_diff
-    if abs(knee_delta) >= th["trophy_knee_angle"]:
-        if knee_delta > 0:
-            recommendation = (
-                "トロフィーポーズでの膝の曲げが浅いようです。もう少し膝を沈めて脚の力を溜めましょう。"
-            )
-        else:
-            recommendation = (
-                "トロフィーポーズで膝を深く曲げています。膝に負担がかかったり、パワーが逃げてしまったりするので注意しましょう。"
-            )
-        findings.append(
-            AdviceFinding("trophy_knee_angle", knee_delta, recommendation)
-        )
+class AdviceRuleSet:
+    """A list of :class:`AdviceRule` evaluated together over batches of diffs."""
 
-    arm_delta = diff.trophy_right_arm_extension_diff
-    if abs(arm_delta) >= th["trophy_right_arm_extension"]:
-        if arm_delta > 0:
-            recommendation = (
-                "トス時の右肘が高く上がりすぎています。肩の力を抜き肩から肘にかけて一直線を意識しましょう。"
-            )
-        else:
-            recommendation = (
-                "トス時の右肘が下がりすぎています。肩や肘を痛める可能性もあるので注意して下さい。"
+    def __init__(
+        self,
+        rules: Sequence[AdviceRule],
+        *,
+        severities: Sequence[str] = ("info", "low", "medium", "high"),
+        fallback: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.severities = tuple(severities)
+        for rule in rules:
+            if rule.comparator not in COMPARATORS:
+                raise ValueError(f"Rule {rule.id!r}: comparator must be one of {COMPARATORS}, got {rule.comparator!r}")
+            if rule.severity not in self.severities:
+                raise ValueError(f"Rule {rule.id!r}: unknown severity {rule.severity!r}")
+        self.rules = list(rules)
+        self.fallback = dict(fallback) if fallback else None
+        self.metrics = sorted({rule.metric for rule in self.rules})
+
+        # 評価に使う配列はルール読み込み時に1度だけ作る
+        metric_pos = {metric: idx for idx, metric in enumerate(self.metrics)}
+        self._rule_metric = np.array([metric_pos[rule.metric] for rule in self.rules], dtype=int)
+        self._thresholds = np.array([rule.threshold for rule in self.rules], dtype=np.float64)
+        self._comparators = np.array([rule.comparator for rule in self.rules], dtype=object)
+        self._severity_rank = np.array([self.severities.index(rule.severity) for rule in self.rules], dtype=int)
+
+    @classmethod
+    def from_dict(cls, payload: Mapping) -> "AdviceRuleSet":
+        rules = [
+            AdviceRule(
+                id=str(item.get("id", f"rule_{idx}")),
+                metric=str(item["metric"]),
+                comparator=str(item["comparator"]),
+                threshold=float(item["threshold"]),
+                severity=str(item.get("severity", "medium")),
+                message=str(item["message"]),
             )
-        findings.append(
-            AdviceFinding("trophy_right_arm_extension", arm_delta, recommendation)
+            for idx, item in enumerate(payload.get("rules", []))
+        ]
+        return cls(
+            rules,
+            severities=payload.get("severities", ("info", "low", "medium", "high")),
+            fallback=payload.get("fallback"),
         )
 
-    left_delta = diff.trophy_left_arm_lift_diff
-    if abs(left_delta) >= th["trophy_left_arm_lift"]:
-        if left_delta > 0:
-            recommendation = (
-                "トス時の左腕が十分に上がっていません。左手で上体を支える意識を持ちましょう。"
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "AdviceRuleSet":
+        with open(path, "r", encoding="utf-8") as fh:
+            return cls.from_dict(json.load(fh))
+
+    def with_thresholds(self, thresholds: Mapping[str, float]) -> "AdviceRuleSet":
+        """Copy with per-metric threshold magnitudes replaced (each rule keeps its threshold's sign)."""
+        if not thresholds:
+            return self
+        rules = [
+            AdviceRule(
+                rule.id,
+                rule.metric,
+                rule.comparator,
+                float(np.copysign(abs(thresholds[rule.metric]), rule.threshold))
+                if rule.metric in thresholds
+                else rule.threshold,
+                rule.severity,
+                rule.message,
             )
+            for rule in self.rules
+        ]
+        return AdviceRuleSet(rules, severities=self.severities, fallback=self.fallback)
+
+    def _value_matrix(self, diffs: Union[Sequence[DiffLike], pd.DataFrame]) -> np.ndarray:
+        """(n_diffs, n_metrics) differences; missing metrics and ``None`` become NaN."""
+        if isinstance(diffs, pd.DataFrame):
+            frame = diffs
         else:
-            recommendation = (
-                "トス時の左腕が上がりすぎています。上体のブレにつながる場合は少し余裕を残しましょう。"
-            )
-        findings.append(
-            AdviceFinding("trophy_left_arm_lift", left_delta, recommendation)
-        )
+            frame = pd.DataFrame([diff_values(diff) for diff in diffs])
+        frame = frame.reindex(columns=self.metrics)
+        return frame.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64).reshape(len(frame), len(self.metrics))
 
-    if diff.impact_right_shoulder_angle_diff is not None:
-        impact_delta = diff.impact_right_shoulder_angle_diff
-        if abs(impact_delta) >= th["impact_right_shoulder_angle"]:
-            if impact_delta > 0:
-                recommendation = (
-                    "インパクト時の右肩〜右肘の角度が大きく、腕が上がりすぎている可能性があります。もう少し肘を下げて窮屈さを減らしましょう。"
+    def evaluate(self, diffs: Union[Sequence[DiffLike], pd.DataFrame], *, include_fallback: bool = True) -> pd.DataFrame:
+        """Evaluate every rule on every diff and return the findings as one table.
+
+        Columns: ``diff_index, rule_id, metric, difference, severity, severity_rank,
+        recommendation``. Rows are grouped by diff and ranked within each diff by
+        severity (highest first), then by rule order. Diffs without a finding get
+        the fallback row when ``include_fallback`` is true.
+        """
+        values = self._value_matrix(diffs)
+        n_diffs = values.shape[0]
+        columns = ["diff_index", "rule_id", "metric", "difference", "severity", "severity_rank", "recommendation"]
+
+        fired = np.zeros((n_diffs, len(self.rules)), dtype=bool)
+        if self.rules:
+            observed = values[:, self._rule_metric]  # (n_diffs, n_rules)
+            threshold = self._thresholds[None, :]
+            comparator = self._comparators[None, :]
+            # NaN（欠損）との比較はすべて False になるので発火しない
+            with np.errstate(invalid="ignore"):
+                fired = np.select(
+                    [
+                        comparator == ">",
+                        comparator == ">=",
+                        comparator == "<",
+                        comparator == "<=",
+                        comparator == "abs>",
+                    ],
+                    [
+                        observed > threshold,
+                        observed >= threshold,
+                        observed < threshold,
+                        observed <= threshold,
+                        np.abs(observed) > threshold,
+                    ],
+                    default=np.abs(observed) >= threshold,
                 )
-            else:
-                recommendation = (
-                    "インパクト時の右肩〜右肘の角度が小さく、肘が落ちぎみです。もう少し高い打点で捉えることを意識しましょう。"
+
+        diff_idx, rule_idx = np.nonzero(fired)
+        # 各 diff の中で重大度の高い順、同じ重大度ならルールの記述順に並べる
+        order = np.lexsort((rule_idx, -self._severity_rank[rule_idx], diff_idx))
+        diff_idx, rule_idx = diff_idx[order], rule_idx[order]
+        differences = values[diff_idx, self._rule_metric[rule_idx]] if diff_idx.size else np.empty(0)
+
+        table = pd.DataFrame(
+            {
+                "diff_index": diff_idx,
+                "rule_id": [self.rules[idx].id for idx in rule_idx],
+                "metric": [self.rules[idx].metric for idx in rule_idx],
+                "difference": differences,
+                "severity": [self.rules[idx].severity for idx in rule_idx],
+                "severity_rank": self._severity_rank[rule_idx],
+                "recommendation": [
+                    _render(self.rules[idx], value) for idx, value in zip(rule_idx, differences)
+                ],
+            },
+            columns=columns,
+        )
+
+        if include_fallback and self.fallback:
+            quiet = np.flatnonzero(~fired.any(axis=1))
+            if quiet.size:
+                severity = self.fallback.get("severity", self.severities[0])
+                fallback_rows = pd.DataFrame(
+                    {
+                        "diff_index": quiet,
+                        "rule_id": "fallback",
+                        "metric": self.fallback.get("metric", "overall_match"),
+                        "difference": 0.0,
+                        "severity": severity,
+                        "severity_rank": self.severities.index(severity) if severity in self.severities else 0,
+                        "recommendation": self.fallback["message"],
+                    },
+                    columns=columns,
                 )
-            findings.append(
-                AdviceFinding("impact_right_shoulder_angle", impact_delta, recommendation)
-            )
+                table = pd.concat([table, fallback_rows], ignore_index=True) if len(table) else fallback_rows
+                table = table.sort_values("diff_index", kind="stable", ignore_index=True)
+        return table
 
-    if not findings:
-        findings.append(
-            AdviceFinding(
-                "overall_match",
-                0.0,
-                "全体的に綺麗なフォームです。この調子で参考動画と見比べながら細部を磨いてみましょう。",
+    def findings(self, diffs: Union[Sequence[DiffLike], pd.DataFrame]) -> List[List[AdviceFinding]]:
+        """:meth:`evaluate` split back into one ranked list of :class:`AdviceFinding` per diff."""
+        table = self.evaluate(diffs)
+        n_diffs = len(diffs)
+        grouped: List[List[AdviceFinding]] = [[] for _ in range(n_diffs)]
+        for row in table.itertuples(index=False):
+            grouped[row.diff_index].append(
+                AdviceFinding(row.metric, float(row.difference), row.recommendation, row.severity)
             )
-        )
+        return grouped
+
+
+def _render(rule: AdviceRule, value: float) -> str:
+    if "{" not in rule.message:
+        return rule.message
+    return rule.message.format(
+        metric=rule.metric,
+        difference=value,
+        abs_difference=abs(value),
+        threshold=rule.threshold,
+    )
+
 
-    return findings
+@lru_cache(maxsize=8)
+def _load_rule_set(path: str, mtime_ns: int) -> AdviceRuleSet:
+    return AdviceRuleSet.load(path)
+
+
+def default_rule_set(path: Union[str, Path, None] = None) -> AdviceRuleSet:
+    """Rules from ``path``, ``$ADVICE_RULES_PATH`` or the bundled file (reloaded when the file changes)."""
+    rules_path = Path(path or os.environ.get("ADVICE_RULES_PATH") or DEFAULT_RULES_PATH)
+    return _load_rule_set(str(rules_path.resolve()), rules_path.stat().st_mtime_ns)
+
+
+def generate_advice(
+    diff: DiffLike,
+    thresholds: Dict[str, float] | None = None,
+    rules: Optional[AdviceRuleSet] = None,
+) -> List[AdviceFinding]:
+    """Create coaching advice for one diff, most severe first."""
+    return generate_advice_batch([diff], thresholds, rules)[0]
+
+
+def generate_advice_batch(
+    diffs: Sequence[DiffLike],
+    thresholds: Dict[str, float] | None = None,
+    rules: Optional[AdviceRuleSet] = None,
+) -> List[List[AdviceFinding]]:
+    """Advice for many diffs at once (one vectorised rule evaluation); one list per diff."""
+    rule_set = (rules or default_rule_set()).with_thresholds(thresholds or {})
+    return rule_set.findings(diffs)
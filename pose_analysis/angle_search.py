@@ -0,0 +1,260 @@
+"""DTW search over the per-frame joint-angle series of a reference library.
+
+:class:`AngleSequenceIndex` is the library counterpart of
+:func:`~pose_analysis.comparison.rank_references_by_angle_dtw`: instead of
+re-parsing every reference CSV and rebuilding its angle matrix on each call,
+it keeps the angle series of every reference clip of a directory (gaps
+interpolated, resampled to ``ANGLE_SEQUENCE_LENGTH`` frames) together with
+their LB_Keogh upper/lower envelopes, and persists them in an ``.npz`` file
+inside the library directory. Like :class:`SequenceIndex`, only clips whose
+CSV changed are reloaded.
+
+Angles missing from the user clip are left out of the distance; references
+lacking an angle the user has are skipped. Because the envelopes are computed
+per angle column, dropping columns only slices the stored arrays.
+
+Usage example:
+    index = AngleSequenceIndex.for_directory("pose_tracks/Cleaned_Data/players/Fed")
+    matches = index.search(user_csv, k=3)
+
+    # 参照ライブラリの角度系列索引を事前に作っておく
+    python -m pose_analysis.angle_search --root pose_tracks/Cleaned_Data/players
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .comparison import _fill_gaps, _resample
+from .dtw import DEFAULT_BAND, envelope, search_top_k
+from .keypoint_store import KEYPOINTS_CSV_NAME
+from .pose_metrics import ANGLE_SERIES_NAMES, PoseSequence
+from .sequence_features import SEQUENCE_LENGTH
+
+INDEX_FILE_NAME = ".angle_sequence_index.npz"
+INDEX_VERSION = 1
+ANGLE_SEQUENCE_LENGTH = SEQUENCE_LENGTH
+
+# 常駐ワーカーでは同じディレクトリの索引をプロセス内で使い回す
+_INDEX_CACHE: Dict[Tuple[str, int], "AngleSequenceIndex"] = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def angle_series(
+    sequence: Path | str | pd.DataFrame | PoseSequence,
+    length: int = ANGLE_SEQUENCE_LENGTH,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Gap-filled ``(length, len(ANGLE_SERIES_NAMES))`` angle series of a clip and its per-angle availability.
+
+    Angles that are missing for the whole clip are zero columns with ``False``
+    availability.
+    """
+    angles = PoseSequence.load(sequence).angle_matrix(ANGLE_SERIES_NAMES)
+    if len(angles) < 2:
+        raise ValueError(f"Need at least 2 frames for an angle series, got {len(angles)}")
+    available = np.isfinite(angles).any(axis=0)
+    filled = _fill_gaps(angles)
+    filled[:, ~available] = 0.0
+    return _resample(filled, length), available
+
+
+@dataclass(frozen=True)
+class AngleMatch:
+    """One search hit: the reference clip and its angle-series DTW distance to the user clip."""
+
+    path: Path
+    distance: float
+    rank: int
+
+
+class AngleSequenceIndex:
+    """Angle series and DTW envelopes of every ``keypoints_with_tracks.csv`` under ``root``."""
+
+    def __init__(
+        self,
+        root: Path | str,
+        *,
+        index_path: Optional[Path | str] = None,
+        band: int = DEFAULT_BAND,
+    ) -> None:
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else self.root / INDEX_FILE_NAME
+        self.band = int(band)
+        n_angles = len(ANGLE_SERIES_NAMES)
+        self._keys: List[str] = []
+        self._signatures = np.empty((0, 2), dtype=np.int64)
+        self._errors: List[str] = []
+        self._series = np.empty((0, ANGLE_SEQUENCE_LENGTH, n_angles), dtype=np.float32)
+        self._available = np.empty((0, n_angles), dtype=bool)
+        self._upper = np.empty_like(self._series)
+        self._lower = np.empty_like(self._series)
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_directory(cls, root: Path | str, *, band: int = DEFAULT_BAND) -> "AngleSequenceIndex":
+        """Return the process-wide index for ``root`` (created on first use)."""
+        key = (str(Path(root).resolve()), int(band))
+        with _INDEX_CACHE_LOCK:
+            if key not in _INDEX_CACHE:
+                _INDEX_CACHE[key] = cls(root, band=band)
+            return _INDEX_CACHE[key]
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                if (
+                    int(data["version"]) != INDEX_VERSION
+                    or int(data["band"]) != self.band
+                    or tuple(str(name) for name in data["angle_names"]) != tuple(ANGLE_SERIES_NAMES)
+                ):
+                    return
+                self._keys = [str(key) for key in data["keys"]]
+                self._signatures = data["signatures"]
+                self._errors = [str(error) for error in data["errors"]]
+                self._series = data["series"]
+                self._available = data["available"]
+                self._upper = data["upper"]
+                self._lower = data["lower"]
+        except (OSError, KeyError, ValueError) as exc:
+            print(f"⚠️ Ignoring unreadable angle sequence index {self.index_path}: {exc}")
+
+    def _save(self) -> None:
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as fh:
+                np.savez(
+                    fh,
+                    version=INDEX_VERSION,
+                    band=self.band,
+                    angle_names=np.asarray(ANGLE_SERIES_NAMES, dtype=str),
+                    keys=np.asarray(self._keys, dtype=str),
+                    signatures=self._signatures,
+                    errors=np.asarray(self._errors, dtype=str),
+                    series=self._series,
+                    available=self._available,
+                    upper=self._upper,
+                    lower=self._lower,
+                )
+            tmp_path.replace(self.index_path)
+        except OSError as exc:  # 読み取り専用の環境でも検索自体は続行する
+            print(f"⚠️ Could not write angle sequence index {self.index_path}: {exc}")
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the files on disk; return the number of reloaded clips."""
+        with self._lock:
+            current = {key: idx for idx, key in enumerate(self._keys)}
+            # 浅い階層を先に並べる（Cleaned_Data/<選手>/ 配下の重複コピーより直下のクリップを優先）
+            csv_paths = sorted(
+                self.root.glob(f"**/{KEYPOINTS_CSV_NAME}"),
+                key=lambda path: (len(path.relative_to(self.root).parts), path.relative_to(self.root).as_posix()),
+            )
+            keys = [path.relative_to(self.root).as_posix() for path in csv_paths]
+            signatures = np.array([_file_signature(path) for path in csv_paths], dtype=np.int64).reshape(-1, 2)
+
+            series = np.zeros((len(keys), ANGLE_SEQUENCE_LENGTH, len(ANGLE_SERIES_NAMES)), dtype=np.float32)
+            available = np.zeros((len(keys), len(ANGLE_SERIES_NAMES)), dtype=bool)
+            errors = [""] * len(keys)
+            stale: List[int] = []
+            for idx, key in enumerate(keys):
+                old = current.get(key)
+                if old is not None and np.array_equal(self._signatures[old], signatures[idx]):
+                    series[idx] = self._series[old]
+                    available[idx] = self._available[old]
+                    errors[idx] = self._errors[old]
+                    continue
+                stale.append(idx)
+                try:
+                    series[idx], available[idx] = angle_series(csv_paths[idx])
+                except (OSError, KeyError, ValueError) as exc:
+                    # 壊れた CSV は失敗として記録し、ファイルが変わるまで再読み込みしない
+                    errors[idx] = str(exc) or type(exc).__name__
+
+            if not stale and keys == self._keys:
+                return 0
+
+            # 包絡線は (N, 48, 角度数) 全体を1回のスライディング窓計算で求め直す
+            upper, lower = envelope(series, self.band)
+            self._keys = keys
+            self._signatures = signatures
+            self._errors = errors
+            self._series = series
+            self._available = available
+            self._upper = upper.astype(np.float32)
+            self._lower = lower.astype(np.float32)
+            self._save()
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def errors(self) -> Dict[str, str]:
+        """Relative path -> error message for clips that could not be loaded."""
+        with self._lock:
+            return {key: error for key, error in zip(self._keys, self._errors) if error}
+
+    def search(
+        self,
+        user: Path | str | pd.DataFrame | PoseSequence,
+        k: int = 1,
+        *,
+        refresh: bool = True,
+    ) -> List[AngleMatch]:
+        """Top-k references by banded DTW distance of their angle series to the user's, best first."""
+        query, columns = angle_series(user)
+        if not columns.any():
+            raise ValueError("No joint angle is available in the user sequence")
+        if refresh:
+            self.refresh()
+        with self._lock:
+            # ユーザーにある角度をすべて持つ参照だけを候補にする
+            usable = self._available[:, columns].all(axis=1) & np.array([not error for error in self._errors], dtype=bool)
+            valid = np.flatnonzero(usable)
+            if valid.size == 0:
+                return []
+            indices, distances, _ = search_top_k(
+                query[:, columns],
+                self._series[valid][:, :, columns],
+                k,
+                band=self.band,
+                envelopes=(self._upper[valid][:, :, columns], self._lower[valid][:, :, columns]),
+            )
+            return [
+                AngleMatch(path=self.root / self._keys[valid[idx]], distance=float(dist), rank=rank)
+                for rank, (idx, dist) in enumerate(zip(indices, distances))
+            ]
+
+
+def build_indexes(root: Path | str, *, band: int = DEFAULT_BAND) -> Dict[str, int]:
+    """Build or refresh one angle sequence index per immediate sub-directory (player) of ``root``."""
+    counts: Dict[str, int] = {}
+    for player_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        counts[player_dir.name] = AngleSequenceIndex(player_dir, band=band).refresh()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the per-player reference angle sequence (DTW) index")
+    parser.add_argument("--root", type=Path, required=True, help="Directory containing one folder per player")
+    parser.add_argument("--band", type=int, default=DEFAULT_BAND, help="Sakoe-Chiba band width in frames")
+    args = parser.parse_args()
+    for player, reloaded in build_indexes(args.root, band=args.band).items():
+        print(f"📐 {player}: {reloaded} clips (re)indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,36 @@
-"""Comparison utilities for tennis pose metrics."""
+"""Comparison utilities for tennis pose metrics.
+
+Besides the scalar differences at the trophy and impact frames,
+:func:`compare_angle_sequences` compares the full per-frame joint-angle series
+of two clips after aligning them with banded DTW, so serves with a different
+tempo are compared phase against phase. :func:`rank_references_by_angle_dtw`
+runs the same distance against a list of references with LB_Keogh pruning and
+early abandoning; for a reference directory,
+:class:`~pose_analysis.angle_search.AngleSequenceIndex` keeps the angle series
+and envelopes precomputed on disk.
+"""
 from __future__ import annotations
 
+import warnings
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
 
-from .pose_metrics import PoseMetrics, compute_pose_metrics
+from .dtw import DEFAULT_BAND, dtw_path, search_top_k
+from .pose_metrics import (
+    ANGLE_SERIES_NAMES,
+    EXTENDED_METRIC_COLUMNS,
+    PoseMetrics,
+    PoseSequence,
+    compute_pose_metrics,
+    find_impact_frame,
+    find_trophy_frame,
+)
+
+SERVE_PHASES: Tuple[str, ...] = ("preparation", "acceleration", "follow_through")
 
 
 @dataclass(frozen=True)
@@ -22,6 +47,21 @@ class PoseMetricDiff:
     trophy_left_arm_lift_diff: float
     impact_right_shoulder_angle_diff: Optional[float]
 
+    # 拡張指標の差分（どちらかが欠損なら None）
+    hip_shoulder_separation_diff: Optional[float] = None
+    trophy_trunk_tilt_diff: Optional[float] = None
+    impact_trunk_tilt_diff: Optional[float] = None
+    contact_height_ratio_diff: Optional[float] = None
+    peak_wrist_angular_velocity_diff: Optional[float] = None
+    peak_elbow_angular_velocity_diff: Optional[float] = None
+    leg_drive_timing_diff: Optional[float] = None
+
+
+def _optional_diff(user_value: Optional[float], reference_value: Optional[float]) -> Optional[float]:
+    if user_value is None or reference_value is None:
+        return None
+    return user_value - reference_value
+
 
 def compare_pose_metrics(
     user_metrics: PoseMetrics, reference_metrics: PoseMetrics
@@ -52,20 +92,27 @@ def compare_pose_metrics(
         trophy_left_arm_lift_diff=
         user_metrics.trophy_left_arm_lift - reference_metrics.trophy_left_arm_lift,
         impact_right_shoulder_angle_diff=impact_diff,
+        **{
+            f"{name}_diff": _optional_diff(getattr(user_metrics, name), getattr(reference_metrics, name))
+            for name in EXTENDED_METRIC_COLUMNS
+        },
     )
 
 
 def compare_from_csv(
-    user_csv: Path | str,
-    reference_csv: Path | str,
-    trophy_range=(15, 30),
-    impact_range=(25, 40),
+    user_csv: Path | str | PoseSequence,
+    reference_csv: Path | str | PoseSequence,
+    trophy_range: Optional[Tuple[int, int]] = None,
+    impact_range: Optional[Tuple[int, int]] = None,
     user_trophy_override: Optional[int] = None,
     user_impact_override: Optional[int] = None,
     reference_trophy_override: Optional[int] = None,
     reference_impact_override: Optional[int] = None,
 ) -> PoseMetricDiff:
-    """Convenience wrapper to load both sequences and return metric differences."""
+    """Convenience wrapper to load both sequences and return metric differences.
+
+    Either side may be a :class:`PoseSequence` to reuse already extracted joints and angles.
+    """
     user = compute_pose_metrics(
         user_csv,
         trophy_range,
@@ -81,3 +128,154 @@ def compare_from_csv(
         impact_frame_override=reference_impact_override,
     )
     return compare_pose_metrics(user, reference)
+
+
+@dataclass(frozen=True)
+class SequenceComparison:
+    """DTW alignment of two angle time series and per-phase mean differences (user minus reference)."""
+
+    distance: float
+    normalized_distance: float  # 経路1ステップあたりの平均コスト
+    path: np.ndarray  # (L, 2) の (user_frame, reference_frame) 対応
+    angle_names: Tuple[str, ...]
+    phase_bounds: Dict[str, Tuple[int, int]]
+    phase_differences: Dict[str, Dict[str, Optional[float]]]
+
+
+def _fill_gaps(series: np.ndarray) -> np.ndarray:
+    """Linearly interpolate NaNs in each column (edges take the nearest value)."""
+    filled = series.copy()
+    frames = np.arange(series.shape[0])
+    for col in range(series.shape[1]):
+        valid = np.isfinite(series[:, col])
+        if valid.any() and not valid.all():
+            filled[:, col] = np.interp(frames, frames[valid], series[valid, col])
+    return filled
+
+
+def _resample(series: np.ndarray, length: int) -> np.ndarray:
+    """Linearly resample a (n, F) series to ``length`` frames."""
+    if series.shape[0] == length:
+        return series
+    src = np.linspace(0.0, 1.0, series.shape[0])
+    dst = np.linspace(0.0, 1.0, length)
+    return np.stack([np.interp(dst, src, series[:, col]) for col in range(series.shape[1])], axis=1)
+
+
+def default_phase_bounds(
+    sequence: PoseSequence,
+    trophy_range: Optional[Tuple[int, int]] = None,
+    impact_range: Optional[Tuple[int, int]] = None,
+) -> Dict[str, Tuple[int, int]]:
+    """Split a clip at its trophy and impact frames; fall back to thirds when they cannot be found.
+
+    The frames are detected over the whole clip unless ``trophy_range`` /
+    ``impact_range`` restrict the search.
+    """
+    n_frames = len(sequence)
+    try:
+        trophy = find_trophy_frame(sequence, trophy_range)
+        impact = find_impact_frame(sequence, impact_range)
+    except (KeyError, ValueError):
+        trophy, impact = n_frames // 3, 2 * n_frames // 3
+    if not 0 < trophy < impact < n_frames:
+        trophy, impact = n_frames // 3, 2 * n_frames // 3
+    return {
+        "preparation": (0, trophy),
+        "acceleration": (trophy, impact),
+        "follow_through": (impact, n_frames),
+    }
+
+
+def compare_angle_sequences(
+    user: Path | str | pd.DataFrame | PoseSequence,
+    reference: Path | str | pd.DataFrame | PoseSequence,
+    *,
+    angle_names: Sequence[str] = ANGLE_SERIES_NAMES,
+    band: Optional[int] = DEFAULT_BAND,
+    phase_bounds: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> SequenceComparison:
+    """Align the per-frame angle series of two clips with DTW and summarise the differences per phase.
+
+    ``phase_bounds`` maps phase names to ``[start, end)`` user frame ranges and
+    defaults to :func:`default_phase_bounds` of the user clip. Angles missing on
+    either side are left out of the alignment and reported as ``None``.
+    """
+    user_seq = PoseSequence.load(user)
+    ref_seq = PoseSequence.load(reference)
+    user_angles = user_seq.angle_matrix(angle_names)
+    ref_angles = ref_seq.angle_matrix(angle_names)
+
+    common = np.isfinite(user_angles).any(axis=0) & np.isfinite(ref_angles).any(axis=0)
+    if not common.any():
+        raise ValueError("No joint angle is available in both sequences")
+    distance, path = dtw_path(
+        _fill_gaps(user_angles[:, common]), _fill_gaps(ref_angles[:, common]), band=band
+    )
+
+    bounds = phase_bounds if phase_bounds is not None else default_phase_bounds(user_seq)
+    names = tuple(angle_names)
+    phase_differences: Dict[str, Dict[str, Optional[float]]] = {}
+    if path.size:
+        # 対応付けられたフレーム対ごとの差（欠損フレームは NaN のまま平均から外す）
+        diffs = user_angles[path[:, 0]] - ref_angles[path[:, 1]]
+    else:
+        diffs = np.empty((0, len(names)))
+    for phase, (start, end) in bounds.items():
+        in_phase = (path[:, 0] >= start) & (path[:, 0] < end) if path.size else np.zeros(0, dtype=bool)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            means = np.nanmean(diffs[in_phase], axis=0) if in_phase.any() else np.full(len(names), np.nan)
+        phase_differences[phase] = {
+            name: (float(value) if common[idx] and np.isfinite(value) else None)
+            for idx, (name, value) in enumerate(zip(names, means))
+        }
+
+    return SequenceComparison(
+        distance=float(distance),
+        normalized_distance=float(distance / len(path)) if len(path) else float("inf"),
+        path=path,
+        angle_names=names,
+        phase_bounds=dict(bounds),
+        phase_differences=phase_differences,
+    )
+
+
+def rank_references_by_angle_dtw(
+    user: Path | str | pd.DataFrame | PoseSequence,
+    references: Sequence[Path | str | pd.DataFrame | PoseSequence],
+    k: int = 1,
+    *,
+    angle_names: Sequence[str] = ANGLE_SERIES_NAMES,
+    band: Optional[int] = DEFAULT_BAND,
+) -> List[Tuple[int, float]]:
+    """Top-k references by DTW distance of their angle series to the user's, best first.
+
+    References are resampled to the user's length so every candidate shares
+    one LB_Keogh envelope layout; candidates are then visited in lower-bound
+    order and abandoned as soon as they cannot beat the current k-th best.
+    References lacking an angle the user has are skipped. Returns
+    ``(reference_index, distance)`` pairs. Every reference is parsed on each
+    call; search a reference directory through
+    :class:`~pose_analysis.angle_search.AngleSequenceIndex` instead.
+    """
+    user_angles = PoseSequence.load(user).angle_matrix(angle_names)
+    available = np.isfinite(user_angles).any(axis=0)
+    if not available.any():
+        raise ValueError("No joint angle is available in the user sequence")
+    query = _fill_gaps(user_angles[:, available])
+
+    kept: List[int] = []
+    candidates: List[np.ndarray] = []
+    for idx, reference in enumerate(references):
+        angles = PoseSequence.load(reference).angle_matrix(angle_names)[:, available]
+        if len(angles) < 2 or not np.isfinite(angles).any(axis=0).all():
+            continue
+        kept.append(idx)
+        candidates.append(_resample(_fill_gaps(angles), len(query)))
+    if not candidates:
+        return []
+
+    window = band if band is not None else len(query)
+    indices, distances, _ = search_top_k(query, np.stack(candidates), k, band=window)
+    return [(kept[idx], float(dist)) for idx, dist in zip(indices, distances)]
@@ -0,0 +1,238 @@
+"""Banded dynamic time warping for multivariate pose time series.
+
+Each DTW row is computed without a Python loop over columns: with ``m`` the
+best predecessor from the previous row, the recurrence
+``D[i, j] = c[i, j] + min(m[j], D[i, j - 1])`` unrolls to
+``D[i, j] = C[j] + cummin(m[k] - C[k - 1])`` where ``C`` is the running sum of
+the row's costs, so one ``np.minimum.accumulate`` replaces the inner loop.
+Rows are restricted to a Sakoe-Chiba band and computation stops early once
+every cell of a row exceeds ``max_dist``.
+
+:func:`lb_keogh` with :func:`envelope` gives a cheap lower bound on the banded
+DTW distance, used to skip candidates before running full DTW.
+
+Usage example:
+    dist = dtw_distance(user_angles, ref_angles, band=5)
+    dist, path = dtw_path(user_angles, ref_angles, band=5)
+    dists = dtw_distances(user_angles, np.stack(ref_angle_list), band=5, max_dist=best)
+"""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+DEFAULT_BAND = 6
+
+
+def _as_2d(series: np.ndarray) -> np.ndarray:
+    series = np.asarray(series, dtype=np.float64)
+    return series[:, None] if series.ndim == 1 else series
+
+
+def _band_limits(i: int, n: int, m: int, band: Optional[int]) -> Tuple[int, int]:
+    """Column range [lo, hi) of row ``i`` inside a band around the (n, m) diagonal."""
+    if band is None:
+        return 0, m
+    center = int(round(i * (m - 1) / max(n - 1, 1)))
+    return max(0, center - band), min(m, center + band + 1)
+
+
+def _pairwise_cost(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Euclidean distance between every frame of ``a`` (n, F) and ``b`` (..., m, F)."""
+    return np.sqrt(np.sum((a[:, None, :] - b[..., None, :, :]) ** 2, axis=-1))
+
+
+def _row_update(prev: np.ndarray, cost: np.ndarray, lo: int, hi: int, prev_lo: int, prev_hi: int) -> np.ndarray:
+    """Compute one DTW row over columns [lo, hi) from the previous row (batched over leading dims)."""
+    width = hi - lo
+    batch_shape = cost.shape[:-1]
+    # 前の行の D[i-1, j-1] と D[i-1, j] を列 j に揃える（帯の外は inf）
+    up = np.full(batch_shape + (width,), np.inf)
+    diag = np.full(batch_shape + (width,), np.inf)
+    cols = np.arange(lo, hi)
+    in_up = (cols >= prev_lo) & (cols < prev_hi)
+    in_diag = (cols - 1 >= prev_lo) & (cols - 1 < prev_hi)
+    up[..., in_up] = prev[..., cols[in_up] - prev_lo]
+    diag[..., in_diag] = prev[..., cols[in_diag] - 1 - prev_lo]
+    best_prev = np.minimum(up, diag)
+
+    running = np.cumsum(cost, axis=-1)
+    shifted = running - cost  # C[k-1]
+    with np.errstate(invalid="ignore"):
+        return running + np.minimum.accumulate(best_prev - shifted, axis=-1)
+
+
+def dtw_distances(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    *,
+    band: Optional[int] = DEFAULT_BAND,
+    max_dist: float = np.inf,
+) -> np.ndarray:
+    """DTW distance from ``query`` (n, F) to each candidate in ``candidates`` (N, m, F).
+
+    All candidates are advanced row by row together. Candidates whose whole
+    row already exceeds ``max_dist`` are abandoned and reported as ``inf``.
+    """
+    query = _as_2d(query)
+    candidates = np.asarray(candidates, dtype=np.float64)
+    if candidates.ndim == 2:
+        candidates = candidates[..., None]
+    n_cand, m = candidates.shape[0], candidates.shape[1]
+    n = query.shape[0]
+    result = np.full(n_cand, np.inf)
+    if n == 0 or m == 0 or n_cand == 0:
+        return result
+
+    active = np.arange(n_cand)
+    lo, hi = _band_limits(0, n, m, band)
+    cost = _pairwise_cost(query[:1], candidates[:, lo:hi])[:, 0, :]
+    row = np.cumsum(cost, axis=-1)
+    if lo > 0:  # 帯が (0, 0) を含まない場合は経路が始められない
+        row[:] = np.inf
+    prev_lo, prev_hi = lo, hi
+
+    for i in range(1, n):
+        lo, hi = _band_limits(i, n, m, band)
+        cost = _pairwise_cost(query[i : i + 1], candidates[active, lo:hi])[:, 0, :]
+        row = _row_update(row, cost, lo, hi, prev_lo, prev_hi)
+        prev_lo, prev_hi = lo, hi
+        if np.isfinite(max_dist):
+            # 早期打ち切り: 行の最小値が閾値を超えた候補は以降の行を計算しない
+            alive = row.min(axis=-1) <= max_dist
+            if not alive.all():
+                active, row = active[alive], row[alive]
+                if active.size == 0:
+                    return result
+
+    if prev_hi == m:
+        result[active] = row[:, -1]
+    return np.where(result <= max_dist, result, np.inf)
+
+
+def dtw_distance(
+    a: np.ndarray,
+    b: np.ndarray,
+    *,
+    band: Optional[int] = DEFAULT_BAND,
+    max_dist: float = np.inf,
+) -> float:
+    """Banded DTW distance between two (n, F) / (m, F) series (``inf`` if abandoned)."""
+    b = _as_2d(b)
+    return float(dtw_distances(a, b[None], band=band, max_dist=max_dist)[0])
+
+
+def dtw_path(
+    a: np.ndarray,
+    b: np.ndarray,
+    *,
+    band: Optional[int] = DEFAULT_BAND,
+) -> Tuple[float, np.ndarray]:
+    """DTW distance and optimal warping path, an (L, 2) array of aligned (i, j) frame pairs."""
+    a, b = _as_2d(a), _as_2d(b)
+    n, m = a.shape[0], b.shape[0]
+    if n == 0 or m == 0:
+        return np.inf, np.empty((0, 2), dtype=int)
+
+    acc = np.full((n, m), np.inf)
+    lo, hi = _band_limits(0, n, m, band)
+    costs = _pairwise_cost(a, b)
+    acc[0, lo:hi] = np.cumsum(costs[0, lo:hi]) if lo == 0 else np.inf
+    prev_lo, prev_hi = lo, hi
+    for i in range(1, n):
+        lo, hi = _band_limits(i, n, m, band)
+        acc[i, lo:hi] = _row_update(acc[i - 1, prev_lo:prev_hi], costs[i, lo:hi], lo, hi, prev_lo, prev_hi)
+        prev_lo, prev_hi = lo, hi
+
+    distance = float(acc[-1, -1])
+    if not np.isfinite(distance):
+        return distance, np.empty((0, 2), dtype=int)
+
+    # 終点から逆にたどって経路を復元する
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        options = []
+        if i > 0 and j > 0:
+            options.append((acc[i - 1, j - 1], i - 1, j - 1))
+        if i > 0:
+            options.append((acc[i - 1, j], i - 1, j))
+        if j > 0:
+            options.append((acc[i, j - 1], i, j - 1))
+        _, i, j = min(options, key=lambda item: item[0])
+        path.append((i, j))
+    return distance, np.array(path[::-1], dtype=int)
+
+
+def envelope(series: np.ndarray, band: int = DEFAULT_BAND) -> Tuple[np.ndarray, np.ndarray]:
+    """Running (upper, lower) envelope over a ±``band`` window of a (m, F) or stacked (N, m, F) series."""
+    series = _as_2d(series)
+    m = series.shape[-2]
+    pad = [(0, 0)] * series.ndim
+    pad[-2] = (band, band)
+    padded = np.pad(series, pad, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * band + 1, axis=-2)[..., :m, :, :]
+    return windows.max(axis=-1), windows.min(axis=-1)
+
+
+def lb_keogh(query: np.ndarray, upper: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    """LB_Keogh lower bound of DTW(query, candidate) from the candidate envelope(s).
+
+    ``upper``/``lower`` are (m, F) or stacked (N, m, F); the query must have the
+    same length as the candidates. Returns a scalar or an (N,) array.
+    """
+    query = _as_2d(query)
+    over = np.clip(query - upper, 0.0, None)
+    under = np.clip(lower - query, 0.0, None)
+    # 各フレームで包絡線の外にはみ出した量のユークリッド長の和
+    return np.sqrt(np.sum((over + under) ** 2, axis=-1)).sum(axis=-1)
+
+
+def search_top_k(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int = 1,
+    *,
+    band: int = DEFAULT_BAND,
+    envelopes: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    chunk_size: int = 64,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Top-k DTW search with LB_Keogh pruning and early abandoning.
+
+    ``candidates`` is (N, m, F) with ``m`` equal to the query length.
+    ``envelopes`` are the candidates' precomputed ``(upper, lower)`` (N, m, F),
+    computed here when omitted. Candidates are visited in lower-bound order in
+    chunks; a chunk whose smallest bound already exceeds the current k-th best
+    distance ends the search. Returns ``(indices, distances, n_full_dtw)``
+    sorted best first, where ``n_full_dtw`` counts the candidates that needed
+    full DTW.
+    """
+    query = _as_2d(query)
+    candidates = np.asarray(candidates, dtype=np.float64)
+    n_cand = candidates.shape[0]
+    k = max(0, min(int(k), n_cand))
+    if k == 0:
+        return np.empty(0, dtype=int), np.empty(0), 0
+    upper, lower = envelopes if envelopes is not None else envelope(candidates, band)
+
+    bounds = lb_keogh(query, upper, lower)
+    order = np.argsort(bounds, kind="stable")
+    best_idx = np.empty(0, dtype=int)
+    best_dist = np.empty(0)
+    evaluated = 0
+    for start in range(0, n_cand, chunk_size):
+        chunk = order[start : start + chunk_size]
+        threshold = best_dist[-1] if best_dist.size == k else np.inf
+        # 下限値が現在の k 番目より大きい候補は DTW を計算するまでもなく除外
+        chunk = chunk[bounds[chunk] <= threshold]
+        if chunk.size == 0:
+            break
+        dists = dtw_distances(query, candidates[chunk], band=band, max_dist=threshold)
+        evaluated += chunk.size
+        merged_idx = np.concatenate([best_idx, chunk])
+        merged_dist = np.concatenate([best_dist, dists])
+        keep = np.lexsort((merged_idx, merged_dist))[:k]
+        keep = keep[np.isfinite(merged_dist[keep])]
+        best_idx, best_dist = merged_idx[keep], merged_dist[keep]
+    return best_idx, best_dist, evaluated
@@ -0,0 +1,167 @@
+"""On-disk matrix of reference clip embeddings with cosine top-k search.
+
+The LSTM classifier's penultimate layer (see ``AugmentedLSTM.embed`` in
+``30_Classification_LSTM/infer_similarity.py``) maps a clip to a small vector.
+``build_embedding_index.py`` stores those vectors for every reference clip
+as one ``(n_references, dim)`` float32 matrix in an ``.npz`` next to the
+library, together with each clip's relative path, player and CSV signature and
+the signature of the model file that produced them. Rows are L2-normalised on
+load, so a cosine top-k query is a single matrix-vector product.
+
+This module only needs NumPy; computing the query embedding is up to the caller.
+
+Usage example:
+    index = EmbeddingIndex.for_file("pose_tracks/Cleaned_Data/players/.embedding_index.npz")
+    matches = index.search(user_embedding, k=5)
+    best = matches[0].player, matches[0].path, matches[0].score
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+EMBEDDING_INDEX_NAME = ".embedding_index.npz"
+INDEX_VERSION = 1
+
+PathLike = Union[str, Path]
+
+# 常駐ワーカーでは読み込んだ行列をプロセス内で使い回す（ファイルが更新されたら読み直す）
+_INDEX_CACHE: Dict[str, Tuple[int, "EmbeddingIndex"]] = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def file_signature(path: PathLike) -> Tuple[int, int]:
+    stat = Path(path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def model_signature(model_path: PathLike) -> str:
+    """Identify a weights file by name, mtime and size (embeddings are only valid for the same weights)."""
+    mtime_ns, size = file_signature(model_path)
+    return f"{Path(model_path).name}:{mtime_ns}:{size}"
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+@dataclass(frozen=True)
+class EmbeddingMatch:
+    """One search hit: a reference clip, its player and the cosine similarity to the query."""
+
+    path: Path
+    player: str
+    score: float
+    rank: int
+
+
+class EmbeddingIndex:
+    """Reference clip embeddings (one row per clip) searchable by cosine similarity."""
+
+    def __init__(
+        self,
+        root: PathLike,
+        keys: Sequence[str],
+        players: Sequence[str],
+        embeddings: np.ndarray,
+        *,
+        signatures: Optional[np.ndarray] = None,
+        model_signature: str = "",
+    ) -> None:
+        self.root = Path(root)
+        self.keys = [str(key) for key in keys]
+        self.players = [str(player) for player in players]
+        self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.keys), -1)
+        self.signatures = (
+            np.asarray(signatures, dtype=np.int64).reshape(len(self.keys), 2)
+            if signatures is not None
+            else np.zeros((len(self.keys), 2), dtype=np.int64)
+        )
+        self.model_signature = model_signature
+        self._unit = _normalize_rows(self.embeddings)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    @classmethod
+    def load(cls, path: PathLike) -> "EmbeddingIndex":
+        """Read an index written by :meth:`save`; clip paths resolve against the file's directory."""
+        path = Path(path)
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError(f"Unsupported embedding index version in {path}")
+            return cls(
+                path.parent,
+                [str(key) for key in data["keys"]],
+                [str(player) for player in data["players"]],
+                data["embeddings"],
+                signatures=data["signatures"],
+                model_signature=str(data["model_signature"]),
+            )
+
+    @classmethod
+    def for_file(cls, path: PathLike) -> "EmbeddingIndex":
+        """Process-wide cached :meth:`load` that reloads when the file changes."""
+        path = Path(path)
+        key = str(path.resolve())
+        mtime_ns = file_signature(path)[0]
+        with _INDEX_CACHE_LOCK:
+            cached = _INDEX_CACHE.get(key)
+            if cached is None or cached[0] != mtime_ns:
+                cached = (mtime_ns, cls.load(path))
+                _INDEX_CACHE[key] = cached
+            return cached[1]
+
+    def save(self, path: PathLike) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 途中で読まれても壊れたファイルを掴まないよう、一時ファイルに書いてから置き換える
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as fh:
+            np.savez(
+                fh,
+                version=INDEX_VERSION,
+                keys=np.asarray(self.keys, dtype=str),
+                players=np.asarray(self.players, dtype=str),
+                embeddings=self.embeddings,
+                signatures=self.signatures,
+                model_signature=self.model_signature,
+            )
+        tmp_path.replace(path)
+        return path
+
+    def search_batch(
+        self, queries: np.ndarray, k: int = 1, *, player: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows by cosine similarity for each query (Q, dim); returns ``(indices, scores)``, both (Q, k).
+
+        With ``player`` only that player's clips are candidates.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        scores = queries @ self._unit.T
+        n_candidates = scores.shape[1]
+        if player is not None:
+            allowed = np.asarray(self.players) == player
+            scores = np.where(allowed[None, :], scores, -np.inf)
+            n_candidates = int(allowed.sum())
+        k = max(0, min(int(k), n_candidates))
+        # 同点は行の順（浅い階層が先）を保つ
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return order, np.take_along_axis(scores, order, axis=1)
+
+    def search(self, query: np.ndarray, k: int = 1, *, player: Optional[str] = None) -> List[EmbeddingMatch]:
+        """Top-k reference clips for one query embedding, best first."""
+        indices, scores = self.search_batch(np.asarray(query)[None, :], k, player=player)
+        return [
+            EmbeddingMatch(path=self.root / self.keys[idx], player=self.players[idx], score=float(score), rank=rank)
+            for rank, (idx, score) in enumerate(zip(indices[0], scores[0]))
+        ]
@@ -0,0 +1,194 @@
+"""Binary keypoint store used alongside ``keypoints_with_tracks.csv``.
+
+Each clip's keypoints can be saved as an uncompressed ``.npz`` next to the CSV:
+a float32 ``keypoints`` matrix (rows x ``kpt_*`` columns) plus the
+``frame_index`` / ``frame_name`` / ``track_id`` metadata and the column names.
+Loading it is a handful of array reads instead of a text parse, and
+:func:`load_keypoints` is the single entry point every consumer uses: it
+prefers the binary file and falls back to the CSV when the binary file is
+missing or older than the CSV.
+
+Sequence consumers that only need the coordinate matrix can use
+:func:`load_keypoint_arrays` and skip DataFrame construction entirely.
+
+Usage example:
+    df = load_keypoints("pose_tracks/players/Fed/clip_1/keypoints_with_tracks.csv")
+    arrays = load_keypoint_arrays("pose_tracks/players/Fed/clip_1")
+    sequence = arrays.exclude_frames("(1)").keypoints
+
+    # 既存の CSV から .npz を一括生成
+    python -m pose_analysis.keypoint_store --root pose_tracks
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+KEYPOINTS_CSV_NAME = "keypoints_with_tracks.csv"
+KEYPOINTS_NPZ_NAME = "keypoints_with_tracks.npz"
+META_COLUMNS = ("frame_index", "frame_name", "track_id")
+
+PathLike = Union[str, Path]
+
+
+def binary_path_for(path: PathLike) -> Path:
+    """Return the ``.npz`` path that belongs to a CSV path or clip directory."""
+    path = Path(path)
+    if path.is_dir():
+        return path / KEYPOINTS_NPZ_NAME
+    return path.with_suffix(".npz")
+
+
+def csv_path_for(path: PathLike) -> Path:
+    """Return the ``.csv`` path that belongs to an ``.npz`` path or clip directory."""
+    path = Path(path)
+    if path.is_dir():
+        return path / KEYPOINTS_CSV_NAME
+    return path.with_suffix(".csv")
+
+
+def keypoints_exist(path: PathLike) -> bool:
+    """True when either the CSV or the binary keypoint file is present."""
+    return csv_path_for(path).exists() or binary_path_for(path).exists()
+
+
+@dataclass
+class KeypointArrays:
+    """Clip keypoints as plain arrays (the ``keypoints_with_tracks.csv`` columns, unparsed)."""
+
+    columns: List[str]
+    keypoints: np.ndarray  # float32, (rows, len(columns))
+    frame_index: Optional[np.ndarray] = None
+    frame_name: Optional[np.ndarray] = None
+    track_id: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "KeypointArrays":
+        columns = [col for col in df.columns if col.startswith("kpt_")]
+        return cls(
+            columns=columns,
+            keypoints=df[columns].to_numpy(dtype=np.float32),
+            frame_index=df["frame_index"].to_numpy(dtype=np.int32) if "frame_index" in df.columns else None,
+            frame_name=df["frame_name"].astype(str).to_numpy(dtype=str) if "frame_name" in df.columns else None,
+            track_id=df["track_id"].to_numpy(dtype=np.int32) if "track_id" in df.columns else None,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.keypoints.astype(np.float64), columns=self.columns)
+        for position, name in enumerate(META_COLUMNS):
+            values = getattr(self, name)
+            if values is not None:
+                df.insert(min(position, len(df.columns)), name, values.astype(object) if name == "frame_name" else values)
+        return df
+
+    def exclude_frames(self, substring: str) -> "KeypointArrays":
+        """Drop rows whose ``frame_name`` contains ``substring`` (e.g. ``"(1)"`` duplicates)."""
+        if self.frame_name is None:
+            return self
+        keep = np.char.find(self.frame_name.astype(str), substring) < 0
+        if keep.all():
+            return self
+        return KeypointArrays(
+            columns=self.columns,
+            keypoints=self.keypoints[keep],
+            frame_index=self.frame_index[keep] if self.frame_index is not None else None,
+            frame_name=self.frame_name[keep],
+            track_id=self.track_id[keep] if self.track_id is not None else None,
+        )
+
+
+def write_keypoint_store(df: pd.DataFrame, path: PathLike) -> Path:
+    """Save ``df`` (``keypoints_with_tracks.csv`` layout) as a binary ``.npz`` and return its path."""
+    npz_path = binary_path_for(path)
+    npz_path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = KeypointArrays.from_frame(df)
+    members = {"columns": np.asarray(arrays.columns, dtype=str), "keypoints": arrays.keypoints}
+    for name in META_COLUMNS:
+        if getattr(arrays, name) is not None:
+            members[name] = getattr(arrays, name)
+
+    # 途中で読まれても壊れたファイルを掴まないよう、一時ファイルに書いてから置き換える
+    tmp_path = npz_path.with_name(npz_path.name + ".tmp")
+    with open(tmp_path, "wb") as fh:
+        np.savez(fh, **members)
+    tmp_path.replace(npz_path)
+    return npz_path
+
+
+def read_keypoint_store(npz_path: PathLike) -> KeypointArrays:
+    """Read a binary keypoint file written by :func:`write_keypoint_store`."""
+    with np.load(npz_path, allow_pickle=False) as data:
+        files = set(data.files)
+        return KeypointArrays(
+            columns=[str(col) for col in data["columns"]],
+            keypoints=data["keypoints"],
+            **{name: data[name] for name in META_COLUMNS if name in files},
+        )
+
+
+def _fresh_binary(path: PathLike) -> Optional[Path]:
+    csv_path = csv_path_for(path)
+    npz_path = binary_path_for(path)
+    if not npz_path.exists():
+        return None
+    if csv_path.exists() and npz_path.stat().st_mtime < csv_path.stat().st_mtime:
+        return None
+    return npz_path
+
+
+def load_keypoint_arrays(path: PathLike, *, prefer_binary: bool = True) -> KeypointArrays:
+    """Array form of :func:`load_keypoints`; skips building a DataFrame when the binary file is used."""
+    npz_path = _fresh_binary(path) if prefer_binary else None
+    if npz_path is not None:
+        try:
+            return read_keypoint_store(npz_path)
+        except (OSError, KeyError, ValueError) as exc:
+            print(f"⚠️ Failed to read {npz_path}, falling back to CSV: {exc}")
+    return KeypointArrays.from_frame(pd.read_csv(csv_path_for(path)))
+
+
+def load_keypoints(path: PathLike, *, prefer_binary: bool = True) -> pd.DataFrame:
+    """Load clip keypoints from the binary store when it is up to date, otherwise from CSV.
+
+    ``path`` may be the CSV, the ``.npz`` or the clip directory. The binary
+    file is only used when it is at least as new as the CSV, so CSVs rewritten
+    by older tools are never shadowed by stale binaries.
+    """
+    npz_path = _fresh_binary(path) if prefer_binary else None
+    if npz_path is not None:
+        try:
+            return read_keypoint_store(npz_path).to_frame()
+        except (OSError, KeyError, ValueError) as exc:
+            print(f"⚠️ Failed to read {npz_path}, falling back to CSV: {exc}")
+    return pd.read_csv(csv_path_for(path))
+
+
+def convert_tree(root: PathLike, *, force: bool = False) -> int:
+    """Write ``.npz`` files for every ``keypoints_with_tracks.csv`` under ``root``; return the count."""
+    converted = 0
+    for csv_path in sorted(Path(root).rglob(KEYPOINTS_CSV_NAME)):
+        npz_path = binary_path_for(csv_path)
+        if not force and npz_path.exists() and npz_path.stat().st_mtime >= csv_path.stat().st_mtime:
+            continue
+        write_keypoint_store(pd.read_csv(csv_path), npz_path)
+        converted += 1
+    return converted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert keypoints_with_tracks.csv files to the binary store")
+    parser.add_argument("--root", type=Path, required=True, help="Directory to scan (e.g. pose_tracks)")
+    parser.add_argument("--force", action="store_true", help="Rewrite binaries even when they are up to date")
+    args = parser.parse_args()
+    converted = convert_tree(args.root, force=args.force)
+    print(f"💾 {converted} keypoint files converted under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
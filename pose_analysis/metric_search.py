@@ -0,0 +1,135 @@
+"""Vectorised nearest-neighbour search over :class:`PoseMetrics` vectors.
+
+All reference clips are held as one ``(n_references, n_metrics)`` matrix and a
+query (or a batch of queries) is scored against every reference in a single
+NumPy expression. The default distance is the weighted L1 sum previously
+hand-rolled in ``csv_similarity_calculator.find_most_similar_csv``: metrics
+missing on either side (e.g. no impact shoulder angle) contribute nothing.
+
+Usage example:
+    search = MetricSearch.from_index(ReferenceMetricsIndex.for_directory(players_dir))
+    matches = search.search(compute_pose_metrics(user_csv), k=3)
+    best = matches[0].path, matches[0].distance
+"""
+from __future__ import annotations
+
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pose_metrics import PoseMetrics
+
+METRIC_FIELDS: Tuple[str, ...] = (
+    "trophy_knee_angle",
+    "trophy_right_arm_extension",
+    "trophy_left_arm_lift",
+    "impact_right_shoulder_angle",
+)
+NORMALIZATIONS = ("none", "zscore", "range")
+
+
+def metrics_to_vector(metrics: PoseMetrics, fields: Sequence[str] = METRIC_FIELDS) -> np.ndarray:
+    """Return ``metrics`` as a float vector in ``fields`` order (``None`` becomes NaN)."""
+    values = [getattr(metrics, name) for name in fields]
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+
+@dataclass(frozen=True)
+class MetricMatch:
+    """One search hit: the reference clip and its distance to the query."""
+
+    path: Path
+    distance: float
+    rank: int
+
+
+class MetricSearch:
+    """Top-k search over a fixed set of reference metric vectors."""
+
+    def __init__(
+        self,
+        paths: Sequence[Path],
+        vectors: np.ndarray,
+        *,
+        fields: Sequence[str] = METRIC_FIELDS,
+        weights: Optional[Mapping[str, float]] = None,
+        normalization: str = "none",
+    ) -> None:
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"normalization must be one of {NORMALIZATIONS}, got {normalization!r}")
+        self.paths = [Path(p) for p in paths]
+        self.fields = tuple(fields)
+        self.vectors = np.asarray(vectors, dtype=np.float64).reshape(len(self.paths), len(self.fields))
+        self.normalization = normalization
+
+        self.weights = np.ones(len(self.fields))
+        for name, weight in (weights or {}).items():
+            if name not in self.fields:
+                raise KeyError(f"Unknown metric for weighting: {name}")
+            self.weights[self.fields.index(name)] = float(weight)
+
+        # 正規化の係数は参照集合から1度だけ求める
+        self._center = np.zeros(len(self.fields))
+        self._scale = np.ones(len(self.fields))
+        if normalization != "none" and len(self.paths):
+            # 全参照で欠損している指標は係数を既定値に戻す（空スライスの警告は無視）
+            with warnings.catch_warnings(), np.errstate(all="ignore"):
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                if normalization == "zscore":
+                    center = np.nanmean(self.vectors, axis=0)
+                    scale = np.nanstd(self.vectors, axis=0)
+                else:
+                    center = np.nanmin(self.vectors, axis=0)
+                    scale = np.nanmax(self.vectors, axis=0) - center
+            self._center = np.nan_to_num(center, nan=0.0)
+            self._scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+        self._normalized = self._normalize(self.vectors)
+
+    @classmethod
+    def from_metrics(cls, references: Sequence[Tuple[Path, PoseMetrics]], **kwargs) -> "MetricSearch":
+        fields = kwargs.get("fields", METRIC_FIELDS)
+        vectors = np.array([metrics_to_vector(m, fields) for _, m in references]).reshape(len(references), len(fields))
+        return cls([path for path, _ in references], vectors, **kwargs)
+
+    @classmethod
+    def from_index(cls, index, **kwargs) -> "MetricSearch":
+        """Build a search over the current entries of a :class:`ReferenceMetricsIndex`."""
+        return cls.from_metrics(index.entries(), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors - self._center) / self._scale
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """Weighted L1 distance from each query (Q, M) to every reference -> (Q, N)."""
+        queries = self._normalize(np.atleast_2d(np.asarray(queries, dtype=np.float64)))
+        diffs = np.abs(queries[:, None, :] - self._normalized[None, :, :])
+        # どちらかに欠損がある指標は距離に加えない
+        return np.nansum(diffs * self.weights, axis=2)
+
+    def search_batch(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k for every query; returns ``(indices, distances)``, both shaped (Q, k).
+
+        Ties keep reference order, so earlier references win.
+        """
+        dist = self.distances(queries)
+        k = max(0, min(int(k), dist.shape[1]))
+        if k == 0:
+            empty = np.empty((dist.shape[0], 0))
+            return empty.astype(int), empty
+        order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        return order, np.take_along_axis(dist, order, axis=1)
+
+    def search(self, query: PoseMetrics | np.ndarray, k: int = 1) -> List[MetricMatch]:
+        """Top-k matches for a single query, best first."""
+        vector = metrics_to_vector(query, self.fields) if isinstance(query, PoseMetrics) else np.asarray(query)
+        indices, distances = self.search_batch(vector[None, :], k)
+        return [
+            MetricMatch(path=self.paths[idx], distance=float(dist), rank=rank)
+            for rank, (idx, dist) in enumerate(zip(indices[0], distances[0]))
+        ]
@@ -0,0 +1,217 @@
+"""Serve phase segmentation from velocity and angle signals.
+
+``find_trophy_frame`` / ``find_impact_frame`` used to search fixed windows
+(frames 15-30 and 25-40) that only fit 48-frame clips cut the same way.
+:func:`detect_serve_phases_batch` instead scans the whole sequence: a few
+smoothed per-frame signals are computed once and every phase is a masked
+argmin/argmax over them, so the cost is linear in the clip length.
+
+* impact – highest point of the hitting arm (right elbow / wrist).
+* trophy – deepest knee bend in the run-up to impact.
+* racket drop – hitting wrist furthest below its shoulder between trophy
+  and impact.
+* start / finish – where whole-body motion rises above / falls back below a
+  fraction of its peak around the stroke.
+
+``confidence`` (0-1) rates how clearly the signals support the result: phase
+order, prominence of the impact peak and of the knee bend, wrist speed at
+impact, and the share of frames with usable joints.
+
+Usage example:
+    phases = detect_serve_phases("pose_tracks/players/Fed/clip_1/keypoints_with_tracks.csv")
+    print(phases.trophy, phases.impact, phases.confidence)
+"""
+from __future__ import annotations
+
+import warnings
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .pose_metrics import KEYPOINT_NAME_TO_ID, PoseSequence, _angle_nd, stack_pose_sequences
+
+PHASE_NAMES = ("start", "trophy", "racket_drop", "impact", "finish")
+DEFAULT_SMOOTHING = 3
+MOTION_THRESHOLD = 0.25
+# トロフィーはインパクトから遡って「動き出し〜インパクト」のこの割合の範囲で探す
+TROPHY_SEARCH_SPAN = 0.75
+MOTION_PEAK_PERCENTILE = 90.0
+
+
+@dataclass(frozen=True)
+class ServePhases:
+    """Key frames of one serve and the confidence of the segmentation."""
+
+    start: int
+    trophy: int
+    racket_drop: int
+    impact: int
+    finish: int
+    confidence: float
+
+    def frames(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in PHASE_NAMES}
+
+    def to_dict(self) -> Dict[str, float]:
+        return asdict(self)
+
+
+def _smooth(series: np.ndarray, valid: np.ndarray, window: int) -> np.ndarray:
+    """Centred moving average along axis 1 via cumulative sums, ignoring NaN and padded frames."""
+    if window <= 1:
+        return np.where(valid, series, np.nan)
+    usable = valid & ~np.isnan(series)
+    values = np.where(usable, series, 0.0)
+    zeros = np.zeros((series.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+    counts = np.concatenate([zeros, np.cumsum(usable, axis=1)], axis=1)
+    n_frames = series.shape[1]
+    half = window // 2
+    lo = np.clip(np.arange(n_frames) - half, 0, n_frames)
+    hi = np.clip(np.arange(n_frames) + half + 1, 0, n_frames)
+    total = sums[:, hi] - sums[:, lo]
+    count = counts[:, hi] - counts[:, lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        smoothed = total / count
+    return np.where(valid & (count > 0), smoothed, np.nan)
+
+
+def _masked_arg(series: np.ndarray, mask: np.ndarray, *, maximum: bool, fallback: np.ndarray) -> np.ndarray:
+    """Row-wise argmax/argmin of ``series`` within ``mask`` (``fallback`` where nothing is usable)."""
+    fill = -np.inf if maximum else np.inf
+    masked = np.where(mask & ~np.isnan(series), series, fill)
+    idx = np.argmax(masked, axis=1) if maximum else np.argmin(masked, axis=1)
+    found = np.isfinite(masked[np.arange(len(series)), idx])
+    return np.where(found, idx, fallback)
+
+
+def _first_true(mask: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+    idx = np.argmax(mask, axis=1)
+    return np.where(mask.any(axis=1), idx, fallback)
+
+
+def _nan_stat(func, values: np.ndarray) -> np.ndarray:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return func(values, axis=1)
+
+
+def detect_serve_phases_batch(
+    coords: np.ndarray,
+    lengths: np.ndarray,
+    *,
+    smoothing: int = DEFAULT_SMOOTHING,
+    motion_threshold: float = MOTION_THRESHOLD,
+) -> Dict[str, np.ndarray]:
+    """Phase frames and confidence for ``(B, T, 17, 2)`` NaN-padded joints; returns arrays of shape (B,)."""
+    ids = KEYPOINT_NAME_TO_ID
+    joint = lambda name: coords[:, :, ids[name]]  # noqa: E731
+    n_batch, n_frames = coords.shape[:2]
+    lengths = np.asarray(lengths, dtype=int)
+    rows = np.arange(n_batch)
+    frames = np.arange(n_frames)
+    valid = frames[None, :] < lengths[:, None]
+    last = np.maximum(lengths - 1, 0)
+    if n_frames == 0:
+        zeros = np.zeros(n_batch, dtype=int)
+        return {**{name: zeros.copy() for name in PHASE_NAMES}, "confidence": np.zeros(n_batch)}
+
+    # 打球腕の高さ（画像座標は y が下向きなので符号を反転）と膝の曲がり
+    height_raw = -np.fmin(joint("right_elbow")[..., 1], joint("right_wrist")[..., 1])
+    knee_raw = np.fmin(
+        _angle_nd(joint("left_hip"), joint("left_knee"), joint("left_ankle")),
+        _angle_nd(joint("right_hip"), joint("right_knee"), joint("right_ankle")),
+    )
+    height = _smooth(height_raw, valid, smoothing)
+    knee = _smooth(knee_raw, valid, smoothing)
+
+    # 速度は体の大きさ（足首〜肩の高さの中央値）で正規化する
+    ground = np.fmax(joint("left_ankle")[..., 1], joint("right_ankle")[..., 1])
+    mid_shoulder_y = (joint("left_shoulder")[..., 1] + joint("right_shoulder")[..., 1]) / 2
+    scale = _nan_stat(np.nanmedian, np.where(valid, ground - mid_shoulder_y, np.nan))
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    step = np.linalg.norm(np.diff(coords, axis=1), axis=-1) / scale[:, None, None]  # (B, T-1, 17)
+    step = np.concatenate([step[:, :1], step], axis=1) if n_frames > 1 else np.zeros((n_batch, 1, coords.shape[2]))
+    energy = _smooth(_nan_stat(np.nanmean, step.transpose(0, 2, 1)), valid, smoothing)
+    wrist_speed = _smooth(step[:, :, ids["right_wrist"]], valid, smoothing)
+
+    peak_energy = _nan_stat(lambda v, axis: np.nanpercentile(v, MOTION_PEAK_PERCENTILE, axis=axis), np.where(valid, energy, np.nan))
+    active = valid & (energy >= motion_threshold * peak_energy[:, None])
+    motion_start = _first_true(active, np.zeros(n_batch, dtype=int))
+
+    impact = _masked_arg(height, valid, maximum=True, fallback=last * 2 // 3)
+    # 動き出し直後の構えで膝が曲がっている場合を拾わないよう、動き出し〜インパクトの後半側から探す
+    earliest = impact - (TROPHY_SEARCH_SPAN * np.maximum(impact - motion_start, 0)).astype(int)
+    before_impact = valid & (frames[None, :] >= earliest[:, None]) & (frames[None, :] < impact[:, None])
+    trophy = _masked_arg(knee, before_impact, maximum=False, fallback=impact // 2)
+    # ラケットダウン: トロフィー〜インパクトの間で手首が肩より最も下がるフレーム
+    wrist_drop = _smooth(joint("right_wrist")[..., 1] - joint("right_shoulder")[..., 1], valid, smoothing)
+    between = valid & (frames[None, :] >= trophy[:, None]) & (frames[None, :] <= impact[:, None])
+    racket_drop = _masked_arg(wrist_drop, between, maximum=True, fallback=(trophy + impact) // 2)
+
+    start = np.minimum(motion_start, trophy)
+    # インパクト後、動きが閾値を下回った最初のフレームを終了とする
+    settled = valid & (frames[None, :] > impact[:, None]) & ~active
+    finish = _first_true(settled, last)
+
+    # --- 信頼度 ---
+    ordered = (start <= trophy) & (trophy <= racket_drop) & (racket_drop <= impact) & (impact <= finish) & (trophy < impact)
+    h_min, h_max, h_med = (_nan_stat(f, height) for f in (np.nanmin, np.nanmax, np.nanmedian))
+    k_min, k_max, k_med = (_nan_stat(f, knee) for f in (np.nanmin, np.nanmax, np.nanmedian))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        impact_prominence = 2 * (height[rows, impact] - h_med) / (h_max - h_min)
+        knee_prominence = 2 * (k_med - knee[rows, trophy]) / (k_max - k_min)
+        near_impact = valid & (np.abs(frames[None, :] - impact[:, None]) <= 2)
+        speed_at_impact = _nan_stat(np.nanmax, np.where(near_impact, wrist_speed, np.nan)) / _nan_stat(
+            np.nanmax, np.where(valid, wrist_speed, np.nan)
+        )
+    scores = np.stack([impact_prominence, knee_prominence, speed_at_impact], axis=1)
+    scores = np.clip(np.nan_to_num(scores, nan=0.0), 0.0, 1.0)
+    coverage = (valid & np.isfinite(height_raw) & np.isfinite(knee_raw)).sum(axis=1) / np.maximum(lengths, 1)
+    confidence = np.where(ordered, scores.mean(axis=1) * coverage, 0.0)
+
+    return {
+        "start": start.astype(int),
+        "trophy": trophy.astype(int),
+        "racket_drop": racket_drop.astype(int),
+        "impact": impact.astype(int),
+        "finish": finish.astype(int),
+        "confidence": confidence,
+    }
+
+
+def detect_serve_phases(
+    source: Path | str | pd.DataFrame | PoseSequence,
+    *,
+    smoothing: int = DEFAULT_SMOOTHING,
+    motion_threshold: float = MOTION_THRESHOLD,
+) -> ServePhases:
+    """Detect the serve phases of one clip (keypoint file, DataFrame or :class:`PoseSequence`)."""
+    seq = PoseSequence.load(source)
+
+    def compute():
+        result = detect_serve_phases_batch(
+            seq.coords[None], np.array([len(seq)]), smoothing=smoothing, motion_threshold=motion_threshold
+        )
+        return ServePhases(
+            **{name: int(result[name][0]) for name in PHASE_NAMES}, confidence=float(result["confidence"][0])
+        )
+
+    return seq._cached(f"phases:{smoothing}:{motion_threshold}", compute)
+
+
+def detect_serve_phases_many(
+    sources: Sequence[Path | str | pd.DataFrame | PoseSequence],
+    **kwargs,
+) -> Tuple[ServePhases, ...]:
+    """:func:`detect_serve_phases` for many clips in one vectorised pass."""
+    coords, lengths, _ = stack_pose_sequences(sources)
+    result = detect_serve_phases_batch(coords, lengths, **kwargs)
+    return tuple(
+        ServePhases(**{name: int(result[name][i]) for name in PHASE_NAMES}, confidence=float(result["confidence"][i]))
+        for i in range(len(lengths))
+    )
@@ -1,6 +1,7 @@
 """Utilities for extracting key tennis pose metrics from pose-tracking CSV files."""
 from __future__ import annotations
 
+import warnings
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
@@ -8,6 +9,8 @@ from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import numpy as np
 import pandas as pd
 
+from .keypoint_store import load_keypoints
+
 # Mapping based on COCO keypoint indices used in pose_tracks CSVs.
 KEYPOINT_NAME_TO_ID: Dict[str, int] = {
     "nose": 0,
@@ -35,15 +38,17 @@ def _column_names(joint_id: int) -> Tuple[str, str]:
 
 
 def load_pose_sequence(csv_path: Path | str) -> pd.DataFrame:
-    """Load a keypoint CSV into a DataFrame indexed by frame."""
-    df = pd.read_csv(csv_path)
+    """Load clip keypoints (binary store or CSV) into a DataFrame indexed by frame."""
+    df = load_keypoints(csv_path)
     if "frame_index" in df.columns:
         df = df.set_index("frame_index")
     return df
 
 
-def get_joint_series(df: pd.DataFrame, joint_name: str) -> np.ndarray:
+def get_joint_series(df: pd.DataFrame | "PoseSequence", joint_name: str) -> np.ndarray:
     """Return an (n_frames, 2) array of XY coordinates for the given joint."""
+    if isinstance(df, PoseSequence):
+        return df.joint(joint_name)
     joint_id = KEYPOINT_NAME_TO_ID[joint_name]
     x_col, y_col = _column_names(joint_id)
     if x_col not in df.columns or y_col not in df.columns:
@@ -67,49 +72,145 @@ def compute_angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
     return np.degrees(np.arccos(cos_angle))
 
 
-def knee_angles(df: pd.DataFrame) -> Dict[str, np.ndarray]:
-    return {
-        "left": compute_angle(
-            get_joint_series(df, "left_hip"),
-            get_joint_series(df, "left_knee"),
-            get_joint_series(df, "left_ankle"),
-        ),
-        "right": compute_angle(
-            get_joint_series(df, "right_hip"),
-            get_joint_series(df, "right_knee"),
-            get_joint_series(df, "right_ankle"),
-        ),
-    }
+# 時系列比較に使う関節角度（A-B-C の B における角度）。"trunk" は体幹の傾きで別扱い
+ANGLE_SERIES_DEFINITIONS: Dict[str, Optional[Tuple[str, str, str]]] = {
+    "left_knee": ("left_hip", "left_knee", "left_ankle"),
+    "right_knee": ("right_hip", "right_knee", "right_ankle"),
+    "left_elbow": ("left_shoulder", "left_elbow", "left_wrist"),
+    "right_elbow": ("right_shoulder", "right_elbow", "right_wrist"),
+    "left_shoulder": ("left_hip", "left_shoulder", "left_elbow"),
+    "right_shoulder": ("right_hip", "right_shoulder", "right_elbow"),
+    "trunk": None,
+}
+ANGLE_SERIES_NAMES: Tuple[str, ...] = tuple(ANGLE_SERIES_DEFINITIONS)
 
 
-def shoulder_elbow_metrics(df: pd.DataFrame) -> Dict[str, np.ndarray]:
-    return {
-        "right_arm_extension": compute_angle(
-            get_joint_series(df, "left_shoulder"),
-            get_joint_series(df, "right_shoulder"),
-            get_joint_series(df, "right_elbow"),
-        ),
-        "left_arm_lift": compute_angle(
-            get_joint_series(df, "left_elbow"),
-            get_joint_series(df, "left_shoulder"),
-            get_joint_series(df, "right_shoulder"),
-        ),
-    }
-
+class PoseSequence:
+    """One clip's joints extracted once, with lazily cached derived series.
 
-def right_ear_shoulder_elbow_angle(df: pd.DataFrame) -> Optional[np.ndarray]:
-    """Return shoulder-elbow angle using right ear, falling back to right eye."""
+    The keypoint columns are read from the DataFrame a single time into an
+    ``(n_frames, 17, 2)`` array; knee/arm angles, wrist height and the
+    shoulder-elbow angle are computed on first use and reused by every metric.
+    All module functions that take a DataFrame also accept a ``PoseSequence``.
+    """
 
-    for anchor in ("right_ear", "right_eye"):
-        try:
-            return compute_angle(
-                get_joint_series(df, anchor),
-                get_joint_series(df, "right_shoulder"),
-                get_joint_series(df, "right_elbow"),
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.df = df
+        n_joints = len(KEYPOINT_NAME_TO_ID)
+        all_columns = [col for joint_id in range(n_joints) for col in _column_names(joint_id)]
+        present = set(df.columns.intersection(all_columns))
+        self.has_joint = np.array(
+            [all(col in present for col in _column_names(joint_id)) for joint_id in range(n_joints)]
+        )
+        self.coords = df.reindex(columns=all_columns).to_numpy(dtype=np.float64).reshape(len(df), n_joints, 2)
+        self._cache: Dict[str, object] = {}
+
+    @classmethod
+    def load(cls, source: Path | str | pd.DataFrame | "PoseSequence") -> "PoseSequence":
+        """Build a sequence from a keypoint file, a DataFrame or return an existing sequence."""
+        if isinstance(source, PoseSequence):
+            return source
+        if isinstance(source, pd.DataFrame):
+            return cls(source)
+        return cls(load_pose_sequence(source))
+
+    def __len__(self) -> int:
+        return self.coords.shape[0]
+
+    def _cached(self, key: str, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def has(self, joint_name: str) -> bool:
+        return bool(self.has_joint[KEYPOINT_NAME_TO_ID[joint_name]])
+
+    def joint(self, joint_name: str) -> np.ndarray:
+        """(n_frames, 2) XY coordinates; raises ``KeyError`` like :func:`get_joint_series`."""
+        joint_id = KEYPOINT_NAME_TO_ID[joint_name]
+        if not self.has_joint[joint_id]:
+            x_col, y_col = _column_names(joint_id)
+            raise KeyError(
+                f"Joint '{joint_name}' (columns '{x_col}', '{y_col}') not present in data"
             )
-        except KeyError:
-            continue
-    return None
+        return self.coords[:, joint_id]
+
+    def angle(self, a: str, b: str, c: str) -> np.ndarray:
+        """Cached angle A-B-C (degrees) per frame."""
+        return self._cached(
+            f"angle:{a}:{b}:{c}", lambda: compute_angle(self.joint(a), self.joint(b), self.joint(c))
+        )
+
+    def knee_angles(self) -> Dict[str, np.ndarray]:
+        return {
+            "left": self.angle("left_hip", "left_knee", "left_ankle"),
+            "right": self.angle("right_hip", "right_knee", "right_ankle"),
+        }
+
+    def min_knee_angle(self) -> np.ndarray:
+        """Per-frame minimum of both knee angles (NaN only where both are missing)."""
+        def compute():
+            knees = self.knee_angles()
+            return np.fmin(knees["left"], knees["right"])
+
+        return self._cached("min_knee_angle", compute)
+
+    def arm_angles(self) -> Dict[str, np.ndarray]:
+        return {
+            "right_arm_extension": self.angle("left_shoulder", "right_shoulder", "right_elbow"),
+            "left_arm_lift": self.angle("left_elbow", "left_shoulder", "right_shoulder"),
+        }
+
+    def hitting_arm_height(self) -> np.ndarray:
+        """Per-frame image-y of the higher of right elbow / right wrist (smaller is higher)."""
+        return self._cached(
+            "hitting_arm_height",
+            lambda: np.minimum(self.joint("right_elbow")[:, 1], self.joint("right_wrist")[:, 1]),
+        )
+
+    def ear_shoulder_elbow_angle(self) -> Optional[np.ndarray]:
+        """Shoulder-elbow angle anchored on the right ear (right eye as fallback), if present."""
+        for anchor in ("right_ear", "right_eye"):
+            if self.has(anchor):
+                return self.angle(anchor, "right_shoulder", "right_elbow")
+        return None
+
+    def trunk_angle(self) -> np.ndarray:
+        """Per-frame trunk lean: angle (degrees) between mid-hip -> mid-shoulder and image up."""
+        def compute():
+            hips = (self.joint("left_hip") + self.joint("right_hip")) / 2
+            shoulders = (self.joint("left_shoulder") + self.joint("right_shoulder")) / 2
+            up = hips + np.array([0.0, -1.0])  # 画像座標は y が下向き
+            return compute_angle(up, hips, shoulders)
+
+        return self._cached("trunk_angle", compute)
+
+    def angle_matrix(self, names: Sequence[str] = ANGLE_SERIES_NAMES) -> np.ndarray:
+        """(n_frames, len(names)) angle series from ``ANGLE_SERIES_DEFINITIONS``.
+
+        Angles whose joints are missing from the data are all-NaN columns.
+        """
+        columns = []
+        for name in names:
+            definition = ANGLE_SERIES_DEFINITIONS[name]
+            try:
+                columns.append(self.trunk_angle() if definition is None else self.angle(*definition))
+            except KeyError:
+                columns.append(np.full(len(self), np.nan))
+        return np.stack(columns, axis=1) if columns else np.empty((len(self), 0))
+
+
+def knee_angles(df: pd.DataFrame | PoseSequence) -> Dict[str, np.ndarray]:
+    return PoseSequence.load(df).knee_angles()
+
+
+def shoulder_elbow_metrics(df: pd.DataFrame | PoseSequence) -> Dict[str, np.ndarray]:
+    return PoseSequence.load(df).arm_angles()
+
+
+def right_ear_shoulder_elbow_angle(df: pd.DataFrame | PoseSequence) -> Optional[np.ndarray]:
+    """Return shoulder-elbow angle using right ear, falling back to right eye."""
+    return PoseSequence.load(df).ear_shoulder_elbow_angle()
 
 
 def find_min_angle_frame(angle_series: np.ndarray, frame_range: Tuple[int, int]) -> int:
@@ -128,20 +229,35 @@ def find_min_y_frame(y_series: np.ndarray, frame_range: Tuple[int, int]) -> int:
     return start + int(offset)
 
 
-def find_trophy_frame(df: pd.DataFrame, frame_range: Tuple[int, int] = (15, 30)) -> int:
-    knees = knee_angles(df)
-    combined = np.vstack([knees["left"], knees["right"]])
-    min_series = np.nanmin(combined, axis=0)
-    return find_min_angle_frame(min_series, frame_range)
+# 膝・腕の角度が1フレームも得られずフェーズ検出できないときのエラー（単体・バッチ共通）
+NO_PHASE_SIGNAL_ERROR = "no valid knee/arm angles in clip; cannot detect serve phases"
+
+
+def _detected_phases(seq: PoseSequence, series: np.ndarray):
+    # phases は PoseSequence を使うため遅延インポート（循環参照を避ける）
+    from .phases import detect_serve_phases
+
+    if np.isnan(series).all():
+        raise ValueError(NO_PHASE_SIGNAL_ERROR)
+    return detect_serve_phases(seq)
+
+
+def find_trophy_frame(df: pd.DataFrame | PoseSequence, frame_range: Optional[Tuple[int, int]] = None) -> int:
+    """Deepest knee bend before impact, or within ``frame_range`` when one is given."""
+    seq = PoseSequence.load(df)
+    if frame_range is None:
+        return _detected_phases(seq, seq.min_knee_angle()).trophy
+    return find_min_angle_frame(seq.min_knee_angle(), frame_range)
 
 
 def find_impact_frame(
-    df: pd.DataFrame, frame_range: Tuple[int, int] = (25, 40)
+    df: pd.DataFrame | PoseSequence, frame_range: Optional[Tuple[int, int]] = None
 ) -> int:
-    right_elbow = get_joint_series(df, "right_elbow")[:, 1]
-    right_wrist = get_joint_series(df, "right_wrist")[:, 1]
-    height_series = np.minimum(right_elbow, right_wrist)
-    return find_min_y_frame(height_series, frame_range)
+    """Highest hitting-arm point, or the highest within ``frame_range`` when one is given."""
+    seq = PoseSequence.load(df)
+    if frame_range is None:
+        return _detected_phases(seq, seq.hitting_arm_height()).impact
+    return find_min_y_frame(seq.hitting_arm_height(), frame_range)
 
 
 @dataclass
@@ -152,45 +268,74 @@ class PoseMetrics:
     trophy_right_arm_extension: float
     trophy_left_arm_lift: float
     impact_right_shoulder_angle: Optional[float]
+    # 拡張指標（extended_metrics_arrays で一括計算。関節が欠けている場合は None）
+    hip_shoulder_separation: Optional[float] = None
+    trophy_trunk_tilt: Optional[float] = None
+    impact_trunk_tilt: Optional[float] = None
+    contact_height_ratio: Optional[float] = None
+    peak_wrist_angular_velocity: Optional[float] = None
+    peak_elbow_angular_velocity: Optional[float] = None
+    leg_drive_timing: Optional[float] = None
+    # 自動検出したフェーズの信頼度（0〜1。固定範囲や手動指定のみで求めた場合は None）
+    phase_confidence: Optional[float] = None
 
 
 def compute_pose_metrics(
-    csv_path: Path | str,
-    trophy_range: Tuple[int, int] = (15, 30),
-    impact_range: Tuple[int, int] = (25, 40),
+    csv_path: Path | str | pd.DataFrame | PoseSequence,
+    trophy_range: Optional[Tuple[int, int]] = None,
+    impact_range: Optional[Tuple[int, int]] = None,
     trophy_frame_override: Optional[int] = None,
     impact_frame_override: Optional[int] = None,
 ) -> PoseMetrics:
-    df = load_pose_sequence(csv_path)
+    """Compute the key pose metrics of one clip.
+
+    ``csv_path`` may also be a loaded DataFrame or a :class:`PoseSequence`;
+    pass the same sequence to reuse its cached angle series across calls.
+    Trophy and impact frames are detected over the whole clip (see
+    :mod:`pose_analysis.phases`) unless a frame range or override is given.
+    """
+    seq = PoseSequence.load(csv_path)
 
     def _clamp(idx: int) -> int:
-        n_frames = len(df)
+        n_frames = len(seq)
         return max(0, min(idx, n_frames - 1))
 
     if trophy_frame_override is not None:
         trophy_idx = _clamp(int(trophy_frame_override))
     else:
-        trophy_idx = find_trophy_frame(df, trophy_range)
+        trophy_idx = find_trophy_frame(seq, trophy_range)
 
     if impact_frame_override is not None:
         impact_idx = _clamp(int(impact_frame_override))
     else:
-        impact_idx = find_impact_frame(df, impact_range)
+        impact_idx = find_impact_frame(seq, impact_range)
+
+    phase_confidence: Optional[float] = None
+    if (trophy_frame_override is None and trophy_range is None) or (
+        impact_frame_override is None and impact_range is None
+    ):
+        from .phases import detect_serve_phases
 
-    knees = knee_angles(df)
+        phase_confidence = detect_serve_phases(seq).confidence
+
+    knees = seq.knee_angles()
     trophy_knee = float(min(knees["left"][trophy_idx], knees["right"][trophy_idx]))
 
-    arms = shoulder_elbow_metrics(df)
+    arms = seq.arm_angles()
     right_arm_extension = float(arms["right_arm_extension"][trophy_idx])
     left_arm_lift = float(arms["left_arm_lift"][trophy_idx])
 
-    ear_angle_series = right_ear_shoulder_elbow_angle(df)
+    ear_angle_series = seq.ear_shoulder_elbow_angle()
     impact_ear_angle: Optional[float]
     if ear_angle_series is None:
         impact_ear_angle = None
     else:
         impact_ear_angle = float(ear_angle_series[impact_idx])
 
+    extended = extended_metrics_arrays(
+        seq.coords[None], np.array([len(seq)]), np.array([trophy_idx]), np.array([impact_idx])
+    )
+
     return PoseMetrics(
         trophy_frame=trophy_idx,
         impact_frame=impact_idx,
@@ -198,4 +343,312 @@ def compute_pose_metrics(
         trophy_right_arm_extension=right_arm_extension,
         trophy_left_arm_lift=left_arm_lift,
         impact_right_shoulder_angle=impact_ear_angle,
+        **{name: _optional_float(values[0]) for name, values in extended.items()},
+        phase_confidence=phase_confidence,
+    )
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if pd.isna(value) else float(value)
+
+
+METRIC_COLUMNS = [
+    "trophy_frame",
+    "impact_frame",
+    "trophy_knee_angle",
+    "trophy_right_arm_extension",
+    "trophy_left_arm_lift",
+    "impact_right_shoulder_angle",
+]
+EXTENDED_METRIC_COLUMNS = [
+    "hip_shoulder_separation",
+    "trophy_trunk_tilt",
+    "impact_trunk_tilt",
+    "contact_height_ratio",
+    "peak_wrist_angular_velocity",
+    "peak_elbow_angular_velocity",
+    "leg_drive_timing",
+]
+
+
+def _angle_nd(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """:func:`compute_angle` for arbitrary leading dimensions (``(..., 2)`` inputs)."""
+    ba = a - b
+    bc = c - b
+    denom = np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1)
+    denom = np.where(denom == 0, np.finfo(float).eps, denom)
+    cos_angle = np.clip(np.sum(ba * bc, axis=-1) / denom, -1.0, 1.0)
+    return np.degrees(np.arccos(cos_angle))
+
+
+def _window_argmin(series: np.ndarray, lengths: np.ndarray, frame_range: Tuple[int, int]) -> np.ndarray:
+    """Batched :func:`find_min_angle_frame`; ``-1`` where the window has no finite value."""
+    start, end = frame_range
+    frames = np.arange(series.shape[1])
+    ends = np.minimum(end, lengths - 1)
+    in_window = (frames[None, :] >= start) & (frames[None, :] <= ends[:, None])
+    masked = np.where(in_window & ~np.isnan(series), series, np.inf)
+    idx = np.argmin(masked, axis=1)
+    found = np.isfinite(masked[np.arange(len(series)), idx])
+    return np.where(found, idx, -1)
+
+
+def _orientation(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Direction (degrees) of the segment a -> b for ``(..., 2)`` inputs."""
+    delta = b - a
+    return np.degrees(np.arctan2(delta[..., 1], delta[..., 0]))
+
+
+def _wrap_degrees(angle: np.ndarray) -> np.ndarray:
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _masked_max(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Row-wise max over ``mask`` ignoring NaN; NaN where nothing is left."""
+    masked = np.where(mask & ~np.isnan(values), values, -np.inf)
+    peak = masked.max(axis=1, initial=-np.inf)
+    return np.where(np.isfinite(peak), peak, np.nan)
+
+
+def extended_metrics_arrays(
+    coords: np.ndarray,
+    lengths: np.ndarray,
+    trophy_idx: np.ndarray,
+    impact_idx: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Extended biomechanical metrics for a batch of ``(B, T, 17, 2)`` joint arrays.
+
+    Every metric is derived from the same coordinate tensor in one vectorised
+    pass (NaN where joints are missing or the frames are invalid):
+
+    * ``hip_shoulder_separation`` – largest angle (deg, 0-90) between the hip
+      line and the shoulder line from the first frame up to impact.
+    * ``trophy_trunk_tilt`` / ``impact_trunk_tilt`` – angle (deg) of
+      mid-hip -> mid-shoulder from image vertical.
+    * ``contact_height_ratio`` – height of the right wrist above the lower
+      ankle at impact, divided by the clip's median ankle-to-shoulder height
+      (head keypoints are not stored, so shoulders stand in for body height).
+    * ``peak_wrist_angular_velocity`` – peak rotation speed (deg/frame) of the
+      right forearm (elbow -> wrist) up to impact.
+    * ``peak_elbow_angular_velocity`` – peak change (deg/frame) of the right
+      elbow angle up to impact.
+    * ``leg_drive_timing`` – frames from the fastest knee extension between
+      trophy and impact to impact (positive: legs drive before contact).
+    """
+    ids = KEYPOINT_NAME_TO_ID
+    joint = lambda name: coords[:, :, ids[name]]  # noqa: E731
+    n_batch, n_frames = coords.shape[:2]
+    if n_frames < 2:
+        return {name: np.full(n_batch, np.nan) for name in EXTENDED_METRIC_COLUMNS}
+    rows = np.arange(n_batch)
+    frames = np.arange(n_frames)
+    t_idx = np.clip(trophy_idx, 0, n_frames - 1)
+    i_idx = np.clip(impact_idx, 0, n_frames - 1)
+    valid = frames[None, :] < lengths[:, None]
+    up_to_impact = valid & (frames[None, :] <= i_idx[:, None])
+
+    mid_hip = (joint("left_hip") + joint("right_hip")) / 2
+    mid_shoulder = (joint("left_shoulder") + joint("right_shoulder")) / 2
+
+    separation = np.abs(
+        _wrap_degrees(
+            _orientation(joint("left_shoulder"), joint("right_shoulder"))
+            - _orientation(joint("left_hip"), joint("right_hip"))
+        )
     )
+    # 線としての角度（0〜90°）。左右の取り違えで向きが反転しても同じ値になる
+    separation = np.minimum(separation, 180.0 - separation)
+    trunk = _angle_nd(mid_hip + np.array([0.0, -1.0]), mid_hip, mid_shoulder)  # 画像座標は y が下向き
+
+    # 地面は下側（y が大きい方）の足首とする
+    ground = np.fmax(joint("left_ankle")[..., 1], joint("right_ankle")[..., 1])
+    body = np.where(valid, ground - mid_shoulder[..., 1], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        body_scale = np.nanmedian(body, axis=1)
+    body_scale = np.where(body_scale > 0, body_scale, np.nan)
+    contact_height = (ground[rows, i_idx] - joint("right_wrist")[rows, i_idx, 1]) / body_scale
+
+    # 角速度はフレーム k -> k+1 の変化量。両端のフレームが範囲内のものだけを見る
+    step_mask = up_to_impact[:, 1:] & up_to_impact[:, :-1]
+    forearm = _orientation(joint("right_elbow"), joint("right_wrist"))
+    wrist_velocity = np.abs(_wrap_degrees(np.diff(forearm, axis=1)))
+    elbow_velocity = np.abs(np.diff(_angle_nd(joint("right_shoulder"), joint("right_elbow"), joint("right_wrist")), axis=1))
+
+    knee = np.fmin(
+        _angle_nd(joint("left_hip"), joint("left_knee"), joint("left_ankle")),
+        _angle_nd(joint("right_hip"), joint("right_knee"), joint("right_ankle")),
+    )
+    extension = np.diff(knee, axis=1)
+    drive_window = step_mask & (frames[None, 1:] > t_idx[:, None])
+    masked_extension = np.where(drive_window & ~np.isnan(extension), extension, -np.inf)
+    drive_step = np.argmax(masked_extension, axis=1)
+    drive_found = np.isfinite(masked_extension[rows, drive_step]) & (masked_extension[rows, drive_step] > 0)
+    leg_drive_timing = np.where(drive_found, i_idx - (drive_step + 1), np.nan).astype(float)
+
+    return {
+        "hip_shoulder_separation": _masked_max(separation, up_to_impact),
+        "trophy_trunk_tilt": trunk[rows, t_idx],
+        "impact_trunk_tilt": trunk[rows, i_idx],
+        "contact_height_ratio": contact_height,
+        "peak_wrist_angular_velocity": _masked_max(wrist_velocity, step_mask),
+        "peak_elbow_angular_velocity": _masked_max(elbow_velocity, step_mask),
+        "leg_drive_timing": leg_drive_timing,
+    }
+
+
+def stack_pose_sequences(sequences: Sequence[pd.DataFrame | PoseSequence]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Stack keypoint sequences into ``(B, T_max, 17, 2)`` NaN-padded coordinates.
+
+    Returns ``(coords, lengths, has_joint)`` where ``has_joint`` (B, 17) marks the
+    joints whose columns exist in each sequence.
+    """
+    sequences = [PoseSequence.load(seq) for seq in sequences]
+    n_joints = len(KEYPOINT_NAME_TO_ID)
+    lengths = np.array([len(seq) for seq in sequences], dtype=int)
+    coords = np.full((len(sequences), int(lengths.max(initial=0)), n_joints, 2), np.nan)
+    has_joint = np.zeros((len(sequences), n_joints), dtype=bool)
+    for i, seq in enumerate(sequences):
+        coords[i, : lengths[i]] = seq.coords
+        has_joint[i] = seq.has_joint
+    return coords, lengths, has_joint
+
+
+def compute_pose_metrics_batch(
+    sources: Sequence[Path | str | pd.DataFrame | PoseSequence],
+    trophy_range: Optional[Tuple[int, int]] = None,
+    impact_range: Optional[Tuple[int, int]] = None,
+) -> pd.DataFrame:
+    """Compute :class:`PoseMetrics` for many clips in one vectorised pass.
+
+    ``sources`` are keypoint files (CSV or binary store), already loaded
+    DataFrames or :class:`PoseSequence` objects. Sequences are stacked into NaN-padded arrays and every angle,
+    trophy frame and impact frame is computed for the whole batch at once.
+    Returns one row per source (in input order) with the :class:`PoseMetrics`
+    fields (including the extended metrics of :func:`extended_metrics_arrays`),
+    ``impact_right_shoulder_angle`` as NaN where it is unavailable,
+    ``phase_confidence`` (NaN when both frames come from fixed ranges)
+    and an ``error`` column that is set instead of raising for clips whose
+    metrics cannot be computed.
+    """
+    labels = [
+        f"<{type(src).__name__} {i}>" if isinstance(src, (pd.DataFrame, PoseSequence)) else str(src)
+        for i, src in enumerate(sources)
+    ]
+    sequences: List[PoseSequence] = []
+    errors: List[Optional[str]] = []
+    for src in sources:
+        try:
+            sequences.append(PoseSequence.load(src))
+            errors.append(None)
+        except Exception as exc:
+            sequences.append(PoseSequence(pd.DataFrame()))
+            errors.append(str(exc))
+
+    result = pd.DataFrame(
+        index=pd.Index(labels, name="source"),
+        columns=METRIC_COLUMNS + EXTENDED_METRIC_COLUMNS + ["phase_confidence"],
+        dtype=float,
+    )
+    result["error"] = pd.Series(errors, index=result.index, dtype=object)
+    if not sequences:
+        return result
+
+    coords, lengths, has_joint = stack_pose_sequences(sequences)
+    ids = KEYPOINT_NAME_TO_ID
+    joint = lambda name: coords[:, :, ids[name]]  # noqa: E731
+
+    required = [
+        "left_hip", "left_knee", "left_ankle", "right_hip", "right_knee", "right_ankle",
+        "left_shoulder", "right_shoulder", "left_elbow", "right_elbow", "right_wrist",
+    ]
+    for i in range(len(sequences)):
+        if errors[i] is None:
+            missing = [name for name in required if not has_joint[i, ids[name]]]
+            if missing:
+                errors[i] = f"Joint '{missing[0]}' not present in data"
+
+    left_knee = _angle_nd(joint("left_hip"), joint("left_knee"), joint("left_ankle"))
+    right_knee = _angle_nd(joint("right_hip"), joint("right_knee"), joint("right_ankle"))
+    # find_trophy_frame の nanmin と同じく、片側が欠損ならもう片側を使う
+    knee_min = np.fmin(left_knee, right_knee)
+    height = np.minimum(joint("right_elbow")[..., 1], joint("right_wrist")[..., 1])
+
+    phase_confidence = np.full(len(sequences), np.nan)
+    if trophy_range is None or impact_range is None:
+        from .phases import detect_serve_phases_batch
+
+        phases = detect_serve_phases_batch(coords, lengths)
+        phase_confidence = phases["confidence"]
+        # 窓探索と同じく、有効な値が1つも無いクリップは -1（失敗）にする
+        frames = np.arange(coords.shape[1])
+        valid = frames[None, :] < lengths[:, None]
+    if trophy_range is None:
+        trophy_idx = np.where((valid & ~np.isnan(knee_min)).any(axis=1), phases["trophy"], -1)
+    else:
+        trophy_idx = _window_argmin(knee_min, lengths, trophy_range)
+    if impact_range is None:
+        impact_idx = np.where((valid & ~np.isnan(height)).any(axis=1), phases["impact"], -1)
+    else:
+        impact_idx = _window_argmin(height, lengths, impact_range)
+
+    arm_extension = _angle_nd(joint("left_shoulder"), joint("right_shoulder"), joint("right_elbow"))
+    left_arm_lift = _angle_nd(joint("left_elbow"), joint("left_shoulder"), joint("right_shoulder"))
+
+    # 右耳 → 右目の順で、列が存在するアンカーを使う（無ければ欠損）
+    anchor_ids = np.where(
+        has_joint[:, ids["right_ear"]], ids["right_ear"], np.where(has_joint[:, ids["right_eye"]], ids["right_eye"], -1)
+    )
+    anchor = coords[np.arange(len(sequences)), :, np.maximum(anchor_ids, 0)]
+    ear_angle = _angle_nd(anchor, joint("right_shoulder"), joint("right_elbow"))
+
+    rows = np.arange(len(sequences))
+    t_idx = np.maximum(trophy_idx, 0)
+    i_idx = np.maximum(impact_idx, 0)
+    left_at, right_at = left_knee[rows, t_idx], right_knee[rows, t_idx]
+    values = {
+        "trophy_frame": trophy_idx.astype(float),
+        "impact_frame": impact_idx.astype(float),
+        # compute_pose_metrics の min(left, right) と同じく、right < left のときだけ right を採用
+        "trophy_knee_angle": np.where(right_at < left_at, right_at, left_at),
+        "trophy_right_arm_extension": arm_extension[rows, t_idx],
+        "trophy_left_arm_lift": left_arm_lift[rows, t_idx],
+        "impact_right_shoulder_angle": np.where(anchor_ids >= 0, ear_angle[rows, i_idx], np.nan),
+    }
+    values.update(extended_metrics_arrays(coords, lengths, trophy_idx, impact_idx))
+    values["phase_confidence"] = phase_confidence
+    for column, column_values in values.items():
+        result[column] = column_values
+
+    for i in rows:
+        if errors[i] is None and (trophy_idx[i] < 0 or impact_idx[i] < 0):
+            errors[i] = NO_PHASE_SIGNAL_ERROR
+    failed = np.array([err is not None for err in errors])
+    result.loc[failed, METRIC_COLUMNS + EXTENDED_METRIC_COLUMNS + ["phase_confidence"]] = np.nan
+    result["error"] = pd.Series(errors, index=result.index, dtype=object)
+    result["trophy_frame"] = result["trophy_frame"].astype("Int64")
+    result["impact_frame"] = result["impact_frame"].astype("Int64")
+    return result
+
+
+def metrics_from_batch(batch: pd.DataFrame) -> List[Optional[PoseMetrics]]:
+    """Convert :func:`compute_pose_metrics_batch` rows to :class:`PoseMetrics` (``None`` for failed rows)."""
+    metrics: List[Optional[PoseMetrics]] = []
+    for row in batch.itertuples(index=False):
+        if isinstance(row.error, str):
+            metrics.append(None)
+            continue
+        impact = row.impact_right_shoulder_angle
+        metrics.append(
+            PoseMetrics(
+                trophy_frame=int(row.trophy_frame),
+                impact_frame=int(row.impact_frame),
+                trophy_knee_angle=float(row.trophy_knee_angle),
+                trophy_right_arm_extension=float(row.trophy_right_arm_extension),
+                trophy_left_arm_lift=float(row.trophy_left_arm_lift),
+                impact_right_shoulder_angle=None if pd.isna(impact) else float(impact),
+                **{name: _optional_float(getattr(row, name)) for name in EXTENDED_METRIC_COLUMNS},
+                phase_confidence=_optional_float(row.phase_confidence),
+            )
+        )
+    return metrics
@@ -0,0 +1,194 @@
+"""Persisted :class:`PoseMetrics` index for a library of reference clips.
+
+``find_most_similar_csv`` used to recompute the metrics of every reference
+``keypoints_with_tracks.csv`` (and of the user clip, once per reference) on
+each request. :class:`ReferenceMetricsIndex` computes each reference clip's
+metrics once, stores them in a JSON file inside the library directory and only
+recomputes entries whose CSV changed (size or mtime), appeared or disappeared.
+
+Usage example:
+    index = ReferenceMetricsIndex.for_directory("pose_tracks/Cleaned_Data/players/Fed")
+    for csv_path, metrics in index.entries():
+        ...
+
+    # 参照ライブラリの索引を事前に作っておく
+    python -m pose_analysis.reference_index --root pose_tracks/Cleaned_Data/players
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .keypoint_store import KEYPOINTS_CSV_NAME
+from .pose_metrics import PoseMetrics, compute_pose_metrics_batch, metrics_from_batch
+
+INDEX_FILE_NAME = ".pose_metrics_index.json"
+INDEX_VERSION = 3
+# None はフレーム範囲を固定せずフェーズ検出（pose_analysis.phases）で求める
+DEFAULT_TROPHY_RANGE: Optional[Tuple[int, int]] = None
+DEFAULT_IMPACT_RANGE: Optional[Tuple[int, int]] = None
+
+FrameRange = Optional[Tuple[int, int]]
+
+# 常駐ワーカーでは同じディレクトリの索引をプロセス内で使い回す
+_INDEX_CACHE: Dict[Tuple[str, FrameRange, FrameRange], "ReferenceMetricsIndex"] = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def _as_range(value) -> FrameRange:
+    return tuple(int(v) for v in value) if value is not None else None
+
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ReferenceMetricsIndex:
+    """Pose metrics for every ``keypoints_with_tracks.csv`` under ``root``, cached on disk."""
+
+    def __init__(
+        self,
+        root: Path | str,
+        *,
+        index_path: Optional[Path | str] = None,
+        trophy_range: FrameRange = DEFAULT_TROPHY_RANGE,
+        impact_range: FrameRange = DEFAULT_IMPACT_RANGE,
+    ) -> None:
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else self.root / INDEX_FILE_NAME
+        self.trophy_range = _as_range(trophy_range)
+        self.impact_range = _as_range(impact_range)
+        self._entries: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_directory(
+        cls,
+        root: Path | str,
+        *,
+        trophy_range: FrameRange = DEFAULT_TROPHY_RANGE,
+        impact_range: FrameRange = DEFAULT_IMPACT_RANGE,
+    ) -> "ReferenceMetricsIndex":
+        """Return the process-wide index for ``root`` (created on first use)."""
+        key = (str(Path(root).resolve()), _as_range(trophy_range), _as_range(impact_range))
+        with _INDEX_CACHE_LOCK:
+            if key not in _INDEX_CACHE:
+                _INDEX_CACHE[key] = cls(root, trophy_range=trophy_range, impact_range=impact_range)
+            return _INDEX_CACHE[key]
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except (OSError, ValueError) as exc:
+            print(f"⚠️ Ignoring unreadable metrics index {self.index_path}: {exc}")
+            return
+        if (
+            payload.get("version") != INDEX_VERSION
+            or _as_range(payload.get("trophy_range")) != self.trophy_range
+            or _as_range(payload.get("impact_range")) != self.impact_range
+        ):
+            return
+        self._entries = payload.get("entries", {})
+
+    def _save(self) -> None:
+        payload = {
+            "version": INDEX_VERSION,
+            "trophy_range": list(self.trophy_range) if self.trophy_range else None,
+            "impact_range": list(self.impact_range) if self.impact_range else None,
+            "entries": self._entries,
+        }
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(payload, fh, ensure_ascii=False)
+            tmp_path.replace(self.index_path)
+        except OSError as exc:  # 読み取り専用の環境でも検索自体は続行する
+            print(f"⚠️ Could not write metrics index {self.index_path}: {exc}")
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the files on disk; return the number of recomputed clips."""
+        with self._lock:
+            seen = set()
+            recomputed = 0
+            changed = False
+            stale: List[Tuple[str, Path, Tuple[int, int]]] = []
+            for csv_path in sorted(self.root.glob(f"**/{KEYPOINTS_CSV_NAME}")):
+                key = csv_path.relative_to(self.root).as_posix()
+                seen.add(key)
+                mtime_ns, size = _file_signature(csv_path)
+                entry = self._entries.get(key)
+                if entry and entry.get("mtime_ns") == mtime_ns and entry.get("size") == size:
+                    continue
+                stale.append((key, csv_path, (mtime_ns, size)))
+
+            if stale:
+                # 変更のあったクリップはまとめて1回のベクトル化計算で求める
+                batch = compute_pose_metrics_batch(
+                    [csv_path for _, csv_path, _ in stale], self.trophy_range, self.impact_range
+                )
+                for (key, _, (mtime_ns, size)), metrics, error in zip(stale, metrics_from_batch(batch), batch["error"]):
+                    new_entry: Dict[str, object] = {"mtime_ns": mtime_ns, "size": size}
+                    if metrics is not None:
+                        new_entry["metrics"] = asdict(metrics)
+                    else:
+                        # 壊れた CSV は失敗として記録し、ファイルが変わるまで再計算しない
+                        new_entry["error"] = str(error)
+                    self._entries[key] = new_entry
+                recomputed = len(stale)
+                changed = True
+
+            for key in set(self._entries) - seen:
+                del self._entries[key]
+                changed = True
+
+            if changed:
+                self._save()
+            return recomputed
+
+    def entries(self, *, refresh: bool = True) -> List[Tuple[Path, PoseMetrics]]:
+        """Return ``(csv_path, metrics)`` for every reference clip whose metrics could be computed."""
+        if refresh:
+            self.refresh()
+        with self._lock:
+            # 浅い階層を先に並べる（Cleaned_Data/<選手>/ 配下の重複コピーより直下のクリップを優先）
+            keys = sorted(self._entries, key=lambda key: (key.count("/"), key))
+            return [
+                (self.root / key, PoseMetrics(**self._entries[key]["metrics"]))
+                for key in keys
+                if "metrics" in self._entries[key]
+            ]
+
+    def errors(self) -> Dict[str, str]:
+        """Relative path -> error message for clips whose metrics failed to compute."""
+        with self._lock:
+            return {key: str(entry["error"]) for key, entry in self._entries.items() if "error" in entry}
+
+
+def build_indexes(root: Path | str) -> Dict[str, int]:
+    """Build or refresh one index per immediate sub-directory (player) of ``root``."""
+    counts: Dict[str, int] = {}
+    for player_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        counts[player_dir.name] = ReferenceMetricsIndex(player_dir).refresh()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the per-player reference pose metrics index")
+    parser.add_argument("--root", type=Path, required=True, help="Directory containing one folder per player")
+    args = parser.parse_args()
+    for player, recomputed in build_indexes(args.root).items():
+        print(f"📇 {player}: {recomputed} clips (re)indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Normalised keypoint sequences shared by the LSTM and sequence search.
+
+The classifier in ``30_Classification_LSTM`` consumes every clip as a
+``(frames, N_FEATURES)`` matrix (``kpt_5`` .. ``kpt_16`` x/y), centred on the
+clip-wide keypoint mean and divided by the clip-wide standard deviation. How
+the clip length is handled is chosen with a ``length_mode``:
+
+* ``crop`` – pad with the last frame / take the centre ``SEQUENCE_LENGTH``
+  frames (fixed-shape consumers such as :mod:`pose_analysis.sequence_search`).
+* ``full`` – keep every frame; batches group clips by length
+  (:func:`length_buckets`) so no compute is spent on padding.
+* ``phases`` – resample to ``SEQUENCE_LENGTH`` frames so the detected serve
+  phases land where they do in the 48-frame reference clips, which makes 60 fps
+  and loosely cut clips comparable.
+
+These helpers only need NumPy, so search code can build the same
+representation without importing torch.
+
+Usage example:
+    sequence = load_normalized_sequence("pose_tracks/players/Fed/clip_1/keypoints_with_tracks.csv")
+    sequence = load_normalized_sequence("clip_60fps/keypoints_with_tracks.csv", length_mode="phases")
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .keypoint_store import load_keypoint_arrays
+from .phases import detect_serve_phases_batch
+
+SEQUENCE_LENGTH = 48
+N_FEATURES = 24
+# 特徴量の先頭関節（kpt_5 = left_shoulder）
+FIRST_FEATURE_JOINT = 5
+N_JOINTS = 17
+
+LENGTH_MODES = ("crop", "full", "phases")
+# 参照クリップ（48フレーム）でのフェーズ位置の中央値（先頭〜末尾に対する割合）
+PHASE_ANCHORS = (("start", 0.06), ("trophy", 0.49), ("impact", 0.79), ("finish", 1.0))
+# これより信頼度が低い検出ではフェーズに合わせず、クリップ全体を等間隔に再サンプルする
+MIN_PHASE_CONFIDENCE = 0.5
+
+PathLike = Union[str, Path]
+
+
+def normalize_sequence_center_scale(sequence: np.ndarray, eps: float = 1e-6) -> np.ndarray:
+    """Shift by the clip-wide keypoint centre and scale by the std of all coordinates."""
+    seq = sequence.copy()
+    xs = seq[:, ::2]
+    ys = seq[:, 1::2]
+    cx = np.mean(xs)
+    cy = np.mean(ys)
+    xs -= cx
+    ys -= cy
+    seq[:, ::2] = xs
+    seq[:, 1::2] = ys
+    scale = np.std(seq)
+    if scale < eps:
+        scale = 1.0
+    return seq / scale
+
+
+def fit_sequence_length(seq: np.ndarray, length: int = SEQUENCE_LENGTH) -> np.ndarray:
+    """Pad with the last frame or take the centre ``length`` frames."""
+    if len(seq) < length:
+        # 足りない分は最後のフレームを繰り返してパディング
+        if len(seq) == 0:
+            raise ValueError("Sequence empty")
+        last = seq[-1:]
+        pad_count = length - len(seq)
+        seq = np.vstack([seq] + [last] * pad_count)
+    if len(seq) > length:
+        # 中央48フレームを使用
+        start = (len(seq) - length) // 2
+        seq = seq[start:start + length]
+    return seq
+
+
+def resample_sequence(seq: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Linearly interpolate ``seq`` at fractional frame ``positions`` (clipped to the clip)."""
+    positions = np.clip(np.asarray(positions, dtype=np.float64), 0, len(seq) - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(seq) - 1)
+    weight = (positions - lower)[:, None]
+    return seq[lower] * (1 - weight) + seq[upper] * weight
+
+
+def phase_positions(seq: np.ndarray, length: int = SEQUENCE_LENGTH) -> np.ndarray:
+    """Source frame positions that put the detected phases of ``seq`` at ``PHASE_ANCHORS`` of ``length`` frames.
+
+    Falls back to evenly spaced positions over the whole clip when the phases
+    are not detected confidently.
+    """
+    n_frames = len(seq)
+    uniform = np.linspace(0, n_frames - 1, length)
+    coords = np.full((1, n_frames, N_JOINTS, 2), np.nan)
+    n_feature_joints = seq.shape[1] // 2
+    coords[0, :, FIRST_FEATURE_JOINT:FIRST_FEATURE_JOINT + n_feature_joints] = seq.reshape(n_frames, n_feature_joints, 2)
+    phases = detect_serve_phases_batch(coords, np.array([n_frames]))
+    source = np.array([phases[name][0] for name, _ in PHASE_ANCHORS], dtype=np.float64)
+    if phases["confidence"][0] < MIN_PHASE_CONFIDENCE or np.any(np.diff(source) <= 0):
+        return uniform
+    target = np.array([fraction for _, fraction in PHASE_ANCHORS]) * (length - 1)
+    # 最初のアンカーより前は、アンカー間の平均速度で外挿する（クリップ外は先頭フレーム）
+    rate = (source[-1] - source[0]) / (target[-1] - target[0])
+    before = source[0] - target[0] * rate
+    return np.interp(np.arange(length), np.concatenate([[0.0], target]), np.concatenate([[before], source]))
+
+
+def fit_length_mode(seq: np.ndarray, length_mode: str = "crop", length: int = SEQUENCE_LENGTH) -> np.ndarray:
+    """Apply one of ``LENGTH_MODES`` to a raw ``(frames, features)`` sequence."""
+    if length_mode not in LENGTH_MODES:
+        raise ValueError(f"length_mode must be one of {LENGTH_MODES}, got {length_mode!r}")
+    if len(seq) == 0:
+        raise ValueError("Sequence empty")
+    if length_mode == "full":
+        return seq
+    if length_mode == "phases":
+        return resample_sequence(seq, phase_positions(seq, length))
+    return fit_sequence_length(seq, length)
+
+
+def length_buckets(
+    lengths: Sequence[int],
+    batch_size: int,
+    *,
+    max_spread: int = 0,
+    rng: Optional[np.random.Generator] = None,
+) -> List[np.ndarray]:
+    """Index batches of at most ``batch_size`` clips whose lengths differ by at most ``max_spread`` frames.
+
+    With the default ``max_spread=0`` every batch holds equal-length clips and
+    needs no padding. With ``rng`` the order of equal-length clips and of the
+    batches is shuffled (training epochs).
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    tie_break = rng.random(len(lengths)) if rng is not None else np.arange(len(lengths))
+    order = np.lexsort((tie_break, lengths))
+    batches: List[np.ndarray] = []
+    first = 0
+    for position in range(1, len(order) + 1):
+        if (
+            position == len(order)
+            or position - first >= batch_size
+            or lengths[order[position]] - lengths[order[first]] > max_spread
+        ):
+            batches.append(order[first:position])
+            first = position
+    if rng is not None:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+    return batches
+
+
+def pad_sequences(sequences: Sequence[np.ndarray], dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    """Zero-padded ``(N, max_frames, features)`` array and the true length of each sequence."""
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    n_features = sequences[0].shape[1] if len(sequences) else N_FEATURES
+    padded = np.zeros((len(sequences), int(lengths.max(initial=0)), n_features), dtype=dtype)
+    for i, seq in enumerate(sequences):
+        padded[i, :len(seq)] = seq
+    return padded, lengths
+
+
+def load_sequence(csv_path: PathLike, length_mode: str = "crop") -> np.ndarray:
+    """Raw keypoint sequence of a clip, skipping ``(1)`` duplicate frames, with ``length_mode`` applied."""
+    # 同じ場所に新しい .npz があればそちらを読む（なければ CSV）。(1)を含むフレームを除外
+    seq = load_keypoint_arrays(csv_path).exclude_frames("(1)").keypoints
+    return fit_length_mode(seq, length_mode).astype(np.float32)
+
+
+def load_normalized_sequence(csv_path: PathLike, length_mode: str = "crop") -> np.ndarray:
+    """:func:`load_sequence` followed by :func:`normalize_sequence_center_scale`."""
+    return normalize_sequence_center_scale(load_sequence(csv_path, length_mode))
@@ -0,0 +1,212 @@
+"""DTW similarity search over the normalised 48x24 keypoint sequences of a reference library.
+
+:class:`SequenceIndex` keeps every reference clip of a directory as one
+``(n_references, 48, 24)`` array (the representation produced by
+:func:`~pose_analysis.sequence_features.load_normalized_sequence`) together
+with its LB_Keogh upper/lower envelopes, and persists both in an ``.npz`` file
+inside the library directory. Like :class:`ReferenceMetricsIndex`, only clips
+whose CSV changed are reloaded. A query is answered by
+:func:`~pose_analysis.dtw.search_top_k`: references are visited in
+lower-bound order and full DTW runs only while a candidate can still enter
+the top k.
+
+Usage example:
+    index = SequenceIndex.for_directory("pose_tracks/Cleaned_Data/players/Fed")
+    matches = index.search(load_normalized_sequence(user_csv), k=3)
+
+    # 参照ライブラリの系列索引を事前に作っておく
+    python -m pose_analysis.sequence_search --root pose_tracks/Cleaned_Data/players
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dtw import DEFAULT_BAND, envelope, search_top_k
+from .keypoint_store import KEYPOINTS_CSV_NAME
+from .sequence_features import N_FEATURES, SEQUENCE_LENGTH, load_normalized_sequence
+
+INDEX_FILE_NAME = ".sequence_index.npz"
+INDEX_VERSION = 1
+
+# 常駐ワーカーでは同じディレクトリの索引をプロセス内で使い回す
+_INDEX_CACHE: Dict[Tuple[str, int], "SequenceIndex"] = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass(frozen=True)
+class SequenceMatch:
+    """One search hit: the reference clip and its DTW distance to the query."""
+
+    path: Path
+    distance: float
+    rank: int
+
+
+class SequenceIndex:
+    """Normalised sequences and DTW envelopes of every ``keypoints_with_tracks.csv`` under ``root``."""
+
+    def __init__(
+        self,
+        root: Path | str,
+        *,
+        index_path: Optional[Path | str] = None,
+        band: int = DEFAULT_BAND,
+    ) -> None:
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else self.root / INDEX_FILE_NAME
+        self.band = int(band)
+        self._keys: List[str] = []
+        self._signatures = np.empty((0, 2), dtype=np.int64)
+        self._errors: List[str] = []
+        self._sequences = np.empty((0, SEQUENCE_LENGTH, N_FEATURES), dtype=np.float32)
+        self._upper = np.empty_like(self._sequences)
+        self._lower = np.empty_like(self._sequences)
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_directory(cls, root: Path | str, *, band: int = DEFAULT_BAND) -> "SequenceIndex":
+        """Return the process-wide index for ``root`` (created on first use)."""
+        key = (str(Path(root).resolve()), int(band))
+        with _INDEX_CACHE_LOCK:
+            if key not in _INDEX_CACHE:
+                _INDEX_CACHE[key] = cls(root, band=band)
+            return _INDEX_CACHE[key]
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                if int(data["version"]) != INDEX_VERSION or int(data["band"]) != self.band:
+                    return
+                self._keys = [str(key) for key in data["keys"]]
+                self._signatures = data["signatures"]
+                self._errors = [str(error) for error in data["errors"]]
+                self._sequences = data["sequences"]
+                self._upper = data["upper"]
+                self._lower = data["lower"]
+        except (OSError, KeyError, ValueError) as exc:
+            print(f"⚠️ Ignoring unreadable sequence index {self.index_path}: {exc}")
+
+    def _save(self) -> None:
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as fh:
+                np.savez(
+                    fh,
+                    version=INDEX_VERSION,
+                    band=self.band,
+                    keys=np.asarray(self._keys, dtype=str),
+                    signatures=self._signatures,
+                    errors=np.asarray(self._errors, dtype=str),
+                    sequences=self._sequences,
+                    upper=self._upper,
+                    lower=self._lower,
+                )
+            tmp_path.replace(self.index_path)
+        except OSError as exc:  # 読み取り専用の環境でも検索自体は続行する
+            print(f"⚠️ Could not write sequence index {self.index_path}: {exc}")
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the files on disk; return the number of reloaded clips."""
+        with self._lock:
+            current = {key: idx for idx, key in enumerate(self._keys)}
+            # 浅い階層を先に並べる（Cleaned_Data/<選手>/ 配下の重複コピーより直下のクリップを優先）
+            csv_paths = sorted(
+                self.root.glob(f"**/{KEYPOINTS_CSV_NAME}"),
+                key=lambda path: (len(path.relative_to(self.root).parts), path.relative_to(self.root).as_posix()),
+            )
+            keys = [path.relative_to(self.root).as_posix() for path in csv_paths]
+            signatures = np.array([_file_signature(path) for path in csv_paths], dtype=np.int64).reshape(-1, 2)
+
+            sequences = np.zeros((len(keys), SEQUENCE_LENGTH, N_FEATURES), dtype=np.float32)
+            errors = [""] * len(keys)
+            stale: List[int] = []
+            for idx, key in enumerate(keys):
+                old = current.get(key)
+                if old is not None and np.array_equal(self._signatures[old], signatures[idx]):
+                    sequences[idx] = self._sequences[old]
+                    errors[idx] = self._errors[old]
+                    continue
+                stale.append(idx)
+                try:
+                    sequences[idx] = load_normalized_sequence(csv_paths[idx])
+                except (OSError, KeyError, ValueError) as exc:
+                    # 壊れた CSV は失敗として記録し、ファイルが変わるまで再読み込みしない
+                    errors[idx] = str(exc) or type(exc).__name__
+
+            if not stale and keys == self._keys:
+                return 0
+
+            # 包絡線は (N, 48, 24) 全体を1回のスライディング窓計算で求め直す
+            upper, lower = envelope(sequences, self.band)
+            self._keys = keys
+            self._signatures = signatures
+            self._errors = errors
+            self._sequences = sequences
+            self._upper = upper.astype(np.float32)
+            self._lower = lower.astype(np.float32)
+            self._save()
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def errors(self) -> Dict[str, str]:
+        """Relative path -> error message for clips that could not be loaded."""
+        with self._lock:
+            return {key: error for key, error in zip(self._keys, self._errors) if error}
+
+    def search(self, query: np.ndarray, k: int = 1, *, refresh: bool = True) -> List[SequenceMatch]:
+        """Top-k references by banded DTW distance to a normalised (48, 24) ``query``, best first."""
+        if refresh:
+            self.refresh()
+        with self._lock:
+            valid = np.flatnonzero([not error for error in self._errors])
+            if valid.size == 0:
+                return []
+            indices, distances, _ = search_top_k(
+                np.asarray(query, dtype=np.float64),
+                self._sequences[valid],
+                k,
+                band=self.band,
+                envelopes=(self._upper[valid], self._lower[valid]),
+            )
+            return [
+                SequenceMatch(path=self.root / self._keys[valid[idx]], distance=float(dist), rank=rank)
+                for rank, (idx, dist) in enumerate(zip(indices, distances))
+            ]
+
+
+def build_indexes(root: Path | str, *, band: int = DEFAULT_BAND) -> Dict[str, int]:
+    """Build or refresh one sequence index per immediate sub-directory (player) of ``root``."""
+    counts: Dict[str, int] = {}
+    for player_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        counts[player_dir.name] = SequenceIndex(player_dir, band=band).refresh()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the per-player reference sequence (DTW) index")
+    parser.add_argument("--root", type=Path, required=True, help="Directory containing one folder per player")
+    parser.add_argument("--band", type=int, default=DEFAULT_BAND, help="Sakoe-Chiba band width in frames")
+    args = parser.parse_args()
+    for player, reloaded in build_indexes(args.root, band=args.band).items():
+        print(f"📇 {player}: {reloaded} clips (re)indexed")
+
+
+if __name__ == "__main__":
+    main()
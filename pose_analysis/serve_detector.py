@@ -0,0 +1,337 @@
+"""Streaming serve detection over long keypoint sequences (whole matches or practice sessions).
+
+The deprecated ``ServeAutoClipper.detect_serve_segments`` classified one
+48-frame window at a time, refitted a ``StandardScaler`` on the data it was
+classifying and recomputed every overlapping window from scratch.
+:class:`StreamingServeDetector` consumes keypoints as they arrive, either one
+frame at a time with :meth:`push` or in blocks with :meth:`push_many`. It keeps
+only the last ``window`` frames and scores every completed window (one per
+``stride`` frames) in micro-batches with one vectorised pass.
+
+A window's score is the phase segmentation confidence of
+:func:`pose_analysis.phases.detect_serve_phases_batch`, multiplied by how far
+the hitting wrist rises above the shoulders at impact. Optionally it is also
+multiplied by an extra ``scorer``, e.g. the LSTM classifier's confidence
+through ``infer_similarity.classifier_window_scorer()`` in ``30_Classification_LSTM``. Each window is judged on
+its own frames only. Segments open when a score reaches ``on_threshold`` and
+close once scores fall below ``off_threshold`` (hysteresis) in a window that
+starts after the best window's impact, so one serve is not split in two when
+a single window in the middle scores low. The emitted
+boundaries are the start / finish phases of the best-scoring window, so clips
+follow the motion rather than the window grid.
+
+Usage example:
+    detector = StreamingServeDetector(fps=30)
+    for frame in keypoint_frames:            # (17, 2) arrays
+        for segment in detector.push(frame):
+            print(segment.start_frame, segment.end_frame, segment.confidence)
+    segments = detector.flush()
+
+    # 試合全体のキーポイント CSV から cut_clips 形式のリストを作る
+    python -m pose_analysis.serve_detector --keypoints match/keypoints_with_tracks.csv --video match.mp4 --output clip_list.txt
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import warnings
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .phases import PHASE_NAMES, detect_serve_phases_batch
+from .pose_metrics import KEYPOINT_NAME_TO_ID, PoseSequence, load_pose_sequence
+from .sequence_features import SEQUENCE_LENGTH
+
+DEFAULT_STRIDE = 10
+DEFAULT_BATCH_WINDOWS = 32
+ON_THRESHOLD = 0.6
+OFF_THRESHOLD = 0.4
+# インパクト時に手首が肩よりこの割合（足首〜肩の高さ比）以上高ければ腕の条件は満点（参照クリップの5%点が約0.24）
+ARM_RAISE_RATIO = 0.25
+
+WindowScorer = Callable[[np.ndarray], np.ndarray]
+
+# find_most_active_tracks.py（トラックごとの移動量集計）の置き場所
+_YOLO_DIR = Path(__file__).resolve().parent.parent / "22_Joint_Detection_YOLO"
+
+
+@dataclass(frozen=True)
+class ServeSegment:
+    """One detected serve; frames are positions in the pushed stream (``end_frame`` exclusive)."""
+
+    start_frame: int
+    end_frame: int
+    trophy_frame: int
+    impact_frame: int
+    confidence: float
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+def pose_window_scores(windows: np.ndarray) -> Dict[str, np.ndarray]:
+    """Serve score and phase frames of ``(W, window, 17, 2)`` keypoint windows.
+
+    The phase confidence is scaled by the height of the hitting wrist above the
+    shoulders at impact (full credit at ``ARM_RAISE_RATIO`` of the body height), so windows where the
+    arm never goes overhead (walking, ball bouncing) score near zero. Windows
+    whose impact falls in their last ``length // 8`` frames score zero: the arm
+    is still rising there and a later window sees the whole stroke.
+    """
+    n_windows, length = windows.shape[:2]
+    phases = detect_serve_phases_batch(windows, np.full(n_windows, length))
+    ids = KEYPOINT_NAME_TO_ID
+    rows = np.arange(n_windows)
+    shoulder_y = (windows[:, :, ids["left_shoulder"], 1] + windows[:, :, ids["right_shoulder"], 1]) / 2
+    ground = np.fmax(windows[:, :, ids["left_ankle"], 1], windows[:, :, ids["right_ankle"], 1])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        body = np.nanmedian(ground - shoulder_y, axis=1)
+    impact = phases["impact"]
+    lift = shoulder_y[rows, impact] - windows[rows, impact, ids["right_wrist"], 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        arm_raised = np.clip(np.nan_to_num(lift / (ARM_RAISE_RATIO * body), nan=0.0), 0.0, 1.0)
+    follow_through = impact < length - max(1, length // 8)
+    return {**phases, "score": phases["confidence"] * arm_raised * follow_through}
+
+
+class StreamingServeDetector:
+    """Incremental serve detector; see the module docstring for the scoring and segmentation rules."""
+
+    def __init__(
+        self,
+        *,
+        window: int = SEQUENCE_LENGTH,
+        stride: int = DEFAULT_STRIDE,
+        on_threshold: float = ON_THRESHOLD,
+        off_threshold: float = OFF_THRESHOLD,
+        batch_windows: int = DEFAULT_BATCH_WINDOWS,
+        fps: Optional[float] = None,
+        scorer: Optional[WindowScorer] = None,
+    ) -> None:
+        if off_threshold > on_threshold:
+            raise ValueError("off_threshold must not exceed on_threshold")
+        self.window = int(window)
+        self.stride = max(1, int(stride))
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.batch_windows = max(1, int(batch_windows))
+        self.fps = fps
+        self.scorer = scorer
+        n_joints = len(KEYPOINT_NAME_TO_ID)
+        # 直近 window フレームだけを保持し、次の窓（と flush 時の終端窓）を組み立てるのに使う
+        self._tail = np.empty((0, n_joints, 2))
+        self._frames_seen = 0
+        self._next_window_start = 0
+        self._pending_starts: List[int] = []
+        self._pending_windows: List[np.ndarray] = []
+        # 開いているセグメントの最良窓: (score, window_start, {phase: frame})
+        self._best: Optional[tuple] = None
+
+    @property
+    def frames_seen(self) -> int:
+        return self._frames_seen
+
+    def push(self, frame: np.ndarray) -> List[ServeSegment]:
+        """Add one ``(17, 2)`` frame (NaN for undetected joints); returns segments that closed."""
+        return self.push_many(np.asarray(frame, dtype=np.float64)[None])
+
+    def push_many(self, frames: np.ndarray) -> List[ServeSegment]:
+        """Add ``(n, 17, 2)`` consecutive frames; returns segments that closed."""
+        frames = np.asarray(frames, dtype=np.float64)
+        if not len(frames):
+            return []
+        buffer_start = self._frames_seen - len(self._tail)
+        buffer = np.concatenate([self._tail, frames]) if len(self._tail) else frames
+        self._frames_seen += len(frames)
+
+        starts = range(self._next_window_start, self._frames_seen - self.window + 1, self.stride)
+        for start in starts:
+            offset = start - buffer_start
+            self._pending_starts.append(start)
+            self._pending_windows.append(buffer[offset:offset + self.window])
+        if len(starts):
+            self._next_window_start = starts[-1] + self.stride
+        self._tail = buffer[-self.window:]
+
+        emitted: List[ServeSegment] = []
+        while len(self._pending_windows) >= self.batch_windows:
+            emitted.extend(self._score_pending(self.batch_windows))
+        return emitted
+
+    def flush(self) -> List[ServeSegment]:
+        """Score the remaining windows and close the open segment (call at end of stream)."""
+        # ストライドの刻みからはみ出した末尾のフレームも、終端に揃えた窓で1度だけ評価する
+        last_start = self._frames_seen - self.window
+        if last_start >= 0 and last_start > self._next_window_start - self.stride:
+            self._pending_starts.append(last_start)
+            self._pending_windows.append(self._tail[-self.window:])
+            self._next_window_start = last_start + self.stride
+        emitted = self._score_pending(len(self._pending_windows)) if self._pending_windows else []
+        if self._best is not None:
+            emitted.append(self._close())
+        return emitted
+
+    def _score_pending(self, count: int) -> List[ServeSegment]:
+        starts = self._pending_starts[:count]
+        windows = np.stack(self._pending_windows[:count])
+        del self._pending_starts[:count], self._pending_windows[:count]
+
+        result = pose_window_scores(windows)
+        scores = result["score"]
+        if self.scorer is not None:
+            scores = scores * np.asarray(self.scorer(windows), dtype=np.float64)
+
+        emitted: List[ServeSegment] = []
+        for i, start in enumerate(starts):
+            score = float(scores[i])
+            if score >= self.on_threshold:
+                if self._best is None or score > self._best[0]:
+                    self._best = (score, start, {name: int(result[name][i]) for name in PHASE_NAMES})
+            elif self._best is not None and score < self.off_threshold and start > self._best[1] + self._best[2]["impact"]:
+                # インパクトを含む窓の低スコア（インパクトが窓の端に来た等）では閉じず、インパクトを過ぎてから閉じる
+                emitted.append(self._close())
+        return emitted
+
+    def _close(self) -> ServeSegment:
+        score, start, phases = self._best
+        self._best = None
+        first, last = start + phases["start"], start + phases["finish"] + 1
+        return ServeSegment(
+            start_frame=first,
+            end_frame=last,
+            trophy_frame=start + phases["trophy"],
+            impact_frame=start + phases["impact"],
+            confidence=score,
+            start_time=first / self.fps if self.fps else None,
+            end_time=last / self.fps if self.fps else None,
+        )
+
+
+def most_active_track_id(df: pd.DataFrame) -> int:
+    """Track with the largest total keypoint movement, as ``find_most_active_tracks.py`` picks it."""
+    if str(_YOLO_DIR) not in sys.path:
+        sys.path.insert(0, str(_YOLO_DIR))
+    from find_most_active_tracks import compute_track_stats
+
+    if "frame_name" not in df.columns:
+        df = df.assign(frame_name=df.index.astype(str))
+    stats = compute_track_stats(df)
+    if not stats:
+        raise ValueError("No tracks found in keypoint data")
+    return max(stats, key=lambda s: s.total_movement).track_id
+
+
+def select_track(df: pd.DataFrame, track_id: Optional[int] = None) -> pd.DataFrame:
+    """Rows of one player's track (default: the most active one); data without ``track_id`` is returned as is.
+
+    Raises ``ValueError`` when the track is missing or still has several rows
+    for one frame, since the windows would then mix poses.
+    """
+    if "track_id" in df.columns:
+        if track_id is None:
+            track_id = most_active_track_id(df)
+        df = df[df["track_id"] == track_id]
+        if df.empty:
+            raise ValueError(f"track_id {track_id} not found in keypoint data")
+    frame_ids = df["frame_index"] if "frame_index" in df.columns else df.index.to_series()
+    if frame_ids.duplicated().any():
+        raise ValueError("Keypoint data has several rows for the same frame_index; pass a single track")
+    return df
+
+
+def detect_serve_segments(
+    source: Path | str | pd.DataFrame | PoseSequence,
+    track_id: Optional[int] = None,
+    **kwargs,
+) -> List[ServeSegment]:
+    """Run :class:`StreamingServeDetector` over a whole keypoint file in one block.
+
+    Whole-session files contain every tracked person, so only ``track_id``
+    (default: the most active track) is scored; see :func:`select_track`.
+    When the data has an integer ``frame_index`` (rows for frames without a
+    detected player are often missing), segment frames and times refer to it
+    rather than to row positions.
+    """
+    if isinstance(source, PoseSequence):
+        df = source.df
+    elif isinstance(source, pd.DataFrame):
+        df = source
+    else:
+        df = load_pose_sequence(source)
+    seq = PoseSequence(select_track(df, track_id))
+    detector = StreamingServeDetector(**kwargs)
+    segments = detector.push_many(seq.coords) + detector.flush()
+    if not len(seq) or not pd.api.types.is_integer_dtype(seq.df.index):
+        return segments
+    frame_ids = seq.df.index.to_numpy()
+
+    def frame_at(position: int) -> int:
+        # end_frame は排他的なので、最終行の次は最終フレーム + 1
+        return int(frame_ids[position]) if position < len(frame_ids) else int(frame_ids[-1]) + 1
+
+    remapped = []
+    for segment in segments:
+        start, end = frame_at(segment.start_frame), frame_at(segment.end_frame)
+        remapped.append(
+            replace(
+                segment,
+                start_frame=start,
+                end_frame=end,
+                trophy_frame=frame_at(segment.trophy_frame),
+                impact_frame=frame_at(segment.impact_frame),
+                start_time=start / detector.fps if detector.fps else None,
+                end_time=end / detector.fps if detector.fps else None,
+            )
+        )
+    return remapped
+
+
+def write_clip_list(segments: Sequence[ServeSegment], video_name: str, path: Path | str, tags: str = "serve") -> Path:
+    """Write ``<video> <start sec> <end sec> <tags>`` lines, the list format read by ``cut_clips_*.sh``."""
+    path = Path(path)
+    lines = [
+        f"{video_name} {segment.start_time:.2f} {segment.end_time:.2f} {tags}"
+        for segment in segments
+        if segment.start_time is not None and segment.end_time is not None
+    ]
+    path.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Detect serves in a long keypoint sequence")
+    parser.add_argument("--keypoints", type=Path, required=True, help="Whole-session keypoints_with_tracks.csv (or .npz)")
+    parser.add_argument("--track-id", type=int, help="Player track to scan (default: the most active track)")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--stride", type=int, default=DEFAULT_STRIDE)
+    parser.add_argument("--on-threshold", type=float, default=ON_THRESHOLD)
+    parser.add_argument("--off-threshold", type=float, default=OFF_THRESHOLD)
+    parser.add_argument("--video", help="Video file name written to the clip list (default: keypoints parent directory name)")
+    parser.add_argument("--output", type=Path, help="Write a cut_clips style clip list instead of printing segments")
+    args = parser.parse_args()
+
+    segments = detect_serve_segments(
+        args.keypoints,
+        args.track_id,
+        fps=args.fps,
+        stride=args.stride,
+        on_threshold=args.on_threshold,
+        off_threshold=args.off_threshold,
+    )
+    if args.output:
+        write_clip_list(segments, args.video or f"{args.keypoints.resolve().parent.name}.mp4", args.output)
+        print(f"🎾 {len(segments)} serves -> {args.output}")
+    else:
+        for segment in segments:
+            print(segment.to_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Exported serve classifier graphs (TorchScript / ONNX) must match eager PyTorch.
+
+The graphs are traced from a single 1x48 example, so the check covers other
+frame counts and batch sizes above 1 as well (see ``PARITY_FRAME_COUNTS``).
+"""
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+# pose_analysis と 30_Classification_LSTM のモジュールをインポートできるようにする（python -m pytest でなくても動くように）
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, _PROJECT_ROOT)
+sys.path.insert(0, os.path.join(_PROJECT_ROOT, "30_Classification_LSTM"))
+from classifier_runtime import EagerRuntime, OnnxRuntime, TorchScriptRuntime  # noqa: E402
+from export_classifier import DEFAULT_ATOL, PARITY_FRAME_COUNTS, check_parity, export_onnx, export_torchscript, parity_inputs  # noqa: E402
+from lstm_model import AugmentedLSTM  # noqa: E402
+from pose_analysis.sequence_features import N_FEATURES  # noqa: E402
+
+
+@pytest.fixture
+def small_model():
+    torch.manual_seed(0)
+    return AugmentedLSTM(N_FEATURES, hidden_size=16, num_layers=2, num_classes=4, dropout=0.5).eval()
+
+
+def test_parity_inputs_cover_frame_counts_and_batches(tmp_path):
+    inputs = parity_inputs(str(tmp_path / "no_clips"), n_clips=3)
+    assert [batch.shape[1] for batch in inputs] == list(PARITY_FRAME_COUNTS)
+    assert all(batch.shape[0] == 3 and batch.shape[2] == N_FEATURES for batch in inputs)
+
+
+@pytest.mark.parametrize("fmt", ["torchscript", "onnx"])
+def test_exported_runtime_matches_eager(tmp_path, small_model, fmt):
+    eager = EagerRuntime(small_model)
+    if fmt == "torchscript":
+        runtime = TorchScriptRuntime(export_torchscript(small_model, str(tmp_path / "model.torchscript.pt")), "cpu")
+    else:
+        runtime = OnnxRuntime(export_onnx(small_model, str(tmp_path / "model.onnx")))
+
+    # batch_size=2 で 3 クリップを流し、バッチ数 2 と 1 の両方を比較する
+    parity = check_parity(eager, runtime, parity_inputs(str(tmp_path / "no_clips"), n_clips=3), batch_size=2)
+
+    assert parity["frame_counts"] == sorted(PARITY_FRAME_COUNTS)
+    assert parity["max_logit_diff"] <= DEFAULT_ATOL
+    assert parity["max_embedding_diff"] <= DEFAULT_ATOL
+    assert parity["top1_agreement"] == 1.0